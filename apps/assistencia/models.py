@@ -6,6 +6,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from apps.core.models import BaseModel
+from apps.core.sequencias import proximo_numero
 from apps.erp.models import Produto, Cliente
 
 User = get_user_model()
@@ -131,10 +132,7 @@ class OrdemServico(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.numero:
-            # Generate automatic number
-            ultimo = OrdemServico.objects.order_by('-id').first()
-            proximo_id = (ultimo.id + 1) if ultimo else 1
-            self.numero = f'OS{proximo_id:06d}'
+            self.numero = proximo_numero(OrdemServico, 'OS')
         
         # Calculate total
         self.valor_total = self.valor_servico + self.valor_pecas - self.valor_desconto
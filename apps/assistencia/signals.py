@@ -6,7 +6,8 @@ from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from .models import PecaOS, OrdemServico, OrcamentoOS, HistoricoOS
-from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.services import registrar_movimentacao
+from apps.relatorios.snapshots import invalidar_dre
 
 
 @receiver(post_save, sender=PecaOS)
@@ -29,15 +30,15 @@ def criar_movimentacao_peca_aplicada(sender, instance, created, **kwargs):
     """
     if instance.aplicada and created:
         # Cria movimentação de saída no estoque
-        MovimentacaoEstoque.objects.create(
+        registrar_movimentacao(
             produto=instance.produto,
             tipo='saida',
             quantidade=instance.quantidade,
+            usuario=instance.os.tecnico,
             valor_unitario=instance.preco_unitario,
             documento='os',
             documento_numero=instance.os.numero,
-            motivo=f'Peça aplicada na OS {instance.os.numero}',
-            usuario=instance.os.tecnico
+            motivo=f'Peça aplicada na OS {instance.os.numero}'
         )
 
 
@@ -91,3 +92,12 @@ def registrar_mudanca_status(sender, instance, created, **kwargs):
             acao='OS Aberta',
             descricao=f'Ordem de serviço aberta para {instance.equipamento}'
         )
+
+
+@receiver(post_save, sender=OrdemServico)
+@receiver(post_delete, sender=OrdemServico)
+def invalidar_dre_os(sender, instance, **kwargs):
+    """
+    Invalida o snapshot do DRE do mês de abertura da OS
+    """
+    invalidar_dre(instance.data_abertura)
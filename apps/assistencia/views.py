@@ -7,7 +7,10 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.mixins import StreamingExportMixin
+from django.db import transaction
 from django.utils import timezone
+from apps.estoque.services import EstoqueInsuficiente
 from .models import (
     OrdemServico, PecaOS, OrcamentoOS, HistoricoOS, RecebimentoOS,
     ServicoTemplate, ChecklistItem, TermoGarantia, OSAnexo, CategoriaServico
@@ -20,7 +23,7 @@ from .serializers import (
 )
 
 
-class OrdemServicoViewSet(viewsets.ModelViewSet):
+class OrdemServicoViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for OrdemServico
     """
@@ -146,7 +149,12 @@ class OrdemServicoViewSet(viewsets.ModelViewSet):
         
         serializer = PecaOSSerializer(data=peca_data)
         serializer.is_valid(raise_exception=True)
-        peca = serializer.save()
+        # Peça já aplicada baixa o estoque (signal) na mesma transação
+        try:
+            with transaction.atomic():
+                peca = serializer.save()
+        except EstoqueInsuficiente as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(PecaOSSerializer(peca).data, status=status.HTTP_201_CREATED)
     
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compras', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedidocompra',
+            name='status',
+            field=models.CharField(choices=[('rascunho', 'Rascunho'), ('pendente', 'Pendente'), ('aprovado', 'Aprovado'), ('em_transito', 'Em Trânsito'), ('recebido', 'Recebido'), ('cancelado', 'Cancelado')], default='pendente', max_length=20, verbose_name='Status'),
+        ),
+    ]
@@ -6,6 +6,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from apps.core.models import BaseModel
+from apps.core.sequencias import proximo_numero
 from apps.erp.models import Produto, Fornecedor
 
 User = get_user_model()
@@ -43,10 +44,7 @@ class Cotacao(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.numero:
-            # Generate automatic number
-            ultimo = Cotacao.objects.order_by('-id').first()
-            proximo_id = (ultimo.id + 1) if ultimo else 1
-            self.numero = f'COT{proximo_id:06d}'
+            self.numero = proximo_numero(Cotacao, 'COT')
         super().save(*args, **kwargs)
     
     @property
@@ -130,6 +128,7 @@ class PedidoCompra(BaseModel):
     Pedido de Compra
     """
     STATUS_CHOICES = [
+        ('rascunho', 'Rascunho'),
         ('pendente', 'Pendente'),
         ('aprovado', 'Aprovado'),
         ('em_transito', 'Em Trânsito'),
@@ -217,10 +216,7 @@ class PedidoCompra(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.numero:
-            # Generate automatic number
-            ultimo = PedidoCompra.objects.order_by('-id').first()
-            proximo_id = (ultimo.id + 1) if ultimo else 1
-            self.numero = f'PC{proximo_id:06d}'
+            self.numero = proximo_numero(PedidoCompra, 'PC')
         
         # Calculate total
         self.valor_total = self.valor_produtos + self.valor_frete - self.valor_desconto
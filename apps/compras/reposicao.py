@@ -0,0 +1,212 @@
+"""
+Sugestão de reposição de estoque
+
+Para todos os produtos de uma vez (poucas consultas agrupadas, não uma
+por produto):
+
+- consumo: saídas dos últimos JANELA_CURTA e JANELA_LONGA dias em uma
+  consulta agrupada por produto; a velocidade diária é a maior das duas
+  (reage a picos sem esquecer o histórico)
+- ponto de pedido: consumo durante o prazo de entrega do fornecedor mais
+  DIAS_SEGURANCA, nunca abaixo do estoque mínimo
+- posição: estoque atual + quantidades em pedidos de compra abertos
+  (inclusive rascunhos), para não sugerir de novo o que já foi pedido
+- quantidade sugerida: o que leva a posição até o estoque máximo (ou,
+  sem máximo, ao ponto de pedido + DIAS_COBERTURA de consumo)
+
+`gerar_pedidos_reposicao` agrupa as sugestões pelo fornecedor
+(preferencial do produto ou o da última compra) em PedidoCompra com
+status 'rascunho', para o comprador revisar.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_UP, Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.core.sequencias import proximos_numeros
+from apps.erp.models import Fornecedor, Produto
+from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.services import TAMANHO_LOTE
+from .models import ItemPedidoCompra, PedidoCompra
+
+JANELA_CURTA = 30
+JANELA_LONGA = 90
+DIAS_SEGURANCA = 7
+DIAS_COBERTURA = 30
+
+# Pedidos cujas quantidades ainda vão entrar no estoque
+STATUS_ABERTOS = ['rascunho', 'pendente', 'aprovado', 'em_transito']
+
+CASAS_QUANTIDADE = Decimal('0.001')
+ZERO = Decimal('0')
+
+
+def _velocidades(agora):
+    """{produto_id: consumo diário} pelas saídas das janelas, em uma consulta"""
+    curta = agora - timedelta(days=JANELA_CURTA)
+    longa = agora - timedelta(days=JANELA_LONGA)
+    consumo = MovimentacaoEstoque.objects.filter(
+        tipo='saida', data_movimentacao__gte=longa
+    ).values('produto_id').annotate(
+        curta=Sum('quantidade', filter=Q(data_movimentacao__gte=curta)),
+        longa=Sum('quantidade'),
+    ).order_by()
+    return {
+        linha['produto_id']: max(
+            (linha['curta'] or ZERO) / JANELA_CURTA,
+            (linha['longa'] or ZERO) / JANELA_LONGA
+        )
+        for linha in consumo
+    }
+
+
+def _em_pedido():
+    """{produto_id: quantidade ainda a receber} dos pedidos abertos"""
+    return dict(
+        ItemPedidoCompra.objects.filter(pedido__status__in=STATUS_ABERTOS).values('produto_id').annotate(
+            pendente=Sum('quantidade_pedida') - Sum('quantidade_recebida')
+        ).order_by().values_list('produto_id', 'pendente')
+    )
+
+
+def _ultimas_compras(produto_ids):
+    """{produto_id: (fornecedor_id, preco_unitario)} da compra mais recente"""
+    ultimas = {}
+    for produto_id, fornecedor_id, preco in ItemPedidoCompra.objects.filter(
+        produto_id__in=produto_ids
+    ).exclude(
+        pedido__status='cancelado'
+    ).order_by('produto_id', '-pedido__data_pedido', '-pk').values_list(
+        'produto_id', 'pedido__fornecedor_id', 'preco_unitario'
+    ):
+        ultimas.setdefault(produto_id, (fornecedor_id, preco))
+    return ultimas
+
+
+def sugestoes_reposicao():
+    """
+    Produtos a repor, como dicts ordenados por fornecedor e produto
+
+    Cada sugestão tem produto, fornecedor (None se não houver nenhum
+    conhecido), velocidade diária, ponto de pedido, posição, quantidade
+    e preço unitário estimado.
+    """
+    velocidades = _velocidades(timezone.now())
+    em_pedido = _em_pedido()
+    prazos = dict(Fornecedor.objects.values_list('pk', 'prazo_entrega'))
+
+    candidatos = []
+    produtos = Produto.objects.filter(active=True, tipo='produto').annotate(
+        custo_atual=Coalesce('custo__custo_unitario', 'preco_custo')
+    ).order_by('pk').values_list(
+        'pk', 'nome', 'estoque_atual', 'estoque_minimo', 'estoque_maximo',
+        'fornecedor_preferencial_id', 'custo_atual'
+    )
+    for pk, nome, atual, minimo, maximo, preferencial, custo in produtos.iterator(chunk_size=TAMANHO_LOTE):
+        velocidade = velocidades.get(pk, ZERO)
+        posicao = atual + em_pedido.get(pk, ZERO)
+        candidatos.append((pk, nome, velocidade, posicao, minimo, maximo, preferencial, custo))
+
+    # Última compra só de quem pode precisar de reposição e não tem preferencial
+    ultimas = _ultimas_compras([
+        pk for pk, _, velocidade, _, minimo, _, preferencial, _ in candidatos
+        if preferencial is None and (velocidade or minimo)
+    ])
+    prazo_padrao = Fornecedor._meta.get_field('prazo_entrega').default
+
+    sugestoes = []
+    for pk, nome, velocidade, posicao, minimo, maximo, preferencial, custo in candidatos:
+        fornecedor, preco = preferencial, None
+        if fornecedor is None and pk in ultimas:
+            fornecedor, preco = ultimas[pk]
+        prazo = prazos.get(fornecedor, prazo_padrao)
+
+        ponto = max(minimo, velocidade * (prazo + DIAS_SEGURANCA))
+        if posicao > ponto or (not ponto and not velocidade):
+            continue
+
+        alvo = maximo if maximo > 0 else ponto + velocidade * DIAS_COBERTURA
+        quantidade = (alvo - posicao).quantize(CASAS_QUANTIDADE, rounding=ROUND_UP)
+        if quantidade <= 0:
+            continue
+
+        sugestoes.append({
+            'produto': pk,
+            'nome': nome,
+            'fornecedor': fornecedor,
+            'velocidade_diaria': velocidade.quantize(CASAS_QUANTIDADE),
+            'ponto_pedido': ponto.quantize(CASAS_QUANTIDADE, rounding=ROUND_UP),
+            'posicao': posicao,
+            'quantidade': quantidade,
+            'preco_unitario': preco if preco is not None else custo,
+        })
+
+    sugestoes.sort(key=lambda s: (s['fornecedor'] is None, s['fornecedor'] or 0, s['produto']))
+    return sugestoes
+
+
+def comprador_padrao():
+    """Usuário dos pedidos gerados pela task (COMPRAS_REPOSICAO_COMPRADOR ou o primeiro superusuário)"""
+    User = get_user_model()
+    username = getattr(settings, 'COMPRAS_REPOSICAO_COMPRADOR', '')
+    usuarios = User.objects.filter(is_active=True)
+    if username:
+        return usuarios.filter(username=username).first()
+    return usuarios.filter(is_superuser=True).order_by('pk').first()
+
+
+def gerar_pedidos_reposicao(comprador=None):
+    """
+    Cria um PedidoCompra rascunho por fornecedor com as sugestões
+
+    Produtos sem fornecedor conhecido ficam de fora. Retorna os pedidos
+    criados.
+    """
+    comprador = comprador or comprador_padrao()
+    if comprador is None:
+        return []
+
+    por_fornecedor = defaultdict(list)
+    for sugestao in sugestoes_reposicao():
+        if sugestao['fornecedor'] is not None:
+            por_fornecedor[sugestao['fornecedor']].append(sugestao)
+    if not por_fornecedor:
+        return []
+
+    prazos = dict(Fornecedor.objects.filter(pk__in=por_fornecedor).values_list('pk', 'prazo_entrega'))
+    hoje = timezone.localdate()
+    pedidos = []
+    with transaction.atomic():
+        numeros = proximos_numeros(PedidoCompra, 'PC', len(por_fornecedor))
+        for numero, (fornecedor_id, sugestoes) in zip(numeros, por_fornecedor.items()):
+            itens = [
+                ItemPedidoCompra(
+                    produto_id=sugestao['produto'],
+                    quantidade_pedida=sugestao['quantidade'],
+                    preco_unitario=sugestao['preco_unitario'],
+                    # bulk_create não passa pelo save()
+                    preco_total=(sugestao['quantidade'] * sugestao['preco_unitario']).quantize(Decimal('0.01'))
+                )
+                for sugestao in sugestoes
+            ]
+            pedido = PedidoCompra.objects.create(
+                numero=numero,
+                fornecedor_id=fornecedor_id,
+                comprador=comprador,
+                status='rascunho',
+                data_entrega_prevista=hoje + timedelta(days=prazos[fornecedor_id]),
+                valor_produtos=sum(item.preco_total for item in itens),
+                observacoes=f'Reposição sugerida em {hoje:%d/%m/%Y}'
+            )
+            for item in itens:
+                item.pedido = pedido
+            ItemPedidoCompra.objects.bulk_create(itens, batch_size=TAMANHO_LOTE)
+            pedidos.append(pedido)
+    return pedidos
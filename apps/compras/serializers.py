@@ -144,6 +144,22 @@ class ItemRecebimentoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class ItemRecebimentoLoteSerializer(serializers.Serializer):
+    """Item de um recebimento em lote (item do pedido por id)"""
+    
+    item_pedido = serializers.IntegerField()
+    quantidade = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0.001)
+    lote = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    data_validade = serializers.DateField(required=False, allow_null=True)
+    conferido = serializers.BooleanField(required=False, default=False)
+
+
+class ReceberItensSerializer(serializers.Serializer):
+    """Serializer for bulk receiving"""
+    
+    itens = ItemRecebimentoLoteSerializer(many=True, allow_empty=False, max_length=5000)
+
+
 class RecebimentoMercadoriaSerializer(serializers.ModelSerializer):
     """Serializer for RecebimentoMercadoria"""
     
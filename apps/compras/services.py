@@ -0,0 +1,90 @@
+"""
+Recebimento de mercadorias em lote
+
+`receber_itens` faz, para uma NF inteira, o que o signal
+`atualizar_quantidade_recebida` faz item a item: grava os
+ItemRecebimento, soma a quantidade recebida nos itens do pedido, dá
+entrada no estoque e marca o pedido como recebido, com um número de
+consultas que não depende da quantidade de itens.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.services import TAMANHO_LOTE, lancar_movimentacoes
+from .models import ItemPedidoCompra, ItemRecebimento
+
+
+def receber_itens(recebimento, itens):
+    """
+    Recebe vários itens de um pedido de uma só vez
+
+    `itens`: dicts com item_pedido (id), quantidade e, opcionalmente, lote,
+    data_validade e conferido. Levanta ItemPedidoCompra.DoesNotExist se
+    algum item não pertencer ao pedido do recebimento.
+    """
+    pedido = recebimento.pedido_compra
+    ids = {item['item_pedido'] for item in itens}
+
+    with transaction.atomic():
+        itens_pedido = {
+            item.pk: item
+            for item in ItemPedidoCompra.objects.select_for_update().filter(
+                pedido=pedido, pk__in=ids
+            ).order_by('pk')
+        }
+        faltando = ids - set(itens_pedido)
+        if faltando:
+            raise ItemPedidoCompra.DoesNotExist(
+                f'Itens não pertencem ao pedido {pedido.numero}: {sorted(faltando)}'
+            )
+
+        recebidos = []
+        movimentacoes = []
+        quantidades = defaultdict(int)
+        for dados in itens:
+            item_pedido = itens_pedido[dados['item_pedido']]
+            recebidos.append(ItemRecebimento(
+                recebimento=recebimento,
+                item_pedido=item_pedido,
+                quantidade=dados['quantidade'],
+                lote=dados.get('lote', ''),
+                data_validade=dados.get('data_validade'),
+                conferido=dados.get('conferido', False)
+            ))
+            movimentacoes.append(MovimentacaoEstoque(
+                produto_id=item_pedido.produto_id,
+                tipo='entrada',
+                quantidade=dados['quantidade'],
+                valor_unitario=item_pedido.preco_unitario,
+                lote=dados.get('lote', ''),
+                data_validade=dados.get('data_validade'),
+                documento='nota_fiscal',
+                documento_numero=recebimento.nota_fiscal,
+                motivo=f'Recebimento do pedido {pedido.numero}',
+                usuario=recebimento.recebedor
+            ))
+            quantidades[item_pedido.pk] += dados['quantidade']
+
+        # bulk_create não dispara o signal do recebimento item a item
+        ItemRecebimento.objects.bulk_create(recebidos, batch_size=TAMANHO_LOTE)
+
+        for pk, quantidade in quantidades.items():
+            itens_pedido[pk].quantidade_recebida += quantidade
+        ItemPedidoCompra.objects.bulk_update(
+            [itens_pedido[pk] for pk in quantidades],
+            ['quantidade_recebida'],
+            batch_size=TAMANHO_LOTE
+        )
+
+        lancar_movimentacoes(movimentacoes)
+
+        pendentes = pedido.itens.filter(quantidade_recebida__lt=F('quantidade_pedida')).exists()
+        if not pendentes and pedido.status != 'recebido':
+            pedido.status = 'recebido'
+            pedido.save(update_fields=['status'])
+
+    return recebidos
@@ -5,7 +5,7 @@ Signals for automatic purchase updates
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import ItemRecebimento, ItemPedidoCompra
-from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.services import registrar_movimentacao
 
 
 @receiver(post_save, sender=ItemRecebimento)
@@ -22,17 +22,17 @@ def atualizar_quantidade_recebida(sender, instance, created, **kwargs):
     item_pedido.save(update_fields=['quantidade_recebida'])
     
     # Cria movimentação de entrada no estoque
-    MovimentacaoEstoque.objects.create(
+    registrar_movimentacao(
         produto=item_pedido.produto,
         tipo='entrada',
         quantidade=instance.quantidade,
+        usuario=instance.recebimento.recebedor,
         valor_unitario=item_pedido.preco_unitario,
         lote=instance.lote,
         data_validade=instance.data_validade,
         documento='nota_fiscal',
         documento_numero=instance.recebimento.nota_fiscal,
-        motivo=f'Recebimento do pedido {item_pedido.pedido.numero}',
-        usuario=instance.recebimento.recebedor
+        motivo=f'Recebimento do pedido {item_pedido.pedido.numero}'
     )
     
     # Verifica se o pedido foi totalmente recebido
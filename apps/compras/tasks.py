@@ -0,0 +1,18 @@
+"""
+Celery tasks for Compras app
+"""
+
+from celery import shared_task
+
+from apps.core.utils import get_tenant_schemas, tenant_context
+from .reposicao import gerar_pedidos_reposicao
+
+
+@shared_task(ignore_result=True)
+def gerar_pedidos_reposicao_tenants():
+    """
+    Gera os pedidos rascunho de reposição de todos os tenants
+    """
+    for schema_name in get_tenant_schemas():
+        with tenant_context(schema_name):
+            gerar_pedidos_reposicao()
@@ -2,15 +2,21 @@
 Tests for Compras app
 """
 
+from decimal import Decimal
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
+from rest_framework.test import APIClient
 from apps.erp.models import Produto, Fornecedor
+from apps.estoque.models import MovimentacaoEstoque
 from .models import (
     Cotacao, ItemCotacao, PedidoCompra, ItemPedidoCompra,
     RecebimentoMercadoria, ItemRecebimento
 )
+from .reposicao import gerar_pedidos_reposicao, sugestoes_reposicao
+from .services import receber_itens
 
 User = get_user_model()
 
@@ -140,3 +146,188 @@ class PedidoCompraTest(TestCase):
         # Check if quantity was updated
         self.assertEqual(item_pedido.quantidade_recebida, 20)
         self.assertEqual(self.produto.estoque_atual, 20)
+
+
+class RecebimentoEmLoteTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        fornecedor = Fornecedor.objects.create(razao_social='Fornecedor Teste', cnpj='12345678000190')
+        self.pedido = PedidoCompra.objects.create(
+            fornecedor=fornecedor,
+            data_entrega_prevista=timezone.now().date() + timedelta(days=15),
+            status='aprovado',
+            comprador=self.user
+        )
+        self.itens = []
+        for i in range(3):
+            produto = Produto.objects.create(
+                nome=f'Produto {i}',
+                codigo_interno=f'NF{i:03d}',
+                preco_custo=10.00,
+                estoque_atual=0
+            )
+            self.itens.append(ItemPedidoCompra.objects.create(
+                pedido=self.pedido,
+                produto=produto,
+                quantidade_pedida=10,
+                preco_unitario=9.50
+            ))
+        self.recebimento = RecebimentoMercadoria.objects.create(
+            pedido_compra=self.pedido,
+            nota_fiscal='NF999',
+            recebedor=self.user
+        )
+
+    def test_receber_itens(self):
+        """Recebimento total da NF em lote"""
+        receber_itens(self.recebimento, [
+            {'item_pedido': item.pk, 'quantidade': Decimal('10'), 'lote': 'L1'}
+            for item in self.itens
+        ])
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.status, 'recebido')
+        self.assertEqual(self.recebimento.itens.count(), 3)
+        self.assertEqual(
+            list(Produto.objects.order_by('codigo_interno').values_list('estoque_atual', flat=True)),
+            [10, 10, 10]
+        )
+        self.assertEqual(
+            MovimentacaoEstoque.objects.filter(documento_numero='NF999', lote='L1').count(), 3
+        )
+
+    def test_recebimento_parcial_via_api(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post(f'/api/compras/recebimentos/{self.recebimento.pk}/receber_lote/', {
+            'itens': [
+                {'item_pedido': self.itens[0].pk, 'quantidade': '4'},
+                {'item_pedido': self.itens[0].pk, 'quantidade': '2'},
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['pedido_status'], 'aprovado')
+        self.itens[0].refresh_from_db()
+        self.assertEqual(self.itens[0].quantidade_recebida, 6)
+
+    def test_item_de_outro_pedido(self):
+        with self.assertRaises(ItemPedidoCompra.DoesNotExist):
+            receber_itens(self.recebimento, [{'item_pedido': 999999, 'quantidade': Decimal('1')}])
+
+
+class ReposicaoTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.fornecedor_a = Fornecedor.objects.create(razao_social='Fornecedor A', cnpj='11111111000111', prazo_entrega=5)
+        self.fornecedor_b = Fornecedor.objects.create(razao_social='Fornecedor B', cnpj='22222222000122', prazo_entrega=10)
+
+        # 90 saídas há 10 dias: 3/dia na janela curta
+        self.giro = self._produto('REP001', 100, preco_custo=Decimal('4.00'), fornecedor_preferencial=self.fornecedor_a)
+        self._saida(self.giro, 90, dias=10)
+
+        # Abaixo do mínimo, sem preferencial: fornecedor da última compra
+        self.minimo = self._produto('REP002', 2, estoque_minimo=5, estoque_maximo=20)
+        antigo = PedidoCompra.objects.create(
+            fornecedor=self.fornecedor_b, comprador=self.user, status='recebido',
+            data_entrega_prevista=timezone.localdate()
+        )
+        ItemPedidoCompra.objects.create(
+            pedido=antigo, produto=self.minimo, quantidade_pedida=10,
+            quantidade_recebida=10, preco_unitario=Decimal('7.50')
+        )
+
+        # Já pedido: posição cobre o mínimo
+        self.pedido = self._produto('REP003', 0, estoque_minimo=10, fornecedor_preferencial=self.fornecedor_a)
+        aberto = PedidoCompra.objects.create(
+            fornecedor=self.fornecedor_a, comprador=self.user, status='pendente',
+            data_entrega_prevista=timezone.localdate()
+        )
+        ItemPedidoCompra.objects.create(
+            pedido=aberto, produto=self.pedido, quantidade_pedida=10, preco_unitario=Decimal('1.00')
+        )
+
+        # 90 saídas há 60 dias: só a janela longa, 1/dia
+        self.lento = self._produto('REP004', 90, fornecedor_preferencial=self.fornecedor_b)
+        self._saida(self.lento, 90, dias=60)
+
+        # Sem consumo e sem mínimo
+        self._produto('REP005', 0)
+
+    def _produto(self, codigo, estoque, **campos):
+        campos.setdefault('preco_custo', Decimal('2.00'))
+        return Produto.objects.create(nome=codigo, codigo_interno=codigo, estoque_atual=estoque, **campos)
+
+    def _saida(self, produto, quantidade, dias):
+        movimentacao = MovimentacaoEstoque.objects.create(
+            produto=produto, tipo='saida', quantidade=quantidade, usuario=self.user
+        )
+        MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(
+            data_movimentacao=timezone.now() - timedelta(days=dias)
+        )
+
+    def test_sugestoes(self):
+        sugestoes = {sugestao['produto']: sugestao for sugestao in sugestoes_reposicao()}
+
+        self.assertEqual(set(sugestoes), {self.giro.pk, self.minimo.pk, self.lento.pk})
+
+        giro = sugestoes[self.giro.pk]
+        self.assertEqual(giro['velocidade_diaria'], 3)
+        self.assertEqual(giro['ponto_pedido'], 36)  # 3 * (5 + 7)
+        self.assertEqual(giro['quantidade'], 116)  # 36 + 3 * 30 - 10
+        self.assertEqual(giro['fornecedor'], self.fornecedor_a.pk)
+        self.assertEqual(giro['preco_unitario'], Decimal('4.00'))
+
+        minimo = sugestoes[self.minimo.pk]
+        self.assertEqual(minimo['quantidade'], 18)  # até o estoque máximo
+        self.assertEqual(minimo['fornecedor'], self.fornecedor_b.pk)
+        self.assertEqual(minimo['preco_unitario'], Decimal('7.50'))
+
+        lento = sugestoes[self.lento.pk]
+        self.assertEqual(lento['velocidade_diaria'], 1)
+        self.assertEqual(lento['quantidade'], 47)  # 1 * (10 + 7) + 1 * 30
+
+    def test_consultas_fixas(self):
+        for i in range(20):
+            produto = self._produto(f'EXTRA{i:03d}', 1, estoque_minimo=1)
+            self._saida(produto, 1, dias=1)
+
+        with self.assertNumQueries(5):
+            sugestoes = sugestoes_reposicao()
+        self.assertEqual(len(sugestoes), 23)
+
+    def test_gerar_pedidos(self):
+        pedidos = gerar_pedidos_reposicao(comprador=self.user)
+
+        self.assertEqual(len(pedidos), 2)
+        por_fornecedor = {pedido.fornecedor_id: pedido for pedido in pedidos}
+        pedido_a = por_fornecedor[self.fornecedor_a.pk]
+        pedido_b = por_fornecedor[self.fornecedor_b.pk]
+
+        self.assertEqual(pedido_a.status, 'rascunho')
+        self.assertEqual(pedido_a.data_entrega_prevista, timezone.localdate() + timedelta(days=5))
+        self.assertEqual(list(pedido_a.itens.values_list('produto_id', 'quantidade_pedida')), [(self.giro.pk, 116)])
+        self.assertEqual(pedido_a.valor_total, Decimal('464.00'))
+        self.assertEqual(
+            sorted(pedido_b.itens.values_list('produto_id', flat=True)), [self.minimo.pk, self.lento.pk]
+        )
+
+        # O que já está em rascunho não é sugerido de novo
+        self.assertEqual(gerar_pedidos_reposicao(comprador=self.user), [])
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.get('/api/compras/pedidos/reposicao/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+        response = client.post('/api/compras/pedidos/reposicao/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({pedido['status'] for pedido in response.data}, {'rascunho'})
+
+        pedido = PedidoCompra.objects.get(numero=response.data[0]['numero'])
+        response = client.post(f'/api/compras/pedidos/{pedido.pk}/aprovar/')
+        self.assertEqual(response.status_code, 200)
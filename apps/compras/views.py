@@ -16,8 +16,10 @@ from .serializers import (
     CotacaoSerializer, CotacaoListSerializer, ItemCotacaoSerializer,
     PedidoCompraSerializer, PedidoCompraListSerializer, ItemPedidoCompraSerializer,
     RecebimentoMercadoriaSerializer, RecebimentoMercadoriaListSerializer,
-    ItemRecebimentoSerializer
+    ItemRecebimentoSerializer, ReceberItensSerializer
 )
+from .reposicao import gerar_pedidos_reposicao, sugestoes_reposicao
+from .services import receber_itens
 
 
 class CotacaoViewSet(viewsets.ModelViewSet):
@@ -117,7 +119,7 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
         """Add item to purchase order"""
         pedido = self.get_object()
         
-        if pedido.status not in ['pendente', 'aprovado']:
+        if pedido.status not in ['rascunho', 'pendente', 'aprovado']:
             return Response({
                 'error': 'Pedido não pode ser modificado neste status'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -143,7 +145,7 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
         """Approve purchase order"""
         pedido = self.get_object()
         
-        if pedido.status != 'pendente':
+        if pedido.status not in ['rascunho', 'pendente']:
             return Response({
                 'error': 'Pedido não está pendente'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -156,6 +158,20 @@ class PedidoCompraViewSet(viewsets.ModelViewSet):
             'pedido': PedidoCompraSerializer(pedido).data
         })
     
+    @action(detail=False, methods=['get', 'post'])
+    def reposicao(self, request):
+        """
+        Replenishment suggestions (GET) or draft orders per supplier (POST)
+        """
+        if request.method == 'GET':
+            return Response(sugestoes_reposicao())
+        
+        pedidos = gerar_pedidos_reposicao(comprador=request.user)
+        return Response(
+            PedidoCompraListSerializer(pedidos, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+    
     @action(detail=True, methods=['post'])
     def cancelar(self, request, pk=None):
         """Cancel purchase order"""
@@ -208,3 +224,24 @@ class RecebimentoMercadoriaViewSet(viewsets.ModelViewSet):
         )
         
         return Response(ItemRecebimentoSerializer(item).data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def receber_lote(self, request, pk=None):
+        """
+        Receive all items of an invoice at once ({"itens": [...]})
+        """
+        recebimento = self.get_object()
+        
+        serializer = ReceberItensSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            recebidos = receber_itens(recebimento, serializer.validated_data['itens'])
+        except ItemPedidoCompra.DoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'message': f'{len(recebidos)} itens recebidos',
+            'total': len(recebidos),
+            'pedido_status': recebimento.pedido_compra.status
+        }, status=status.HTTP_201_CREATED)
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_auditlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenciaDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema_name', models.CharField(max_length=63, verbose_name='Schema')),
+                ('chave', models.CharField(max_length=100, verbose_name='Documento')),
+                ('ultimo', models.PositiveBigIntegerField(default=0, verbose_name='Último Número')),
+            ],
+            options={
+                'verbose_name': 'Sequência de Documento',
+                'verbose_name_plural': 'Sequências de Documentos',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sequenciadocumento',
+            constraint=models.UniqueConstraint(fields=('schema_name', 'chave'), name='core_sequencia_unica'),
+        ),
+    ]
@@ -0,0 +1,114 @@
+"""
+Reusable ViewSet mixins
+"""
+
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .routers import usar_banco_relatorios
+
+
+def blocos_de_texto(linhas, escrever, tamanho=2000):
+    """Agrupa as linhas em blocos de texto de até `tamanho` linhas"""
+    buffer = io.StringIO()
+    for contador, linha in enumerate(linhas, 1):
+        escrever(buffer, linha)
+        if contador % tamanho == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_em_blocos(linhas, campos=None, tamanho=2000):
+    """
+    Linhas em NDJSON, em blocos para StreamingHttpResponse
+
+    Aceita dicts (values()) ou tuplas (values_list(), com `campos`).
+    """
+    def escrever(buffer, linha):
+        registro = linha if campos is None else dict(zip(campos, linha))
+        buffer.write(json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False))
+        buffer.write('\n')
+    return blocos_de_texto(linhas, escrever, tamanho)
+
+
+class StreamingExportMixin:
+    """
+    Adds ``GET <list>/export/?formato=csv|ndjson`` to a ModelViewSet
+
+    The export applies the same filter backends as ``list`` (filterset,
+    search and ordering) and streams ``values_list`` rows fetched with
+    ``iterator()``, so no serializer is built per row and memory does not
+    grow with the number of records.
+
+    ``export_fields`` lists the exported columns (lookups such as
+    ``cliente__nome_razao_social`` are allowed); by default every concrete
+    field of the model is exported, with foreign keys as ``<campo>_id``.
+
+    The query param is ``formato`` because DRF reserves ``format`` for
+    renderer selection. Rows are read from the reporting database when
+    one is configured.
+    """
+    export_fields = None
+    export_chunk_size = 2000
+    export_formats = {
+        'csv': 'text/csv; charset=utf-8',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    def get_export_fields(self):
+        if self.export_fields:
+            return list(self.export_fields)
+        return [field.attname for field in self.get_queryset().model._meta.concrete_fields]
+
+    def get_export_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        # values_list faz os joins necessários; prefetch não se aplica
+        return queryset.select_related(None).prefetch_related(None)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the filtered list as CSV or NDJSON"""
+        formato = request.query_params.get('formato', 'csv').lower()
+        if formato not in self.export_formats:
+            return Response({
+                'error': f'Formato inválido. Use: {", ".join(self.export_formats)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        campos = self.get_export_fields()
+        with usar_banco_relatorios() as alias:
+            # O iterator só consulta quando a resposta é consumida: fixa o banco aqui
+            linhas = self.get_export_queryset().using(alias).values_list(*campos).iterator(
+                chunk_size=self.export_chunk_size
+            )
+        conteudo = self._csv(campos, linhas) if formato == 'csv' else self._ndjson(campos, linhas)
+
+        response = StreamingHttpResponse(conteudo, content_type=self.export_formats[formato])
+        nome = f'{self.get_queryset().model._meta.model_name}_{timezone.now():%Y%m%d_%H%M%S}.{formato}'
+        response['Content-Disposition'] = f'attachment; filename="{nome}"'
+        return response
+
+    def _csv(self, campos, linhas):
+        cabecalho = io.StringIO()
+        csv.writer(cabecalho).writerow(campos)
+        yield cabecalho.getvalue()
+
+        def escrever(buffer, linha):
+            csv.writer(buffer).writerow(
+                valor.isoformat() if hasattr(valor, 'isoformat') else valor
+                for valor in linha
+            )
+        yield from blocos_de_texto(linhas, escrever, self.export_chunk_size)
+
+    def _ndjson(self, campos, linhas):
+        return ndjson_em_blocos(linhas, campos, self.export_chunk_size)
@@ -128,3 +128,22 @@ class AuditLog(models.Model):
 
     def __str__(self):
         return f"{self.timestamp} - {self.user} - {self.action} - {self.model_name}"
+
+
+class SequenciaDocumento(models.Model):
+    """
+    Último número emitido por tipo de documento, por tenant (ver sequencias.py)
+    """
+    schema_name = models.CharField('Schema', max_length=63)
+    chave = models.CharField('Documento', max_length=100)
+    ultimo = models.PositiveBigIntegerField('Último Número', default=0)
+
+    class Meta:
+        verbose_name = 'Sequência de Documento'
+        verbose_name_plural = 'Sequências de Documentos'
+        constraints = [
+            models.UniqueConstraint(fields=['schema_name', 'chave'], name='core_sequencia_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.schema_name} - {self.chave}: {self.ultimo}'
@@ -0,0 +1,125 @@
+"""
+Paginação por chave (keyset)
+"""
+
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on the values of ``ordering`` instead of OFFSET
+
+    Each page filters on the key of the last row of the previous one
+    (opaque ``?cursor=``), so page N costs the same as the first when there
+    is an index in ``ordering`` order. ``ordering`` must end in a unique
+    field of the model itself (e.g. ``-id``) and its fields must not be
+    null. The order is always the pagination's (``?ordering=`` does not
+    apply) and it only moves forward: responses are ``{next, results}``.
+    Page size comes from ``?limite=``, capped at ``max_page_size``.
+    """
+    ordering = ('-id',)
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'limite'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [
+            queryset.model._meta.get_field(campo.lstrip('-')) for campo in self.ordering
+        ]
+
+        posicao = self.decode_cursor(request)
+        if posicao is not None:
+            queryset = queryset.filter(self._apos(posicao))
+
+        # Uma linha a mais só para saber se há próxima página
+        pagina = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.has_next = len(pagina) > self.page_size
+        pagina = pagina[:self.page_size]
+        self.ultima = pagina[-1] if pagina else None
+        return pagina
+
+    def get_page_size(self, request):
+        try:
+            tamanho = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(tamanho, self.max_page_size))
+
+    def _apos(self, posicao):
+        """(a, b) depois de (va, vb): a além de va, ou a = va e b além de vb"""
+        condicao = Q()
+        anteriores = {}
+        for campo, field, valor in zip(self.ordering, self.fields, posicao):
+            lookup = 'lt' if campo.startswith('-') else 'gt'
+            condicao |= Q(**anteriores, **{f'{field.attname}__{lookup}': valor})
+            anteriores[field.attname] = valor
+        return condicao
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            if len(valores) != len(self.fields):
+                raise ValueError(cursor)
+            return [field.to_python(valor) for field, valor in zip(self.fields, valores)]
+        except (ValueError, TypeError, binascii.Error, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance):
+        # value_to_string mantém os microssegundos (o encoder JSON do Django corta)
+        valores = [field.value_to_string(instance) for field in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(valores).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.ultima))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor da próxima página (campo `next` da resposta)',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Itens por página (máximo {self.max_page_size})',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,118 @@
+"""
+Database routers
+
+ReportingRouter envia as leituras feitas dentro de `usar_banco_relatorios()`
+para o alias opcional `reporting` (réplica de leitura). Escritas e todo o
+restante continuam no `default`. É composto com o TenantSyncRouter do
+django-tenants em DATABASE_ROUTERS: este router só decide leituras e
+bloqueia migrações na réplica e na conexão `sequencias` (o mesmo banco do
+default, usado só pela numeração de documentos); as demais decisões seguem
+para o próximo.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+REPORTING_DB_ALIAS = 'reporting'
+SEQUENCIAS_DB_ALIAS = 'sequencias'
+
+# Modelos lidos logo após serem escritos (read-your-writes) ficam no primário
+MODELOS_SEMPRE_NO_PRIMARIO = {
+    'relatorios.relatoriojob',
+}
+
+_usar_reporting = ContextVar('usar_banco_relatorios', default=False)
+
+
+def banco_relatorios_configurado():
+    return REPORTING_DB_ALIAS in connections.databases
+
+
+def alias_relatorios():
+    """Alias usado para leituras de relatórios (reporting, se configurado)"""
+    return REPORTING_DB_ALIAS if banco_relatorios_configurado() else DEFAULT_DB_ALIAS
+
+
+def _sincronizar_schema():
+    """Aplica na conexão de relatórios o schema do tenant ativo no default"""
+    if not banco_relatorios_configurado():
+        return
+    schema_name = getattr(connection, 'schema_name', None)
+    reporting = connections[REPORTING_DB_ALIAS]
+    if schema_name and hasattr(reporting, 'set_schema'):
+        reporting.set_schema(schema_name)
+
+
+@contextmanager
+def usar_banco_relatorios():
+    """
+    Leituras dentro do bloco vão para o banco de relatórios
+
+    Dentro de uma transação aberta no default as leituras continuam nele:
+    a réplica não enxergaria o que a própria transação acabou de gravar.
+    """
+    ativo = banco_relatorios_configurado() and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+    if ativo:
+        _sincronizar_schema()
+    token = _usar_reporting.set(ativo)
+    try:
+        yield REPORTING_DB_ALIAS if ativo else DEFAULT_DB_ALIAS
+    finally:
+        _usar_reporting.reset(token)
+
+
+@contextmanager
+def usar_banco_primario():
+    """
+    Leituras dentro do bloco ficam no default, mesmo dentro de `usar_banco_relatorios()`
+
+    Para quando a réplica pode estar atrasada em relação a uma escrita recente.
+    """
+    token = _usar_reporting.set(False)
+    try:
+        yield DEFAULT_DB_ALIAS
+    finally:
+        _usar_reporting.reset(token)
+
+
+class ReportingRouter:
+    """
+    Roteia leituras de relatórios para a réplica `reporting`
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _usar_reporting.get():
+            return None
+        if model._meta.label_lower in MODELOS_SEMPRE_NO_PRIMARIO:
+            return DEFAULT_DB_ALIAS
+        return REPORTING_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Objetos lidos da réplica são salvos no primário
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == REPORTING_DB_ALIAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e primário têm os mesmos dados
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPORTING_DB_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in (REPORTING_DB_ALIAS, SEQUENCIAS_DB_ALIAS):
+            return False
+        return None
+
+
+class BancoRelatoriosMixin:
+    """
+    Mixin para views de relatórios: toda a requisição lê do banco de relatórios
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with usar_banco_relatorios():
+            return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,111 @@
+"""
+Numeração de documentos (VD000123, PC000045...)
+
+Em vez de `objects.order_by('-id').first()` + 1 (uma consulta a mais por
+INSERT e números repetidos entre terminais concorrentes), cada tipo de
+documento tem um contador em SequenciaDocumento, por schema de tenant.
+
+`reservar_numeros` incrementa o contador com um único
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING. Com o alias `sequencias`
+configurado (SEQUENCIAS_CONEXAO_DEDICADA: uma segunda conexão ao mesmo
+banco, em autocommit, por worker/thread), a reserva é confirmada na hora,
+fora da transação de quem chama: a linha do contador fica travada só
+durante o comando, vendas concorrentes não se enfileiram atrás dela nem a
+travam junto com produtos e contas (sem deadlock), e um rollback deixa um
+buraco na numeração. Sem o alias (o padrão), a reserva roda na conexão
+default: a linha fica travada até o fim da transação de quem reservou e um
+rollback devolve os números. Na primeira reserva o contador parte do maior
+id da tabela do documento, continuando a numeração antiga.
+
+Inserções em lote reservam o bloco inteiro de uma vez
+(`proximos_numeros(modelo, prefixo, quantidade)`).
+"""
+
+from django.db import connection, connections, transaction
+
+from .models import SequenciaDocumento
+from .routers import SEQUENCIAS_DB_ALIAS
+from .utils import get_schema_name
+
+DIGITOS = 6
+
+
+def _conexao():
+    """Conexão da reserva: a dedicada (`sequencias`), no schema do tenant ativo, ou a default"""
+    if SEQUENCIAS_DB_ALIAS not in connections.databases:
+        return connection
+    dedicada = connections[SEQUENCIAS_DB_ALIAS]
+    schema_name = getattr(connection, 'schema_name', None)
+    if schema_name and hasattr(dedicada, 'set_schema'):
+        dedicada.set_schema(schema_name)
+    return dedicada
+
+
+def _suporta_upsert_returning(conexao):
+    # PostgreSQL e SQLite >= 3.35 aceitam INSERT ... ON CONFLICT ... RETURNING
+    return conexao.vendor in ('postgresql', 'sqlite') and conexao.features.can_return_columns_from_insert
+
+
+def _reservar_sql(conexao, schema_name, chave, modelo, quantidade):
+    qn = conexao.ops.quote_name
+    contador = qn(SequenciaDocumento._meta.db_table)
+    with conexao.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {contador} ({qn("schema_name")}, {qn("chave")}, {qn("ultimo")}) '
+            f'VALUES (%s, %s, (SELECT COALESCE(MAX({qn(modelo._meta.pk.column)}), 0) '
+            f'FROM {qn(modelo._meta.db_table)}) + %s) '
+            f'ON CONFLICT ({qn("schema_name")}, {qn("chave")}) '
+            f'DO UPDATE SET {qn("ultimo")} = {contador}.{qn("ultimo")} + %s '
+            f'RETURNING {qn("ultimo")}',
+            [schema_name, chave, quantidade, quantidade]
+        )
+        return cursor.fetchone()[0]
+
+
+def _reservar_orm(conexao, schema_name, chave, modelo, quantidade):
+    alias = conexao.alias
+    with transaction.atomic(using=alias):
+        sequencia = SequenciaDocumento.objects.using(alias).select_for_update().filter(
+            schema_name=schema_name, chave=chave
+        ).first()
+        if sequencia is None:
+            ultimo = modelo._default_manager.using(alias).order_by('-pk').values_list('pk', flat=True).first() or 0
+            sequencia = SequenciaDocumento.objects.using(alias).create(
+                schema_name=schema_name, chave=chave, ultimo=ultimo
+            )
+        sequencia.ultimo += quantidade
+        sequencia.save(using=alias, update_fields=['ultimo'])
+        return sequencia.ultimo
+
+
+def reservar_numeros(modelo, quantidade=1):
+    """
+    Reserva `quantidade` números seguidos do documento `modelo`
+
+    Retorna o primeiro número reservado (inteiro).
+    """
+    schema_name = get_schema_name() or 'public'
+    chave = modelo._meta.label_lower
+    conexao = _conexao()
+    if _suporta_upsert_returning(conexao):
+        ultimo = _reservar_sql(conexao, schema_name, chave, modelo, quantidade)
+    else:
+        ultimo = _reservar_orm(conexao, schema_name, chave, modelo, quantidade)
+    return ultimo - quantidade + 1
+
+
+def formatar_numero(prefixo, valor, digitos=DIGITOS):
+    return f'{prefixo}{valor:0{digitos}d}'
+
+
+def proximo_numero(modelo, prefixo, digitos=DIGITOS):
+    """Próximo número formatado do documento (ex.: 'VD000123')"""
+    return formatar_numero(prefixo, reservar_numeros(modelo), digitos)
+
+
+def proximos_numeros(modelo, prefixo, quantidade, digitos=DIGITOS):
+    """Bloco de `quantidade` números formatados, reservado em uma consulta"""
+    if quantidade <= 0:
+        return []
+    primeiro = reservar_numeros(modelo, quantidade)
+    return [formatar_numero(prefixo, valor, digitos) for valor in range(primeiro, primeiro + quantidade)]
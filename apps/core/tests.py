@@ -0,0 +1,95 @@
+"""
+Tests for Core app
+"""
+
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+
+from apps.compras.models import PedidoCompra
+from apps.vendas.models import Venda
+from .models import SequenciaDocumento
+from .routers import SEQUENCIAS_DB_ALIAS
+from .sequencias import proximo_numero, proximos_numeros
+
+User = get_user_model()
+
+
+class SequenciaDocumentoTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+
+    def test_continua_numeracao_existente(self):
+        """Sem contador, parte do maior id da tabela"""
+        Venda.objects.bulk_create([
+            Venda(numero=f'VD{i:06d}', vendedor=self.user) for i in range(1, 4)
+        ])
+
+        venda = Venda.objects.create(vendedor=self.user)
+
+        self.assertEqual(venda.numero, 'VD000004')
+        self.assertEqual(SequenciaDocumento.objects.get(chave='vendas.venda').ultimo, 4)
+
+    def test_uma_consulta_por_numero(self):
+        proximo_numero(Venda, 'VD')
+        with self.assertNumQueries(1):
+            self.assertEqual(proximo_numero(Venda, 'VD'), 'VD000002')
+
+    def test_bloco(self):
+        with self.assertNumQueries(1):
+            numeros = proximos_numeros(PedidoCompra, 'PC', 3)
+
+        self.assertEqual(numeros, ['PC000001', 'PC000002', 'PC000003'])
+        self.assertEqual(proximo_numero(PedidoCompra, 'PC'), 'PC000004')
+        self.assertEqual(proximos_numeros(PedidoCompra, 'PC', 0), [])
+
+    def test_rollback_devolve_numero(self):
+        proximo_numero(Venda, 'VD')
+        try:
+            with transaction.atomic():
+                self.assertEqual(proximo_numero(Venda, 'VD'), 'VD000002')
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertEqual(proximo_numero(Venda, 'VD'), 'VD000002')
+
+    def test_contador_por_tenant(self):
+        proximo_numero(Venda, 'VD')
+        with mock.patch('apps.core.sequencias.get_schema_name', return_value='loja2'):
+            # Mesma tabela (sem tenants nos testes): parte do maior id, não do contador do outro schema
+            self.assertEqual(proximo_numero(Venda, 'VD'), 'VD000001')
+        self.assertEqual(SequenciaDocumento.objects.filter(chave='vendas.venda').count(), 2)
+
+    def test_conexao_dedicada(self):
+        """Com o alias `sequencias` configurado, a reserva roda nele e não na conexão default"""
+        with mock.patch('apps.core.sequencias.connections') as conexoes:
+            conexoes.databases = {SEQUENCIAS_DB_ALIAS: {}}
+            conexoes.__getitem__.return_value = connection
+            self.assertEqual(proximo_numero(Venda, 'VD'), 'VD000001')
+        conexoes.__getitem__.assert_called_once_with(SEQUENCIAS_DB_ALIAS)
+
+
+CONEXAO_DEDICADA = SEQUENCIAS_DB_ALIAS in settings.DATABASES
+
+
+@skipUnless(CONEXAO_DEDICADA, 'SEQUENCIAS_CONEXAO_DEDICADA desligado')
+class SequenciaConexaoDedicadaTest(TestCase):
+    """Reserva na conexão `sequencias` (o TestCase também desfaz o que ela gravou)"""
+
+    # O runner valida os aliases mesmo da classe pulada
+    databases = {'default', SEQUENCIAS_DB_ALIAS} if CONEXAO_DEDICADA else {'default'}
+
+    def test_rollback_deixa_buraco(self):
+        try:
+            with transaction.atomic():
+                self.assertEqual(proximo_numero(Venda, 'VD'), 'VD000001')
+                raise ValueError
+        except ValueError:
+            pass
+
+        # A reserva foi confirmada pela outra conexão: o rollback não a devolve
+        self.assertEqual(proximo_numero(Venda, 'VD'), 'VD000002')
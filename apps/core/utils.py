@@ -90,3 +90,43 @@ def validate_cnpj(cnpj):
     digit2 = 0 if digit2 < 2 else 11 - digit2
     
     return int(cnpj[13]) == digit2
+
+
+def get_schema_name():
+    """
+    Schema do tenant ativo na conexão (None quando django-tenants está desabilitado)
+    """
+    from django.db import connection
+    return getattr(connection, 'schema_name', None)
+
+
+def tenant_context(schema_name):
+    """
+    Ativa o schema do tenant para código fora de requisição (tasks Celery)
+    """
+    from contextlib import nullcontext
+    from django.db import connection
+    
+    if schema_name and hasattr(connection, 'set_schema'):
+        from django_tenants.utils import schema_context
+        return schema_context(schema_name)
+    return nullcontext()
+
+
+def get_tenant_schemas():
+    """
+    Schemas de todos os tenants (exceto o público) para tasks periódicas
+
+    Sem django-tenants retorna [None], ou seja, o banco padrão.
+    """
+    from django.conf import settings
+    
+    if 'django_tenants' not in settings.INSTALLED_APPS:
+        return [None]
+    
+    from django_tenants.utils import get_public_schema_name, get_tenant_model
+    return list(
+        get_tenant_model().objects.exclude(
+            schema_name=get_public_schema_name()
+        ).values_list('schema_name', flat=True)
+    )
@@ -6,6 +6,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from apps.core.models import BaseModel
+from apps.core.sequencias import proximo_numero
 from apps.erp.models import Cliente, Produto
 
 User = get_user_model()
@@ -171,10 +172,7 @@ class Oportunidade(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.numero:
-            # Generate automatic number
-            ultimo = Oportunidade.objects.order_by('-id').first()
-            proximo_id = (ultimo.id + 1) if ultimo else 1
-            self.numero = f'OPP{proximo_id:06d}'
+            self.numero = proximo_numero(Oportunidade, 'OPP')
         
         # Atualizar probabilidade baseado na etapa
         if self.etapa:
@@ -103,6 +103,11 @@ class ProdutoAdmin(admin.ModelAdmin):
     list_filter = ['tipo', 'categoria', 'active', 'controla_lote', 'controla_validade', 'created_at']
     search_fields = ['nome', 'descricao', 'codigo_interno', 'codigo_barras']
     readonly_fields = ['created_at', 'updated_at', 'margem_lucro', 'estoque_baixo', 'valor_estoque']
+    list_select_related = ['categoria']
+
+    def get_queryset(self, request):
+        # valor_estoque usa o custo do produto
+        return super().get_queryset(request).select_related('custo')
     
     fieldsets = (
         ('Dados Básicos', {
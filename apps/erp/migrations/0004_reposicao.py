@@ -0,0 +1,24 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0003_auto_20251126_1619'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fornecedor',
+            name='prazo_entrega',
+            field=models.PositiveIntegerField(default=7, verbose_name='Prazo de Entrega (dias)'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='fornecedor_preferencial',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='produtos_preferenciais', to='erp.fornecedor', verbose_name='Fornecedor Preferencial'),
+        ),
+    ]
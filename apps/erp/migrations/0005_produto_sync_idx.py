@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0004_reposicao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['updated_at', 'id'], name='erp_produto_sync_idx'),
+        ),
+    ]
@@ -128,6 +128,9 @@ class Fornecedor(BaseModel):
     contato_nome = models.CharField('Nome do Contato', max_length=100, blank=True)
     contato_cargo = models.CharField('Cargo do Contato', max_length=100, blank=True)
     
+    # Compras
+    prazo_entrega = models.PositiveIntegerField('Prazo de Entrega (dias)', default=7)
+    
     # Endereço
     cep = models.CharField('CEP', max_length=9, blank=True)
     logradouro = models.CharField('Logradouro', max_length=200, blank=True)
@@ -263,6 +266,16 @@ class Produto(BaseModel):
         validators=[MinValueValidator(0)]
     )
     
+    # Reposição
+    fornecedor_preferencial = models.ForeignKey(
+        Fornecedor,
+        on_delete=models.SET_NULL,
+        related_name='produtos_preferenciais',
+        verbose_name='Fornecedor Preferencial',
+        null=True,
+        blank=True
+    )
+    
     # Localização
     localizacao = models.CharField('Localização', max_length=100, blank=True, help_text='Ex: Prateleira A1')
     
@@ -283,6 +296,8 @@ class Produto(BaseModel):
             models.Index(fields=['nome']),
             models.Index(fields=['tipo']),
             models.Index(fields=['active']),
+            # Delta de sincronização dos PDVs (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='erp_produto_sync_idx'),
         ]
     
     def __str__(self):
@@ -299,10 +314,16 @@ class Produto(BaseModel):
         """Verifica se o estoque está abaixo do mínimo"""
         return self.estoque_atual < self.estoque_minimo
     
+    @property
+    def custo_unitario(self):
+        """Custo unitário do estoque (motor de custos do estoque ou preço de custo)"""
+        custo = getattr(self, 'custo', None)
+        return custo.custo_unitario if custo else self.preco_custo
+    
     @property
     def valor_estoque(self):
         """Valor total do estoque (custo)"""
-        return self.estoque_atual * self.preco_custo
+        return self.estoque_atual * self.custo_unitario
 
 
 class Servico(BaseModel):
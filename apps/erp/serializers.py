@@ -71,7 +71,8 @@ class FornecedorSerializer(serializers.ModelSerializer):
             'telefone_principal', 'telefone_secundario', 'email',
             'contato_nome', 'contato_cargo', 'cep', 'logradouro',
             'numero', 'complemento', 'bairro', 'cidade', 'estado',
-            'observacoes', 'active', 'total_compras', 'created_at', 'updated_at'
+            'prazo_entrega', 'observacoes', 'active', 'total_compras',
+            'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'total_compras']
     
@@ -107,8 +108,8 @@ class ProdutoSerializer(serializers.ModelSerializer):
             'categoria_nome', 'codigo_interno', 'codigo_barras', 'ncm',
             'unidade_medida', 'unidade_display', 'preco_custo', 'preco_venda',
             'margem_lucro', 'estoque_atual', 'estoque_minimo', 'estoque_maximo',
-            'localizacao', 'controla_lote', 'controla_validade', 'imagem',
-            'active', 'estoque_baixo', 'valor_estoque', 'created_at', 'updated_at'
+            'fornecedor_preferencial', 'localizacao', 'controla_lote',
+            'controla_validade', 'imagem', 'active', 'estoque_baixo', 'valor_estoque', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'margem_lucro', 'created_at', 'updated_at', 'estoque_baixo', 'valor_estoque']
 
@@ -93,3 +93,17 @@ class ProdutoModelTest(TestCase):
     def test_valor_estoque(self):
         valor_esperado = self.produto.estoque_atual * self.produto.preco_custo
         self.assertEqual(self.produto.valor_estoque, valor_esperado)
+
+    def test_serializer_sem_consulta_por_produto(self):
+        from apps.estoque.models import CustoProduto
+        from .serializers import ProdutoSerializer
+        from .views import ProdutoViewSet
+
+        for i in range(5):
+            produto = Produto.objects.create(nome=f'Peça {i}', codigo_interno=f'PC{i}', preco_custo=1, estoque_atual=2)
+            if i % 2:
+                CustoProduto.objects.create(produto=produto, custo_unitario=3)
+
+        with self.assertNumQueries(1):
+            dados = ProdutoSerializer(ProdutoViewSet.queryset.order_by('codigo_interno'), many=True).data
+        self.assertEqual([item['valor_estoque'] for item in dados[1:]], [2, 6, 2, 6, 2])
@@ -210,7 +210,7 @@ class ProdutoViewSet(viewsets.ModelViewSet):
     """
     ViewSet for Produto
     """
-    queryset = Produto.objects.select_related('categoria').all()
+    queryset = Produto.objects.select_related('categoria', 'custo').all()
     permission_classes = [AllowAny]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['nome', 'descricao', 'codigo_interno', 'codigo_barras']
@@ -239,19 +239,27 @@ class ProdutoViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def movimentacoes(self, request, pk=None):
         """
-        Get product stock movements
+        Get product stock movements, newest first, paginated by key
+        (?cursor=<next>&limite=50)
         """
         produto = self.get_object()
         
         # Import local
         from apps.estoque.models import MovimentacaoEstoque
-        from apps.estoque.serializers import MovimentacaoEstoqueSerializer
+        from apps.estoque.serializers import MovimentacaoEstoqueListSerializer
+        from apps.estoque.views import MovimentacaoPagination
         
-        movimentacoes = MovimentacaoEstoque.objects.filter(produto=produto).order_by('-data_movimentacao')
+        paginator = MovimentacaoPagination()
+        movimentacoes = paginator.paginate_queryset(
+            MovimentacaoEstoque.objects.filter(produto=produto).select_related('produto'),
+            request,
+            view=self
+        )
         
         return Response({
             'produto': ProdutoSerializer(produto).data,
-            'movimentacoes': MovimentacaoEstoqueSerializer(movimentacoes, many=True).data,
+            'movimentacoes': MovimentacaoEstoqueListSerializer(movimentacoes, many=True).data,
+            'next': paginator.get_next_link(),
         })
     
     @action(detail=False, methods=['post'])
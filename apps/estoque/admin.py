@@ -3,7 +3,11 @@ Admin configuration for Estoque app
 """
 
 from django.contrib import admin
-from .models import MovimentacaoEstoque, Lote, Inventario, ItemInventario
+from apps.erp.models import Produto
+from .models import (
+    MovimentacaoEstoque, Lote, Inventario, ItemInventario, SaldoEstoqueDiario, SaldoLocal,
+    CustoProduto, CamadaCusto, AlocacaoLote
+)
 
 
 @admin.register(MovimentacaoEstoque)
@@ -85,7 +89,16 @@ class LoteAdmin(admin.ModelAdmin):
     vencido_display.short_description = 'Status'
 
 
-class ItemInventarioInline(admin.TabularInline):
+class ProdutoComCustoMixin:
+    """O produto do item vem com o custo (valor_diferenca), sem uma consulta a mais por item"""
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'produto':
+            kwargs['queryset'] = Produto.objects.select_related('custo')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class ItemInventarioInline(ProdutoComCustoMixin, admin.TabularInline):
     model = ItemInventario
     extra = 0
     readonly_fields = ['diferenca', 'valor_diferenca']
@@ -129,7 +142,7 @@ class InventarioAdmin(admin.ModelAdmin):
 
 
 @admin.register(ItemInventario)
-class ItemInventarioAdmin(admin.ModelAdmin):
+class ItemInventarioAdmin(ProdutoComCustoMixin, admin.ModelAdmin):
     list_display = [
         'inventario', 'produto', 'quantidade_sistema',
         'quantidade_contada', 'diferenca', 'valor_diferenca', 'ajustado'
@@ -137,3 +150,43 @@ class ItemInventarioAdmin(admin.ModelAdmin):
     list_filter = ['ajustado', 'inventario__status']
     search_fields = ['produto__nome', 'produto__codigo_interno']
     readonly_fields = ['diferenca', 'valor_diferenca']
+    list_select_related = ['inventario', 'produto']
+
+
+@admin.register(SaldoEstoqueDiario)
+class SaldoEstoqueDiarioAdmin(admin.ModelAdmin):
+    list_display = ['data', 'produto', 'quantidade', 'custo_unitario', 'valor', 'calculado_em']
+    list_filter = ['data']
+    search_fields = ['produto__nome', 'produto__codigo_interno']
+    readonly_fields = ['calculado_em']
+    date_hierarchy = 'data'
+
+
+@admin.register(SaldoLocal)
+class SaldoLocalAdmin(admin.ModelAdmin):
+    list_display = ['local', 'produto', 'quantidade', 'estoque_minimo']
+    list_filter = ['local']
+    search_fields = ['local', 'produto__nome', 'produto__codigo_interno']
+    readonly_fields = ['quantidade']
+
+
+@admin.register(CustoProduto)
+class CustoProdutoAdmin(admin.ModelAdmin):
+    list_display = ['produto', 'quantidade', 'custo_unitario', 'valor', 'atualizado_em']
+    search_fields = ['produto__nome', 'produto__codigo_interno']
+    readonly_fields = ['quantidade', 'custo_unitario', 'valor', 'atualizado_em']
+
+
+@admin.register(CamadaCusto)
+class CamadaCustoAdmin(admin.ModelAdmin):
+    list_display = ['produto', 'data', 'quantidade', 'saldo', 'custo_unitario', 'movimentacao']
+    search_fields = ['produto__nome', 'produto__codigo_interno']
+    raw_id_fields = ['produto', 'movimentacao']
+    date_hierarchy = 'data'
+
+
+@admin.register(AlocacaoLote)
+class AlocacaoLoteAdmin(admin.ModelAdmin):
+    list_display = ['movimentacao', 'lote', 'quantidade']
+    search_fields = ['lote__numero_lote', 'lote__produto__nome']
+    raw_id_fields = ['movimentacao', 'lote']
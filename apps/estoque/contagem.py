@@ -0,0 +1,119 @@
+"""
+Contagem de inventário por leituras de código (coletores)
+
+`registrar_leituras` recebe um lote de leituras (código de barras ou
+código interno, quantidade) e grava os ItemInventario com um número fixo
+de consultas, independente do tamanho do lote:
+
+1. trava o inventário (lotes da mesma sessão não se sobrepõem) e confere,
+   já com a trava, que ele continua em andamento
+2. resolve todos os códigos com um IN (código de barras tem prioridade
+   sobre código interno)
+3. lê os itens já contados desses produtos
+4. grava tudo com bulk_create(update_conflicts=True)
+
+Leituras repetidas do mesmo produto são somadas; por padrão também somam
+na contagem já registrada (modo 'somar'), ou a substituem ('substituir').
+Códigos desconhecidos ou ambíguos voltam como erro da linha, sem impedir
+as demais.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+
+from apps.erp.models import Produto
+from .models import Inventario, ItemInventario
+from .services import TAMANHO_LOTE
+
+CENTAVOS = Decimal('0.01')
+
+MODO_SOMAR = 'somar'
+MODO_SUBSTITUIR = 'substituir'
+
+
+class InventarioEncerrado(Exception):
+    """Leituras em inventário que não está (ou deixou de estar) em andamento"""
+
+    def __init__(self):
+        super().__init__('Inventário não está em andamento')
+
+
+def resolver_codigos(codigos):
+    """
+    {codigo: produto} para os códigos informados, em uma consulta
+
+    Códigos de barras repetidos em mais de um produto mapeiam para None.
+    """
+    codigos = set(codigos)
+    por_barras, por_interno = {}, {}
+    for produto in Produto.objects.filter(
+        Q(codigo_barras__in=codigos) | Q(codigo_interno__in=codigos)
+    ).select_related('custo').order_by():
+        if produto.codigo_barras in codigos:
+            ambiguo = produto.codigo_barras in por_barras
+            por_barras[produto.codigo_barras] = None if ambiguo else produto
+        if produto.codigo_interno in codigos:
+            por_interno[produto.codigo_interno] = produto
+    return {**por_interno, **por_barras}
+
+
+def registrar_leituras(inventario, leituras, modo=MODO_SOMAR):
+    """
+    Registra leituras [(codigo, quantidade)] no inventário
+
+    Retorna (itens gravados, erros [{'linha', 'codigo', 'erro'}]). Levanta
+    InventarioEncerrado se o inventário foi finalizado ou cancelado antes
+    da trava.
+    """
+    with transaction.atomic():
+        inventario = Inventario.objects.select_for_update().get(pk=inventario.pk)
+        if inventario.status != 'em_andamento':
+            raise InventarioEncerrado()
+        produtos = resolver_codigos(codigo for codigo, _ in leituras)
+
+        contagens = defaultdict(Decimal)
+        erros = []
+        for linha, (codigo, quantidade) in enumerate(leituras):
+            if codigo not in produtos:
+                erros.append({'linha': linha, 'codigo': codigo, 'erro': 'Código não encontrado'})
+            elif produtos[codigo] is None:
+                erros.append({'linha': linha, 'codigo': codigo, 'erro': 'Código de barras em mais de um produto'})
+            else:
+                contagens[produtos[codigo].pk] += quantidade
+
+        por_id = {produto.pk: produto for produto in produtos.values() if produto}
+        existentes = {
+            produto_id: (sistema, contada)
+            for produto_id, sistema, contada in inventario.itens.filter(produto_id__in=contagens).values_list(
+                'produto_id', 'quantidade_sistema', 'quantidade_contada'
+            ).order_by()
+        } if contagens else {}
+
+        itens = []
+        for produto_id, quantidade in contagens.items():
+            produto = por_id[produto_id]
+            sistema, contada = existentes.get(produto_id, (produto.estoque_atual, Decimal('0')))
+            if modo == MODO_SUBSTITUIR:
+                contada = Decimal('0')
+            contada += quantidade
+            diferenca = contada - sistema
+            itens.append(ItemInventario(
+                inventario=inventario,
+                produto=produto,
+                quantidade_sistema=sistema,
+                quantidade_contada=contada,
+                diferenca=diferenca,
+                valor_diferenca=(diferenca * produto.custo_unitario).quantize(CENTAVOS)
+            ))
+
+        ItemInventario.objects.bulk_create(
+            itens,
+            batch_size=TAMANHO_LOTE,
+            update_conflicts=True,
+            unique_fields=['inventario', 'produto'],
+            update_fields=['quantidade_contada', 'diferenca', 'valor_diferenca']
+        )
+    return itens, erros
@@ -0,0 +1,247 @@
+"""
+Motor de custos do estoque
+
+Valoriza o estoque a partir das movimentações, em vez de
+`estoque_atual * preco_custo` (que muda de valor a cada alteração do preço
+de custo):
+
+- entradas (recebimentos de compras) criam camadas de custo com o
+  `valor_unitario` da movimentação (o preço do item do pedido)
+- saídas (vendas, peças de OS) consomem as camadas da mais antiga para a
+  mais nova e recebem o custo apurado (CustoMovimentacao)
+- ajustes e inventários entram ou saem pelo custo atual do produto
+
+O método de valoração vem de ESTOQUE_METODO_CUSTO: 'media' (custo médio
+ponderado) ou 'peps' (primeiro a entrar, primeiro a sair). As camadas são
+mantidas nos dois casos.
+
+O processamento é incremental: `atualizar_custos` só lê as movimentações
+ainda sem CustoMovimentacao, em ordem de id. Não usa o maior id apurado
+como ponto de partida: no PostgreSQL o id é reservado no INSERT, não no
+commit, e uma transação longa pode confirmar um id menor depois que a
+execução anterior já passou dele. `recalcular_custos` (comando
+`recalcular_custos`) apaga tudo e reprocessa o histórico.
+
+Se o saldo apurado divergir da `quantidade_anterior` da movimentação
+(estoque inicial cadastrado no produto, histórico anterior ao motor), a
+diferença entra ou sai pelo custo atual antes de aplicar a movimentação.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.erp.models import Produto
+from .models import CamadaCusto, CustoMovimentacao, CustoProduto, MovimentacaoEstoque
+from .services import TAMANHO_LOTE, TIPOS_ABSOLUTOS, TIPOS_ENTRADA, TIPOS_SAIDA
+from .signals import custos_atualizados
+
+METODO_MEDIA = 'media'
+METODO_PEPS = 'peps'
+
+CENTAVOS = Decimal('0.01')
+CASAS_CUSTO = Decimal('0.0001')
+ZERO = Decimal('0')
+
+# Documentos cujas saídas são custo no DRE
+DOCUMENTOS_CUSTO = ('venda', 'os')
+
+
+def metodo_custo():
+    return getattr(settings, 'ESTOQUE_METODO_CUSTO', METODO_MEDIA)
+
+
+class _Posicao:
+    """Custo de um produto durante o processamento"""
+
+    def __init__(self, custo, camadas, preco_custo):
+        self.custo = custo
+        self.camadas = camadas
+        self.preco_custo = preco_custo
+        self.valor = Decimal(custo.valor)
+
+    def custo_unitario(self):
+        if self.custo.quantidade > 0:
+            return self.valor / self.custo.quantidade
+        return self.custo.custo_unitario or self.preco_custo
+
+    def entrar(self, quantidade, custo_unitario, movimentacao_id, data):
+        camada = CamadaCusto(
+            produto_id=self.custo.produto_id,
+            movimentacao_id=movimentacao_id,
+            data=data,
+            quantidade=quantidade,
+            saldo=quantidade,
+            custo_unitario=custo_unitario.quantize(CASAS_CUSTO)
+        )
+        self.camadas.append(camada)
+        self.custo.quantidade += quantidade
+        self.valor += quantidade * camada.custo_unitario
+        self._atualizar()
+        return camada
+
+    def sair(self, quantidade, metodo, alteradas):
+        """Consome `quantidade` e retorna o custo da saída"""
+        custo_atual = self.custo_unitario()
+        restante = quantidade
+        custo_peps = ZERO
+        for camada in self.camadas:
+            if not restante:
+                break
+            usado = min(camada.saldo, restante)
+            camada.saldo -= usado
+            restante -= usado
+            custo_peps += usado * camada.custo_unitario
+            if camada.pk:
+                alteradas[camada.pk] = camada
+        self.camadas = [camada for camada in self.camadas if camada.saldo > 0]
+
+        if metodo == METODO_PEPS:
+            # Sem camada para o restante (saldo sem origem): custo atual
+            custo = custo_peps + restante * custo_atual
+        else:
+            custo = quantidade * custo_atual
+
+        self.custo.quantidade -= quantidade
+        self.valor -= custo
+        self._atualizar()
+        return custo
+
+    def _atualizar(self):
+        if self.custo.quantidade <= 0:
+            self.valor = ZERO
+        else:
+            self.custo.custo_unitario = (self.valor / self.custo.quantidade).quantize(CASAS_CUSTO)
+        self.custo.valor = self.valor.quantize(CENTAVOS)
+
+
+class _Processamento:
+    """Apura o custo de uma sequência de movimentações, lote a lote"""
+
+    def __init__(self, metodo):
+        self.metodo = metodo
+        self.posicoes = {}
+
+    def _carregar(self, produto_ids):
+        novos = set(produto_ids) - set(self.posicoes)
+        if not novos:
+            return
+        custos = {
+            custo.produto_id: custo for custo in CustoProduto.objects.filter(produto_id__in=novos).order_by()
+        }
+        precos = dict(Produto.objects.filter(pk__in=novos).order_by().values_list('pk', 'preco_custo'))
+        camadas = {pk: [] for pk in novos}
+        for camada in CamadaCusto.objects.filter(produto_id__in=novos, saldo__gt=0).order_by(
+            'produto_id', 'data', 'pk'
+        ):
+            camadas[camada.produto_id].append(camada)
+        for pk in novos:
+            custo = custos.get(pk) or CustoProduto(produto_id=pk)
+            self.posicoes[pk] = _Posicao(custo, camadas[pk], precos.get(pk) or ZERO)
+
+    def processar(self, movimentacoes):
+        """Aplica e grava um lote de movimentações (em ordem de id)"""
+        self._carregar({mov.produto_id for mov in movimentacoes})
+        novas, alteradas, custos, datas = [], {}, [], set()
+
+        for mov in movimentacoes:
+            posicao = self.posicoes[mov.produto_id]
+
+            # Saldo sem origem conhecida entra/sai pelo custo atual
+            diferenca = mov.quantidade_anterior - posicao.custo.quantidade
+            if diferenca > 0:
+                novas.append(posicao.entrar(diferenca, posicao.custo_unitario(), None, mov.data_movimentacao))
+            elif diferenca < 0:
+                posicao.sair(-diferenca, self.metodo, alteradas)
+
+            quantidade, custo = ZERO, ZERO
+            if mov.tipo in TIPOS_ENTRADA or mov.tipo in TIPOS_ABSOLUTOS:
+                delta = mov.quantidade_nova - mov.quantidade_anterior
+                if delta > 0:
+                    unitario = posicao.custo_unitario()
+                    if mov.tipo in TIPOS_ENTRADA and mov.valor_unitario > 0:
+                        unitario = Decimal(mov.valor_unitario)
+                    novas.append(posicao.entrar(delta, unitario, mov.pk, mov.data_movimentacao))
+                    quantidade, custo = delta, delta * unitario
+                elif delta < 0:
+                    quantidade, custo = -delta, posicao.sair(-delta, self.metodo, alteradas)
+            elif mov.tipo in TIPOS_SAIDA:
+                quantidade = mov.quantidade_anterior - mov.quantidade_nova
+                custo = posicao.sair(quantidade, self.metodo, alteradas)
+                if mov.documento in DOCUMENTOS_CUSTO:
+                    datas.add(timezone.localtime(mov.data_movimentacao).date())
+
+            custos.append(CustoMovimentacao(
+                movimentacao_id=mov.pk,
+                produto_id=mov.produto_id,
+                quantidade=quantidade,
+                custo_unitario=(custo / quantidade).quantize(CASAS_CUSTO) if quantidade else ZERO,
+                custo_total=custo.quantize(CENTAVOS)
+            ))
+
+        self._gravar(movimentacoes, novas, alteradas, custos)
+        return datas
+
+    def _gravar(self, movimentacoes, novas, alteradas, custos):
+        agora = timezone.now()
+        produtos = [self.posicoes[pk].custo for pk in {mov.produto_id for mov in movimentacoes}]
+        for custo in produtos:
+            custo.atualizado_em = agora
+
+        with transaction.atomic():
+            # Camadas criadas e consumidas no mesmo lote já vão com o saldo final
+            CamadaCusto.objects.bulk_create(novas, batch_size=TAMANHO_LOTE)
+            CamadaCusto.objects.bulk_update(alteradas.values(), ['saldo'], batch_size=TAMANHO_LOTE)
+            CustoProduto.objects.bulk_create(
+                [custo for custo in produtos if custo.pk is None], batch_size=TAMANHO_LOTE
+            )
+            CustoProduto.objects.bulk_update(
+                [custo for custo in produtos if custo.pk is not None],
+                ['quantidade', 'valor', 'custo_unitario', 'atualizado_em'],
+                batch_size=TAMANHO_LOTE
+            )
+            CustoMovimentacao.objects.bulk_create(custos, batch_size=TAMANHO_LOTE)
+
+
+def atualizar_custos(metodo=None):
+    """
+    Apura o custo das movimentações ainda não processadas
+
+    Cada lote de TAMANHO_LOTE movimentações é gravado na sua transação,
+    então uma execução interrompida continua de onde parou. Retorna o
+    número de movimentações processadas.
+    """
+    processamento = _Processamento(metodo or metodo_custo())
+    ultima = 0
+    total = 0
+    datas = set()
+
+    while True:
+        lote = list(
+            MovimentacaoEstoque.objects.filter(custo__isnull=True, pk__gt=ultima).order_by('pk').only(
+                'produto_id', 'tipo', 'quantidade_anterior', 'quantidade_nova',
+                'valor_unitario', 'documento', 'data_movimentacao'
+            )[:TAMANHO_LOTE]
+        )
+        if not lote:
+            break
+        datas |= processamento.processar(lote)
+        ultima = lote[-1].pk
+        total += len(lote)
+        if len(lote) < TAMANHO_LOTE:
+            break
+
+    if datas:
+        custos_atualizados.send(sender=CustoMovimentacao, datas=sorted(datas))
+    return total
+
+
+def recalcular_custos(metodo=None):
+    """Descarta os custos apurados e reprocessa todo o histórico"""
+    with transaction.atomic():
+        CustoMovimentacao.objects.all().delete()
+        CamadaCusto.objects.all().delete()
+        CustoProduto.objects.all().delete()
+    return atualizar_custos(metodo)
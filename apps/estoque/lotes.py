@@ -0,0 +1,228 @@
+"""
+Alocação de lotes por validade (FEFO)
+
+Produtos com `controla_lote` têm o saldo acompanhado também por Lote:
+
+- entradas com número de lote somam no lote (criado na primeira entrada,
+  com a validade da movimentação); entradas sem número somam no lote de
+  saldo inicial (LOTE_SALDO_INICIAL, sem validade)
+- saldo do produto que ainda não está em lote (estoque anterior ao controle
+  de lote) entra no lote de saldo inicial antes do movimento
+- ajustes e inventários levam a soma dos lotes ao novo saldo: a sobra entra
+  no lote informado ou no de saldo inicial; a falta sai primeiro do lote
+  informado, depois dos vencidos/inativos e então por validade
+- saídas são retiradas dos lotes válidos na ordem de validade (primeiro a
+  vencer, primeiro a sair); lotes sem validade ficam por último e lotes
+  vencidos ou inativos não são usados. Uma saída que informa o lote sai
+  só dele.
+
+Os lotes dos produtos envolvidos são travados (select_for_update) em uma
+consulta, na ordem produto/validade do índice de Lote, e gravados com
+bulk_update. Sem saldo nos lotes válidos a saída levanta LoteInsuficiente
+e, como tudo roda na transação do lançamento, nada é gravado.
+
+`previa_alocacao` faz a mesma escolha para uma cesta, sem travar nem gravar.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.erp.models import Produto
+from .models import AlocacaoLote, Lote, MovimentacaoEstoque
+from .services import TAMANHO_LOTE, TIPOS_ABSOLUTOS, TIPOS_ENTRADA, TIPOS_SAIDA, EstoqueInsuficiente
+
+LOTE_SALDO_INICIAL = 'SALDO-INICIAL'
+ORDEM_FEFO = ['produto_id', F('data_validade').asc(nulls_last=True), 'pk']
+
+
+class LoteInsuficiente(EstoqueInsuficiente):
+    """Saída maior que o saldo dos lotes válidos do produto (ou do lote informado)"""
+
+    def __init__(self, produto_id, disponivel, lote=None):
+        super().__init__(produto_id, disponivel)
+        self.lote = lote
+        onde = f'no lote {lote}' if lote else 'nos lotes válidos'
+        self.args = (f'Estoque insuficiente {onde}. Disponível: {disponivel}',)
+
+
+def _valido(lote, hoje):
+    return lote.active and (lote.data_validade is None or lote.data_validade >= hoje)
+
+
+def _retirar(lotes, quantidade):
+    """Retiradas [(lote, quantidade)] na ordem dos lotes e a quantidade que faltou"""
+    retiradas = []
+    for lote in lotes:
+        if not quantidade:
+            break
+        if lote.quantidade <= 0:
+            continue
+        usado = min(lote.quantidade, quantidade)
+        retiradas.append((lote, usado))
+        quantidade -= usado
+    return retiradas, quantidade
+
+
+def _controlam_lote(movimentacoes):
+    """Ids dos produtos que controlam lote (sem consulta se o produto já veio carregado com o campo)"""
+    controlados, consultar = set(), set()
+    for movimentacao in movimentacoes:
+        if (
+            MovimentacaoEstoque.produto.is_cached(movimentacao)
+            and 'controla_lote' not in movimentacao.produto.get_deferred_fields()
+        ):
+            if movimentacao.produto.controla_lote:
+                controlados.add(movimentacao.produto_id)
+        else:
+            consultar.add(movimentacao.produto_id)
+    if consultar:
+        controlados.update(
+            Produto.objects.filter(pk__in=consultar, controla_lote=True).values_list('pk', flat=True)
+        )
+    return controlados
+
+
+def alocar_lotes(movimentacoes):
+    """
+    Aplica aos lotes as movimentações ainda não salvas
+
+    Usa quantidade_anterior/quantidade_nova já calculadas pelo lançamento.
+    Retorna as AlocacaoLote das saídas (e das baixas de ajuste), a gravar
+    com `gravar_alocacoes` depois do INSERT das movimentações. Uma saída
+    que coube em um único lote recebe o número e a validade dele.
+    """
+    relevantes = [
+        movimentacao for movimentacao in movimentacoes
+        if movimentacao.tipo in TIPOS_SAIDA or movimentacao.tipo in TIPOS_ENTRADA
+        or movimentacao.tipo in TIPOS_ABSOLUTOS
+    ]
+    if not relevantes:
+        return []
+    controlados = _controlam_lote(relevantes)
+    relevantes = [movimentacao for movimentacao in relevantes if movimentacao.produto_id in controlados]
+    if not relevantes:
+        return []
+
+    numeros = {movimentacao.lote for movimentacao in relevantes if movimentacao.lote}
+    numeros.add(LOTE_SALDO_INICIAL)
+    por_produto = defaultdict(list)
+    por_numero = {}
+    for lote in Lote.objects.select_for_update().filter(produto_id__in=controlados).filter(
+        Q(quantidade__gt=0) | Q(numero_lote__in=numeros)
+    ).order_by(*ORDEM_FEFO):
+        por_produto[lote.produto_id].append(lote)
+        por_numero[(lote.produto_id, lote.numero_lote)] = lote
+
+    hoje = timezone.localdate()
+    novos, alterados, alocacoes = [], {}, []
+
+    def obter(movimentacao, numero):
+        lote = por_numero.get((movimentacao.produto_id, numero))
+        if lote is None:
+            informado = numero == movimentacao.lote
+            lote = Lote(
+                produto_id=movimentacao.produto_id,
+                numero_lote=numero,
+                data_validade=movimentacao.data_validade if informado else None,
+                quantidade=Decimal('0'),
+                nota_fiscal=movimentacao.documento_numero
+                if informado and movimentacao.documento == 'nota_fiscal' else ''
+            )
+            novos.append(lote)
+            por_numero[(movimentacao.produto_id, numero)] = lote
+            por_produto[movimentacao.produto_id].append(lote)
+            por_produto[movimentacao.produto_id].sort(
+                key=lambda item: (item.data_validade is None, item.data_validade or hoje)
+            )
+        return lote
+
+    def somar(lote, quantidade):
+        lote.quantidade += quantidade
+        if lote.pk:
+            alterados[lote.pk] = lote
+
+    def baixar(movimentacao, retiradas):
+        for lote, usado in retiradas:
+            somar(lote, -usado)
+            alocacoes.append(AlocacaoLote(movimentacao=movimentacao, lote=lote, quantidade=usado))
+
+    for movimentacao in relevantes:
+        quantidade = Decimal(str(movimentacao.quantidade))
+        lotes = por_produto[movimentacao.produto_id]
+
+        fora_de_lote = Decimal(str(movimentacao.quantidade_anterior)) - sum(lote.quantidade for lote in lotes)
+        if fora_de_lote > 0:
+            somar(obter(movimentacao, LOTE_SALDO_INICIAL), fora_de_lote)
+
+        if movimentacao.tipo in TIPOS_ABSOLUTOS:
+            diferenca = Decimal(str(movimentacao.quantidade_nova)) - sum(lote.quantidade for lote in lotes)
+            if diferenca > 0:
+                somar(obter(movimentacao, movimentacao.lote or LOTE_SALDO_INICIAL), diferenca)
+            elif diferenca < 0:
+                informado = por_numero.get((movimentacao.produto_id, movimentacao.lote))
+                ordem = [informado] if informado else []
+                ordem += [lote for lote in lotes if lote is not informado and not _valido(lote, hoje)]
+                ordem += [lote for lote in lotes if lote is not informado and _valido(lote, hoje)]
+                baixar(movimentacao, _retirar(ordem, -diferenca)[0])
+            continue
+
+        if movimentacao.tipo in TIPOS_ENTRADA:
+            somar(obter(movimentacao, movimentacao.lote or LOTE_SALDO_INICIAL), quantidade)
+            continue
+
+        if movimentacao.lote:
+            lote = por_numero.get((movimentacao.produto_id, movimentacao.lote))
+            candidatos = [lote] if lote and _valido(lote, hoje) else []
+        else:
+            candidatos = [lote for lote in lotes if _valido(lote, hoje)]
+        retiradas, faltando = _retirar(candidatos, quantidade)
+        if faltando:
+            raise LoteInsuficiente(movimentacao.produto_id, quantidade - faltando, movimentacao.lote or None)
+
+        baixar(movimentacao, retiradas)
+        if len(retiradas) == 1 and not movimentacao.lote:
+            movimentacao.lote = retiradas[0][0].numero_lote
+            movimentacao.data_validade = retiradas[0][0].data_validade
+
+    agora = timezone.now()
+    for lote in alterados.values():
+        lote.updated_at = agora
+    Lote.objects.bulk_create(novos, batch_size=TAMANHO_LOTE)
+    Lote.objects.bulk_update(alterados.values(), ['quantidade', 'updated_at'], batch_size=TAMANHO_LOTE)
+    return alocacoes
+
+
+def gravar_alocacoes(alocacoes):
+    """Grava as alocações depois que as movimentações ganharam id"""
+    if alocacoes:
+        AlocacaoLote.objects.bulk_create(alocacoes, batch_size=TAMANHO_LOTE)
+
+
+def previa_alocacao(itens):
+    """
+    Alocação FEFO de uma cesta [(produto_id, quantidade)], sem gravar
+
+    Uma consulta para todos os produtos. Retorna, na ordem dos itens,
+    (produto_id, quantidade, [(lote, quantidade)], faltando); o mesmo
+    produto repetido na cesta continua de onde o item anterior parou.
+    """
+    hoje = timezone.localdate()
+    lotes = defaultdict(list)
+    for lote in Lote.objects.filter(
+        Q(data_validade__isnull=True) | Q(data_validade__gte=hoje),
+        produto_id__in={produto_id for produto_id, _ in itens},
+        quantidade__gt=0,
+        active=True
+    ).order_by(*ORDEM_FEFO):
+        lotes[lote.produto_id].append(lote)
+
+    resultado = []
+    for produto_id, quantidade in itens:
+        retiradas, faltando = _retirar(lotes[produto_id], quantidade)
+        for lote, usado in retiradas:
+            lote.quantidade -= usado
+        resultado.append((produto_id, quantidade, retiradas, faltando))
+    return resultado
@@ -0,0 +1,31 @@
+"""
+Reprocessa o custo de todo o histórico de movimentações
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.utils import get_tenant_schemas, tenant_context
+from apps.estoque.custos import METODO_MEDIA, METODO_PEPS, atualizar_custos, recalcular_custos
+
+
+class Command(BaseCommand):
+    help = 'Recalcula camadas e custos do estoque a partir das movimentações'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', help='Só este tenant (padrão: todos)')
+        parser.add_argument('--metodo', choices=[METODO_MEDIA, METODO_PEPS], help='Padrão: ESTOQUE_METODO_CUSTO')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Só as movimentações novas, sem descartar o que já foi apurado'
+        )
+
+    def handle(self, *args, **options):
+        schemas = [options['schema']] if options['schema'] else get_tenant_schemas()
+        if options['schema'] and options['schema'] not in get_tenant_schemas():
+            raise CommandError(f"Tenant não encontrado: {options['schema']}")
+
+        processar = atualizar_custos if options['incremental'] else recalcular_custos
+        for schema_name in schemas:
+            with tenant_context(schema_name):
+                total = processar(options['metodo'])
+            self.stdout.write(f'{schema_name or "default"}: {total} movimentações processadas')
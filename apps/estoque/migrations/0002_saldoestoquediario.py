@@ -0,0 +1,34 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0003_auto_20251126_1619'),
+        ('estoque', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoEstoqueDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data')),
+                ('quantidade', models.DecimalField(decimal_places=3, default=0, max_digits=10, verbose_name='Quantidade')),
+                ('custo_unitario', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Custo Unitário')),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor')),
+                ('calculado_em', models.DateTimeField(auto_now=True, verbose_name='Calculado em')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_diarios', to='erp.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Estoque Diário',
+                'verbose_name_plural': 'Saldos de Estoque Diários',
+                'ordering': ['-data', 'produto'],
+                'indexes': [models.Index(fields=['data'], name='estoque_sal_data_e41e55_idx')],
+                'unique_together': {('produto', 'data')},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:05
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def saldos_iniciais(apps, schema_editor):
+    """Estoque atual de cada produto vai para o local padrão"""
+    Produto = apps.get_model('erp', 'Produto')
+    SaldoLocal = apps.get_model('estoque', 'SaldoLocal')
+    SaldoLocal.objects.bulk_create(
+        [
+            SaldoLocal(produto_id=pk, local='Principal', quantidade=estoque)
+            for pk, estoque in Produto.objects.exclude(estoque_atual=0).values_list('pk', 'estoque_atual').iterator()
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0003_auto_20251126_1619'),
+        ('estoque', '0002_saldoestoquediario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoLocal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('local', models.CharField(max_length=100, verbose_name='Local')),
+                ('quantidade', models.DecimalField(decimal_places=3, default=0, max_digits=10, verbose_name='Quantidade')),
+                ('estoque_minimo', models.DecimalField(decimal_places=3, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Estoque Mínimo no Local')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_locais', to='erp.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Saldo por Local',
+                'verbose_name_plural': 'Saldos por Local',
+                'ordering': ['local', 'produto'],
+                'indexes': [models.Index(fields=['local', 'produto'], name='estoque_sal_local_7c5dfa_idx')],
+                'unique_together': {('produto', 'local')},
+            },
+        ),
+        migrations.RunPython(saldos_iniciais, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0003_auto_20251126_1619'),
+        ('estoque', '0003_saldolocal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustoProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.DecimalField(decimal_places=3, default=0, max_digits=10, verbose_name='Quantidade')),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor')),
+                ('custo_unitario', models.DecimalField(decimal_places=4, default=0, max_digits=14, verbose_name='Custo Unitário')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='custo', to='erp.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Custo de Produto',
+                'verbose_name_plural': 'Custos de Produtos',
+                'ordering': ['produto'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustoMovimentacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.DecimalField(decimal_places=3, default=0, max_digits=10, verbose_name='Quantidade')),
+                ('custo_unitario', models.DecimalField(decimal_places=4, default=0, max_digits=14, verbose_name='Custo Unitário')),
+                ('custo_total', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Custo Total')),
+                ('movimentacao', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='custo', to='estoque.movimentacaoestoque', verbose_name='Movimentação')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='custos_movimentacoes', to='erp.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Custo de Movimentação',
+                'verbose_name_plural': 'Custos de Movimentações',
+                'ordering': ['movimentacao'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CamadaCusto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateTimeField(verbose_name='Data')),
+                ('quantidade', models.DecimalField(decimal_places=3, max_digits=10, verbose_name='Quantidade')),
+                ('saldo', models.DecimalField(decimal_places=3, max_digits=10, verbose_name='Saldo')),
+                ('custo_unitario', models.DecimalField(decimal_places=4, max_digits=14, verbose_name='Custo Unitário')),
+                ('movimentacao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='camadas_custo', to='estoque.movimentacaoestoque', verbose_name='Movimentação')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='camadas_custo', to='erp.produto', verbose_name='Produto')),
+            ],
+            options={
+                'verbose_name': 'Camada de Custo',
+                'verbose_name_plural': 'Camadas de Custo',
+                'ordering': ['produto', 'data', 'id'],
+                'indexes': [models.Index(condition=models.Q(('saldo__gt', 0)), fields=['produto', 'data'], name='estoque_camada_aberta_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0004_custos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlocacaoLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.DecimalField(decimal_places=3, max_digits=10, verbose_name='Quantidade')),
+                ('lote', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='alocacoes', to='estoque.lote', verbose_name='Lote')),
+                ('movimentacao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alocacoes_lote', to='estoque.movimentacaoestoque', verbose_name='Movimentação')),
+            ],
+            options={
+                'verbose_name': 'Alocação de Lote',
+                'verbose_name_plural': 'Alocações de Lotes',
+                'ordering': ['movimentacao', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0005_alocacaolote'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='movimentacaoestoque',
+            options={'ordering': ['-data_movimentacao', '-id'], 'verbose_name': 'Movimentação de Estoque', 'verbose_name_plural': 'Movimentações de Estoque'},
+        ),
+        migrations.RemoveIndex(
+            model_name='movimentacaoestoque',
+            name='estoque_mov_produto_345496_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='movimentacaoestoque',
+            name='estoque_mov_tipo_6019ee_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='movimentacaoestoque',
+            name='estoque_mov_data_mo_3d05e9_idx',
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['produto', '-data_movimentacao', '-id'], name='estoque_mov_produto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['tipo', '-data_movimentacao', '-id'], name='estoque_mov_tipo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['documento', '-data_movimentacao', '-id'], name='estoque_mov_documento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['usuario', '-data_movimentacao', '-id'], name='estoque_mov_usuario_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['-data_movimentacao', '-id'], name='estoque_mov_data_idx'),
+        ),
+    ]
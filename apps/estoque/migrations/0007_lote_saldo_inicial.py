@@ -0,0 +1,43 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Sum
+
+LOTE_SALDO_INICIAL = 'SALDO-INICIAL'
+
+
+def saldo_inicial_em_lote(apps, schema_editor):
+    """Estoque dos produtos com controle de lote que ainda não está em lote vai para o lote de saldo inicial"""
+    Produto = apps.get_model('erp', 'Produto')
+    Lote = apps.get_model('estoque', 'Lote')
+    em_lotes = Lote.objects.filter(produto=OuterRef('pk')).values('produto').annotate(total=Sum('quantidade')).values('total')
+    produtos = Produto.objects.filter(controla_lote=True).annotate(
+        em_lotes=Subquery(em_lotes)
+    ).values_list('pk', 'estoque_atual', 'em_lotes')
+
+    novos, alterados = [], []
+    existentes = {
+        lote.produto_id: lote
+        for lote in Lote.objects.filter(produto__controla_lote=True, numero_lote=LOTE_SALDO_INICIAL)
+    }
+    for pk, estoque, em_lotes in produtos.iterator():
+        fora_de_lote = estoque - (em_lotes or 0)
+        if fora_de_lote <= 0:
+            continue
+        lote = existentes.get(pk)
+        if lote is None:
+            novos.append(Lote(produto_id=pk, numero_lote=LOTE_SALDO_INICIAL, quantidade=fora_de_lote))
+        else:
+            lote.quantidade += fora_de_lote
+            alterados.append(lote)
+    Lote.objects.bulk_create(novos, batch_size=500)
+    Lote.objects.bulk_update(alterados, ['quantidade'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0006_movimentacao_keyset'),
+    ]
+
+    operations = [
+        migrations.RunPython(saldo_inicial_em_lote, migrations.RunPython.noop),
+    ]
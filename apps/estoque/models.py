@@ -2,7 +2,7 @@
 Estoque Models - Movimentações, Lotes e Inventário
 """
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from apps.core.models import BaseModel
@@ -102,20 +102,34 @@ class MovimentacaoEstoque(BaseModel):
     class Meta:
         verbose_name = 'Movimentação de Estoque'
         verbose_name_plural = 'Movimentações de Estoque'
-        ordering = ['-data_movimentacao']
+        ordering = ['-data_movimentacao', '-id']
+        # Um índice por filtro da listagem, na ordem da paginação por chave
         indexes = [
-            models.Index(fields=['produto', '-data_movimentacao']),
-            models.Index(fields=['tipo', '-data_movimentacao']),
-            models.Index(fields=['-data_movimentacao']),
+            models.Index(fields=['produto', '-data_movimentacao', '-id'], name='estoque_mov_produto_idx'),
+            models.Index(fields=['tipo', '-data_movimentacao', '-id'], name='estoque_mov_tipo_idx'),
+            models.Index(fields=['documento', '-data_movimentacao', '-id'], name='estoque_mov_documento_idx'),
+            models.Index(fields=['usuario', '-data_movimentacao', '-id'], name='estoque_mov_usuario_idx'),
+            models.Index(fields=['-data_movimentacao', '-id'], name='estoque_mov_data_idx'),
         ]
     
     def __str__(self):
         return f'{self.get_tipo_display()} - {self.produto.nome} - {self.quantidade}'
     
     def save(self, *args, **kwargs):
-        """Calcula valor total"""
+        """Calcula valor total e, na criação, lança o movimento no saldo do produto e nos lotes"""
         self.valor_total = self.quantidade * self.valor_unitario
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+
+        from .lotes import alocar_lotes, gravar_alocacoes
+        from .services import lancar_movimentacao
+
+        with transaction.atomic():
+            lancar_movimentacao(self)
+            alocacoes = alocar_lotes([self])
+            super().save(*args, **kwargs)
+            gravar_alocacoes(alocacoes)
 
 
 class Lote(BaseModel):
@@ -179,6 +193,36 @@ class Lote(BaseModel):
         return None
 
 
+class AlocacaoLote(models.Model):
+    """
+    Quantidade de uma saída retirada de um lote
+
+    Criada pelo lançamento das saídas de produtos que controlam lote, na
+    ordem de validade (ver `lotes.py`).
+    """
+    movimentacao = models.ForeignKey(
+        MovimentacaoEstoque,
+        on_delete=models.CASCADE,
+        related_name='alocacoes_lote',
+        verbose_name='Movimentação'
+    )
+    lote = models.ForeignKey(
+        Lote,
+        on_delete=models.PROTECT,
+        related_name='alocacoes',
+        verbose_name='Lote'
+    )
+    quantidade = models.DecimalField('Quantidade', max_digits=10, decimal_places=3)
+    
+    class Meta:
+        verbose_name = 'Alocação de Lote'
+        verbose_name_plural = 'Alocações de Lotes'
+        ordering = ['movimentacao', 'id']
+    
+    def __str__(self):
+        return f'{self.lote.numero_lote}: {self.quantidade}'
+
+
 class Inventario(BaseModel):
     """
     Inventário de Estoque (Contagem Física)
@@ -278,5 +322,176 @@ class ItemInventario(models.Model):
     def save(self, *args, **kwargs):
         """Calcula diferença e valor"""
         self.diferenca = self.quantidade_contada - self.quantidade_sistema
-        self.valor_diferenca = self.diferenca * self.produto.preco_custo
+        self.valor_diferenca = self.diferenca * self.produto.custo_unitario
         super().save(*args, **kwargs)
+
+
+class SaldoEstoqueDiario(models.Model):
+    """
+    Saldo de um produto ao final de um dia (snapshot)
+
+    Gerado diariamente pelo Celery (`estoque.tasks.gerar_saldos_diarios`).
+    Consultas de posição em uma data partem do snapshot mais próximo e
+    reaplicam só as movimentações posteriores (ver `saldos.py`).
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='saldos_diarios',
+        verbose_name='Produto'
+    )
+    data = models.DateField('Data')
+    quantidade = models.DecimalField('Quantidade', max_digits=10, decimal_places=3, default=0)
+    custo_unitario = models.DecimalField('Custo Unitário', max_digits=10, decimal_places=2, default=0)
+    valor = models.DecimalField('Valor', max_digits=15, decimal_places=2, default=0)
+    calculado_em = models.DateTimeField('Calculado em', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Saldo de Estoque Diário'
+        verbose_name_plural = 'Saldos de Estoque Diários'
+        ordering = ['-data', 'produto']
+        unique_together = ['produto', 'data']
+        indexes = [
+            models.Index(fields=['data']),
+        ]
+    
+    def __str__(self):
+        return f'{self.produto.nome} - {self.data:%d/%m/%Y}: {self.quantidade}'
+
+
+class SaldoLocal(models.Model):
+    """
+    Saldo de um produto em um local (prateleira, depósito, loja)
+
+    Mantido pelo lançamento das movimentações (ver `services.py`):
+    entradas somam em `local_destino`, saídas subtraem de `local_origem`,
+    transferências movem entre os dois. Movimentos sem local usam
+    LOCAL_PADRAO. A soma dos locais acompanha `Produto.estoque_atual`.
+    """
+    LOCAL_PADRAO = 'Principal'
+
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='saldos_locais',
+        verbose_name='Produto'
+    )
+    local = models.CharField('Local', max_length=100)
+    quantidade = models.DecimalField('Quantidade', max_digits=10, decimal_places=3, default=0)
+    estoque_minimo = models.DecimalField(
+        'Estoque Mínimo no Local',
+        max_digits=10,
+        decimal_places=3,
+        default=0,
+        validators=[MinValueValidator(0)]
+    )
+    
+    class Meta:
+        verbose_name = 'Saldo por Local'
+        verbose_name_plural = 'Saldos por Local'
+        ordering = ['local', 'produto']
+        unique_together = ['produto', 'local']
+        indexes = [
+            models.Index(fields=['local', 'produto']),
+        ]
+    
+    def __str__(self):
+        return f'{self.produto.nome} @ {self.local}: {self.quantidade}'
+
+
+class CustoProduto(models.Model):
+    """
+    Valor do estoque de um produto segundo o motor de custos
+
+    Mantido por `custos.atualizar_custos` a partir das movimentações
+    (custo médio ponderado ou PEPS, ver ESTOQUE_METODO_CUSTO).
+    """
+    produto = models.OneToOneField(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='custo',
+        verbose_name='Produto'
+    )
+    quantidade = models.DecimalField('Quantidade', max_digits=10, decimal_places=3, default=0)
+    valor = models.DecimalField('Valor', max_digits=15, decimal_places=2, default=0)
+    custo_unitario = models.DecimalField('Custo Unitário', max_digits=14, decimal_places=4, default=0)
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Custo de Produto'
+        verbose_name_plural = 'Custos de Produtos'
+        ordering = ['produto']
+    
+    def __str__(self):
+        return f'{self.produto.nome}: {self.quantidade} x {self.custo_unitario}'
+
+
+class CamadaCusto(models.Model):
+    """
+    Camada de custo (uma entrada ainda não totalmente consumida)
+
+    Entradas criam camadas; saídas as consomem da mais antiga para a mais
+    nova. Camadas sem movimentação são saldos de abertura.
+    """
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='camadas_custo',
+        verbose_name='Produto'
+    )
+    movimentacao = models.ForeignKey(
+        MovimentacaoEstoque,
+        on_delete=models.CASCADE,
+        related_name='camadas_custo',
+        verbose_name='Movimentação',
+        null=True,
+        blank=True
+    )
+    data = models.DateTimeField('Data')
+    quantidade = models.DecimalField('Quantidade', max_digits=10, decimal_places=3)
+    saldo = models.DecimalField('Saldo', max_digits=10, decimal_places=3)
+    custo_unitario = models.DecimalField('Custo Unitário', max_digits=14, decimal_places=4)
+    
+    class Meta:
+        verbose_name = 'Camada de Custo'
+        verbose_name_plural = 'Camadas de Custo'
+        ordering = ['produto', 'data', 'id']
+        indexes = [
+            models.Index(fields=['produto', 'data'], condition=models.Q(saldo__gt=0), name='estoque_camada_aberta_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.produto.nome} - {self.saldo}/{self.quantidade} x {self.custo_unitario}'
+
+
+class CustoMovimentacao(models.Model):
+    """
+    Custo apurado de uma movimentação
+
+    Toda movimentação processada pelo motor de custos ganha um registro;
+    as que ainda não têm são as processadas na próxima execução.
+    `custo_total` é o valor que entrou (entradas) ou saiu (saídas) do estoque.
+    """
+    movimentacao = models.OneToOneField(
+        MovimentacaoEstoque,
+        on_delete=models.CASCADE,
+        related_name='custo',
+        verbose_name='Movimentação'
+    )
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.CASCADE,
+        related_name='custos_movimentacoes',
+        verbose_name='Produto'
+    )
+    quantidade = models.DecimalField('Quantidade', max_digits=10, decimal_places=3, default=0)
+    custo_unitario = models.DecimalField('Custo Unitário', max_digits=14, decimal_places=4, default=0)
+    custo_total = models.DecimalField('Custo Total', max_digits=15, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = 'Custo de Movimentação'
+        verbose_name_plural = 'Custos de Movimentações'
+        ordering = ['movimentacao']
+    
+    def __str__(self):
+        return f'{self.movimentacao_id}: {self.custo_total}'
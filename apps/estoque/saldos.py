@@ -0,0 +1,236 @@
+"""
+Posição de estoque em uma data
+
+O saldo de cada produto ao final do dia é materializado em
+SaldoEstoqueDiario (task noturna). Uma consulta "qual era o estoque em X"
+parte do snapshot mais próximo:
+
+- snapshot anterior a X: reaplica as movimentações entre ele e o fim de X
+- senão, snapshot posterior (ou o estoque atual): o saldo em X é a
+  `quantidade_anterior` da primeira movimentação depois de X
+
+Assim só as movimentações da janela são lidas, nunca o histórico inteiro.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.erp.models import Produto
+from .models import MovimentacaoEstoque, SaldoEstoqueDiario, SaldoLocal
+from .services import TAMANHO_LOTE, calcular_saldo
+
+CENTAVOS = Decimal('0.01')
+
+
+def fim_do_dia(data):
+    """Primeiro instante do dia seguinte (limite exclusivo)"""
+    return timezone.make_aware(datetime.combine(data + timedelta(days=1), time.min))
+
+
+def _movimentacoes(inicio, fim, produto_id=None):
+    queryset = MovimentacaoEstoque.objects.filter(data_movimentacao__gte=inicio)
+    if fim is not None:
+        queryset = queryset.filter(data_movimentacao__lt=fim)
+    if produto_id is not None:
+        queryset = queryset.filter(produto_id=produto_id)
+    return queryset.order_by('produto_id', 'data_movimentacao', 'pk')
+
+
+def _reaplicar(saldos, inicio, fim, produto_id=None):
+    """Aplica aos saldos as movimentações de [inicio, fim)"""
+    movimentacoes = _movimentacoes(inicio, fim, produto_id).values_list(
+        'produto_id', 'tipo', 'quantidade'
+    )
+    for pk, tipo, quantidade in movimentacoes.iterator(chunk_size=TAMANHO_LOTE):
+        saldos[pk] = calcular_saldo(tipo, saldos.get(pk, Decimal('0')), quantidade)
+    return saldos
+
+
+def _retroceder(saldos, inicio, fim, produto_id=None):
+    """
+    Saldos no instante `inicio` a partir dos saldos em `fim`
+
+    Para quem movimentou em [inicio, fim), o saldo em `inicio` é a
+    quantidade anterior da primeira dessas movimentações.
+    """
+    movimentacoes = _movimentacoes(inicio, fim, produto_id).values_list(
+        'produto_id', 'quantidade_anterior'
+    )
+    vistos = set()
+    for pk, anterior in movimentacoes.iterator(chunk_size=TAMANHO_LOTE):
+        if pk not in vistos:
+            vistos.add(pk)
+            saldos[pk] = anterior
+    return saldos
+
+
+def _snapshot(data, produto_id=None):
+    queryset = SaldoEstoqueDiario.objects.filter(data=data)
+    if produto_id is not None:
+        queryset = queryset.filter(produto_id=produto_id)
+    saldos, custos = {}, {}
+    for pk, quantidade, custo in queryset.values_list('produto_id', 'quantidade', 'custo_unitario'):
+        saldos[pk] = quantidade
+        custos[pk] = custo
+    return saldos, custos
+
+
+def _estoque_atual(produtos):
+    return dict(produtos.values_list('pk', 'estoque_atual'))
+
+
+def saldos_em(data, produto_id=None):
+    """
+    Saldos ao final de `data`: ({produto_id: quantidade}, {produto_id: custo}, data_base)
+
+    `data_base` é a data do snapshot usado (None = estoque atual).
+    """
+    snapshots = SaldoEstoqueDiario.objects.all()
+    if produto_id is not None:
+        snapshots = snapshots.filter(produto_id=produto_id)
+    datas = snapshots.aggregate(
+        anterior=Max('data', filter=Q(data__lte=data)),
+        posterior=Min('data', filter=Q(data__gt=data))
+    )
+    fim = fim_do_dia(data)
+
+    if datas['anterior'] is not None:
+        base = datas['anterior']
+        saldos, custos = _snapshot(base, produto_id)
+        if base < data:
+            _reaplicar(saldos, fim_do_dia(base), fim, produto_id)
+        return saldos, custos, base
+
+    if datas['posterior'] is not None:
+        base = datas['posterior']
+        saldos, custos = _snapshot(base, produto_id)
+        _retroceder(saldos, fim, fim_do_dia(base), produto_id)
+        return saldos, custos, base
+
+    produtos = Produto.objects.filter(tipo='produto')
+    if produto_id is not None:
+        produtos = produtos.filter(pk=produto_id)
+    saldos = _retroceder(_estoque_atual(produtos), fim, None, produto_id)
+    return saldos, {}, None
+
+
+def posicao_em(data, produto_id=None):
+    """
+    Posição de estoque (quantidade e valor por produto) ao final de `data`
+
+    Só entram produtos com saldo. O custo é o do snapshot usado; sem
+    snapshot, o custo atual (motor de custos).
+    """
+    saldos, custos, base = saldos_em(data, produto_id)
+    com_saldo = [pk for pk, quantidade in saldos.items() if quantidade]
+
+    linhas = []
+    produtos = Produto.objects.filter(tipo='produto', pk__in=com_saldo).order_by('nome')
+    for pk, codigo, nome, custo_atual in produtos.values_list(
+        'pk', 'codigo_interno', 'nome', _custo_unitario('')
+    ):
+        quantidade = saldos[pk]
+        custo = custos.get(pk, custo_atual)
+        linhas.append({
+            'id': pk,
+            'codigo_interno': codigo,
+            'nome': nome,
+            'quantidade': quantidade,
+            'custo_unitario': custo,
+            'valor': (quantidade * custo).quantize(CENTAVOS),
+        })
+    return base, linhas
+
+
+CAMPOS_POSICAO = [
+    'id', 'codigo_interno', 'nome', 'estoque_atual', 'estoque_minimo', 'custo_unitario', 'valor_estoque'
+]
+
+
+def _base_posicao(categoria=None, local=None):
+    """(queryset, prefixo dos campos do produto, campo de quantidade, campo de mínimo)"""
+    if local:
+        queryset = SaldoLocal.objects.filter(
+            local=local, produto__active=True, produto__tipo='produto'
+        ).exclude(quantidade=0)
+        prefixo, quantidade = 'produto__', 'quantidade'
+    else:
+        queryset = Produto.objects.filter(active=True, tipo='produto')
+        prefixo, quantidade = '', 'estoque_atual'
+    if categoria:
+        queryset = queryset.filter(**{f'{prefixo}categoria_id': categoria})
+    return queryset, prefixo, quantidade, 'estoque_minimo'
+
+
+def _custo_unitario(prefixo):
+    """Custo do motor de custos; produtos ainda não apurados usam o preço de custo"""
+    return Coalesce(F(f'{prefixo}custo__custo_unitario'), F(f'{prefixo}preco_custo'))
+
+
+def _valor(prefixo, quantidade):
+    return ExpressionWrapper(
+        F(quantidade) * _custo_unitario(prefixo),
+        output_field=DecimalField(max_digits=20, decimal_places=5)
+    )
+
+
+def posicao_atual(categoria=None, local=None, apos=None):
+    """
+    Posição atual em values_list na ordem de CAMPOS_POSICAO, por id de produto
+
+    Com `local`, a quantidade e o mínimo são os do local (SaldoLocal).
+    `apos` é o cursor da paginação por chave (último id já lido).
+    """
+    queryset, prefixo, quantidade, minimo = _base_posicao(categoria, local)
+    chave = 'produto_id' if local else 'id'
+    if apos is not None:
+        queryset = queryset.filter(**{f'{chave}__gt': apos})
+    return queryset.order_by(chave).values_list(
+        chave, f'{prefixo}codigo_interno', f'{prefixo}nome', quantidade, minimo,
+        _custo_unitario(prefixo), _valor(prefixo, quantidade)
+    )
+
+
+def totais_posicao(categoria=None, local=None):
+    """Totais da posição atual em um único aggregate"""
+    queryset, prefixo, quantidade, _ = _base_posicao(categoria, local)
+    return queryset.aggregate(
+        total_produtos=Count('pk'),
+        quantidade_total=Sum(quantidade, default=0),
+        valor_total_estoque=Sum(_valor(prefixo, quantidade), default=0)
+    )
+
+
+def gerar_saldos(data):
+    """
+    Grava (ou regrava) o snapshot do fim de `data`
+
+    Parte do estoque atual e retrocede pelas movimentações posteriores;
+    para a task noturna (data = ontem) são só as movimentações de hoje.
+    Produtos com saldo zero não são gravados.
+    """
+    produtos = Produto.objects.filter(tipo='produto')
+    saldos = _retroceder(_estoque_atual(produtos), fim_do_dia(data), None)
+    custos = dict(produtos.values_list('pk', _custo_unitario('')))
+
+    linhas = [
+        SaldoEstoqueDiario(
+            produto_id=pk,
+            data=data,
+            quantidade=quantidade,
+            custo_unitario=custos[pk].quantize(CENTAVOS),
+            valor=(quantidade * custos[pk]).quantize(CENTAVOS)
+        )
+        for pk, quantidade in saldos.items()
+        if quantidade and pk in custos
+    ]
+
+    with transaction.atomic():
+        SaldoEstoqueDiario.objects.filter(data=data).delete()
+        SaldoEstoqueDiario.objects.bulk_create(linhas, batch_size=TAMANHO_LOTE)
+    return len(linhas)
@@ -5,6 +5,8 @@ Serializers for Estoque models
 from rest_framework import serializers
 from django.utils import timezone
 from .models import MovimentacaoEstoque, Lote, Inventario, ItemInventario
+from .services import EstoqueInsuficiente
+from apps.erp.models import Produto
 from apps.erp.serializers import ProdutoListSerializer
 
 
@@ -34,7 +36,10 @@ class MovimentacaoEstoqueSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Add current user to the movement"""
         validated_data['usuario'] = self.context['request'].user
-        return super().create(validated_data)
+        try:
+            return super().create(validated_data)
+        except EstoqueInsuficiente as e:
+            raise serializers.ValidationError({'quantidade': str(e)})
 
 
 class MovimentacaoEstoqueListSerializer(serializers.ModelSerializer):
@@ -73,6 +78,8 @@ class LoteSerializer(serializers.ModelSerializer):
 class ItemInventarioSerializer(serializers.ModelSerializer):
     """Serializer for ItemInventario"""
     
+    # valor_diferenca usa o custo do produto: vem junto, sem uma consulta a mais
+    produto = serializers.PrimaryKeyRelatedField(queryset=Produto.objects.select_related('custo'))
     produto_nome = serializers.CharField(source='produto.nome', read_only=True)
     produto_codigo = serializers.CharField(source='produto.codigo_interno', read_only=True)
     
@@ -86,6 +93,22 @@ class ItemInventarioSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'diferenca', 'valor_diferenca']
 
 
+class LeituraInventarioSerializer(serializers.Serializer):
+    """Uma leitura do coletor: código de barras ou código interno"""
+    
+    codigo = serializers.CharField(max_length=50)
+    quantidade = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0, default=1)
+
+
+class LeiturasInventarioSerializer(serializers.Serializer):
+    """Serializer for batched inventory scans"""
+    
+    MAX_LEITURAS = 10000
+    
+    leituras = LeituraInventarioSerializer(many=True, allow_empty=False, max_length=MAX_LEITURAS)
+    modo = serializers.ChoiceField(choices=['somar', 'substituir'], default='somar')
+
+
 class InventarioSerializer(serializers.ModelSerializer):
     """Serializer for Inventario"""
     
@@ -149,6 +172,7 @@ class SaidaEstoqueSerializer(serializers.Serializer):
     quantidade = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0.001)
     motivo = serializers.CharField(max_length=200, required=False, allow_blank=True)
     documento_numero = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    lote = serializers.CharField(max_length=50, required=False, allow_blank=True)
 
 
 class AjusteEstoqueSerializer(serializers.Serializer):
@@ -159,6 +183,53 @@ class AjusteEstoqueSerializer(serializers.Serializer):
     motivo = serializers.CharField(max_length=200)
 
 
+class MovimentacaoLoteItemSerializer(serializers.Serializer):
+    """Uma movimentação do lote (produto por id, sem consulta por item)"""
+    
+    produto = serializers.IntegerField()
+    tipo = serializers.ChoiceField(choices=MovimentacaoEstoque.TIPO_CHOICES)
+    quantidade = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0)
+    valor_unitario = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+    motivo = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    documento = serializers.ChoiceField(choices=MovimentacaoEstoque.DOCUMENTO_CHOICES, required=False, allow_blank=True)
+    documento_numero = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    lote = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    data_validade = serializers.DateField(required=False, allow_null=True)
+    observacoes = serializers.CharField(required=False, allow_blank=True)
+
+
+class MovimentacaoLoteSerializer(serializers.Serializer):
+    """Serializer for bulk stock movements"""
+    
+    MAX_MOVIMENTACOES = 5000
+    
+    movimentacoes = MovimentacaoLoteItemSerializer(many=True, allow_empty=False, max_length=MAX_MOVIMENTACOES)
+    
+    def validate_movimentacoes(self, value):
+        """Confere todos os produtos em uma consulta"""
+        ids = {item['produto'] for item in value}
+        existentes = set(Produto.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        faltando = ids - existentes
+        if faltando:
+            raise serializers.ValidationError(f'Produtos inexistentes: {sorted(faltando)}')
+        return value
+
+
+class AlocacaoItemSerializer(serializers.Serializer):
+    """Item da cesta para a prévia de alocação de lotes"""
+    
+    produto = serializers.IntegerField()
+    quantidade = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0.001)
+
+
+class AlocacaoLotesSerializer(serializers.Serializer):
+    """Serializer for lot allocation preview"""
+    
+    MAX_ITENS = 500
+    
+    itens = AlocacaoItemSerializer(many=True, allow_empty=False, max_length=MAX_ITENS)
+
+
 class TransferenciaEstoqueSerializer(serializers.Serializer):
     """Serializer for stock transfer"""
     
@@ -167,3 +238,8 @@ class TransferenciaEstoqueSerializer(serializers.Serializer):
     local_origem = serializers.CharField(max_length=100)
     local_destino = serializers.CharField(max_length=100)
     motivo = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    
+    def validate(self, data):
+        if data['local_origem'] == data['local_destino']:
+            raise serializers.ValidationError('Local de origem e destino devem ser diferentes')
+        return data
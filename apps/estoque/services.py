@@ -0,0 +1,378 @@
+"""
+Lançamento de movimentações no estoque
+
+Todo movimento passa por `lancar_movimentacao`, chamado por
+`MovimentacaoEstoque.save()` na criação: o saldo do produto é alterado no
+banco (sem ler-modificar-salvar em Python) e a movimentação é inserida já
+com `quantidade_anterior`/`quantidade_nova`, na mesma transação.
+
+- entrada/saída: um único UPDATE relativo com RETURNING do saldo novo; a
+  saída só é aplicada se houver saldo (`estoque_atual >= quantidade`),
+  então vendas concorrentes do mesmo produto nunca deixam o saldo negativo
+- ajuste/inventário: a linha do produto é travada (select_for_update) e
+  recebe o valor absoluto
+- transferência: não altera o saldo total, só os saldos por local
+
+Cada movimento também atualiza SaldoLocal com UPDATE relativo (F()); a
+transferência só sai do local de origem se houver saldo nele. Produtos que
+controlam lote também têm os lotes movimentados (ver `lotes.py`).
+
+Lotes (NF grande, inventário) usam `lancar_movimentacoes`: os saldos são
+travados e calculados em memória, aplicados com um UPDATE ... FROM (VALUES)
+por lote de produtos, e as movimentações entram com bulk_create. Como
+bulk_create não dispara post_save, o sinal `movimentacoes_lancadas` avisa
+quem depende das movimentações (ex.: cache de relatórios).
+
+Os UPDATEs de saldo também avançam `Produto.updated_at`, que é a marca
+d'água do delta de produtos baixado pelos PDVs.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.erp.models import Produto
+from .models import SaldoLocal
+from .signals import movimentacoes_lancadas
+
+TIPOS_ENTRADA = ('entrada',)
+TIPOS_SAIDA = ('saida',)
+TIPOS_ABSOLUTOS = ('ajuste', 'inventario')
+
+CASAS_QUANTIDADE = Decimal('0.001')
+
+# Linhas por UPDATE/INSERT em lote (2 parâmetros por produto no VALUES)
+TAMANHO_LOTE = 500
+
+
+class EstoqueInsuficiente(Exception):
+    """Saída maior que o saldo disponível do produto (ou do local)"""
+
+    def __init__(self, produto_id, disponivel, local=None):
+        self.produto_id = produto_id
+        self.disponivel = disponivel
+        self.local = local
+        onde = f' em {local}' if local else ''
+        super().__init__(f'Estoque insuficiente{onde}. Disponível: {disponivel}')
+
+
+def _quantidade(valor):
+    return Decimal(str(valor)).quantize(CASAS_QUANTIDADE)
+
+
+def _suporta_update_returning():
+    # PostgreSQL e SQLite >= 3.35 aceitam UPDATE ... RETURNING
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _suporta_update_from():
+    # PostgreSQL e SQLite >= 3.33 aceitam UPDATE ... FROM (VALUES ...)
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def _agora_db():
+    """Agora, já convertido para parâmetro de SQL cru (updated_at)"""
+    return connection.ops.adapt_datetimefield_value(timezone.now())
+
+
+def _saldo_atual(produto_id, travar=False):
+    queryset = Produto.objects.filter(pk=produto_id)
+    if travar:
+        queryset = queryset.select_for_update()
+    return _quantidade(queryset.values_list('estoque_atual', flat=True).get())
+
+
+def _aplicar_delta(produto_id, delta, exigir_saldo):
+    """
+    Soma `delta` ao saldo e retorna o saldo novo, ou None se a saída
+    deixaria o saldo negativo
+    """
+    if _suporta_update_returning():
+        tabela = connection.ops.quote_name(Produto._meta.db_table)
+        coluna = connection.ops.quote_name('estoque_atual')
+        atualizado = connection.ops.quote_name('updated_at')
+        pk = connection.ops.quote_name(Produto._meta.pk.column)
+        condicao = f' AND {coluna} >= %s' if exigir_saldo else ''
+        params = [delta, _agora_db(), produto_id] + ([-delta] if exigir_saldo else [])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {tabela} SET {coluna} = {coluna} + %s, {atualizado} = %s '
+                f'WHERE {pk} = %s{condicao} RETURNING {coluna}',
+                params
+            )
+            linha = cursor.fetchone()
+        return _quantidade(linha[0]) if linha else None
+
+    # Demais bancos: trava a linha, depois UPDATE relativo
+    saldo = _saldo_atual(produto_id, travar=True)
+    if exigir_saldo and saldo + delta < 0:
+        return None
+    Produto.objects.filter(pk=produto_id).update(
+        estoque_atual=F('estoque_atual') + delta, updated_at=timezone.now()
+    )
+    return saldo + delta
+
+
+def calcular_saldo(tipo, anterior, quantidade):
+    """Saldo após aplicar uma movimentação a `anterior`"""
+    if tipo in TIPOS_ENTRADA:
+        return anterior + quantidade
+    if tipo in TIPOS_SAIDA:
+        return anterior - quantidade
+    if tipo in TIPOS_ABSOLUTOS:
+        return quantidade
+    return anterior
+
+
+def deltas_locais(movimentacao):
+    """
+    Variações nos saldos por local: [(local, delta, exige_saldo)]
+
+    Usa quantidade_anterior/quantidade_nova já calculadas.
+    """
+    quantidade = _quantidade(movimentacao.quantidade)
+    origem = movimentacao.local_origem or SaldoLocal.LOCAL_PADRAO
+    destino = movimentacao.local_destino or SaldoLocal.LOCAL_PADRAO
+
+    if movimentacao.tipo == 'transferencia':
+        if origem == destino:
+            return []
+        return [(origem, -quantidade, True), (destino, quantidade, False)]
+    if movimentacao.tipo in TIPOS_SAIDA:
+        return [(origem, -quantidade, False)]
+
+    # entrada, ajuste e inventário: a variação do produto vai para o destino
+    delta = _quantidade(movimentacao.quantidade_nova) - _quantidade(movimentacao.quantidade_anterior)
+    local = movimentacao.local_destino or movimentacao.local_origem or SaldoLocal.LOCAL_PADRAO
+    return [(local, delta, False)] if delta else []
+
+
+def _aplicar_local(produto_id, local, delta, exigir_saldo):
+    saldo = SaldoLocal.objects.filter(produto_id=produto_id, local=local)
+    if exigir_saldo:
+        if not saldo.filter(quantidade__gte=-delta).update(quantidade=F('quantidade') + delta):
+            disponivel = saldo.values_list('quantidade', flat=True).first() or Decimal('0')
+            raise EstoqueInsuficiente(produto_id, disponivel, local)
+        return
+
+    # Caso comum: o saldo do local já existe (1 UPDATE)
+    if not saldo.update(quantidade=F('quantidade') + delta):
+        SaldoLocal.objects.bulk_create(
+            [SaldoLocal(produto_id=produto_id, local=local)], ignore_conflicts=True
+        )
+        saldo.update(quantidade=F('quantidade') + delta)
+
+
+def lancar_movimentacao(movimentacao):
+    """
+    Aplica uma movimentação ainda não salva ao saldo do produto
+
+    Preenche `quantidade_anterior` e `quantidade_nova`; deve rodar na mesma
+    transação do INSERT da movimentação. Levanta EstoqueInsuficiente.
+    """
+    produto_id = movimentacao.produto_id
+    quantidade = _quantidade(movimentacao.quantidade)
+
+    if movimentacao.tipo in TIPOS_ENTRADA or movimentacao.tipo in TIPOS_SAIDA:
+        saida = movimentacao.tipo in TIPOS_SAIDA
+        delta = -quantidade if saida else quantidade
+        nova = _aplicar_delta(produto_id, delta, exigir_saldo=saida)
+        if nova is None:
+            raise EstoqueInsuficiente(produto_id, _saldo_atual(produto_id))
+        anterior = nova - delta
+
+    elif movimentacao.tipo in TIPOS_ABSOLUTOS:
+        anterior = _saldo_atual(produto_id, travar=True)
+        nova = calcular_saldo(movimentacao.tipo, anterior, quantidade)
+        Produto.objects.filter(pk=produto_id).update(estoque_atual=nova, updated_at=timezone.now())
+
+    else:
+        anterior = nova = _saldo_atual(produto_id)
+
+    movimentacao.quantidade_anterior = anterior
+    movimentacao.quantidade_nova = nova
+
+    for local, delta, exigir_saldo in deltas_locais(movimentacao):
+        _aplicar_local(produto_id, local, delta, exigir_saldo)
+    return movimentacao
+
+
+def registrar_movimentacao(produto, tipo, quantidade, usuario, **campos):
+    """Cria e lança uma movimentação de estoque"""
+    from .models import MovimentacaoEstoque
+
+    movimentacao = MovimentacaoEstoque(
+        produto=produto,
+        tipo=tipo,
+        quantidade=quantidade,
+        usuario=usuario,
+        **campos
+    )
+    movimentacao.save()
+    return movimentacao
+
+
+def _travar_saldos(produto_ids):
+    """Saldos dos produtos, travando as linhas em ordem de pk"""
+    saldos = {}
+    for inicio in range(0, len(produto_ids), TAMANHO_LOTE):
+        linhas = Produto.objects.select_for_update().filter(
+            pk__in=produto_ids[inicio:inicio + TAMANHO_LOTE]
+        ).order_by('pk').values_list('pk', 'estoque_atual')
+        saldos.update((pk, _quantidade(saldo)) for pk, saldo in linhas)
+
+    faltando = set(produto_ids) - set(saldos)
+    if faltando:
+        raise Produto.DoesNotExist(f'Produtos inexistentes: {sorted(faltando)}')
+    return saldos
+
+
+def _aplicar_deltas(deltas):
+    """Soma {produto_id: delta} aos saldos, um UPDATE por lote"""
+    itens = list(deltas.items())
+
+    if not _suporta_update_from():
+        agora = timezone.now()
+        for produto_id, delta in itens:
+            Produto.objects.filter(pk=produto_id).update(estoque_atual=F('estoque_atual') + delta, updated_at=agora)
+        return
+
+    tabela = connection.ops.quote_name(Produto._meta.db_table)
+    coluna = connection.ops.quote_name('estoque_atual')
+    atualizado = connection.ops.quote_name('updated_at')
+    pk = connection.ops.quote_name(Produto._meta.pk.column)
+    agora = _agora_db()
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(itens), TAMANHO_LOTE):
+            lote = itens[inicio:inicio + TAMANHO_LOTE]
+            valores = ', '.join(['(%s, %s)'] * len(lote))
+            cursor.execute(
+                f'UPDATE {tabela} SET {coluna} = {tabela}.{coluna} + v.column2, {atualizado} = %s '
+                f'FROM (VALUES {valores}) AS v WHERE {tabela}.{pk} = v.column1',
+                [agora] + [valor for par in lote for valor in par]
+            )
+
+
+def _travar_saldos_locais(pares):
+    """Saldos {(produto_id, local): quantidade} dos pares, travando as linhas"""
+    produto_ids = sorted({produto_id for produto_id, _ in pares})
+    locais = {local for _, local in pares}
+    saldos = {}
+    for inicio in range(0, len(produto_ids), TAMANHO_LOTE):
+        linhas = SaldoLocal.objects.select_for_update().filter(
+            produto_id__in=produto_ids[inicio:inicio + TAMANHO_LOTE],
+            local__in=locais
+        ).order_by('produto_id', 'local').values_list('produto_id', 'local', 'quantidade')
+        saldos.update(
+            ((produto_id, local), quantidade)
+            for produto_id, local, quantidade in linhas
+            if (produto_id, local) in pares
+        )
+    return saldos
+
+
+def _aplicar_deltas_locais(deltas):
+    """Soma {(produto_id, local): delta} aos saldos por local, um UPDATE por lote"""
+    SaldoLocal.objects.bulk_create(
+        [SaldoLocal(produto_id=produto_id, local=local) for produto_id, local in deltas],
+        ignore_conflicts=True,
+        batch_size=TAMANHO_LOTE
+    )
+    itens = [(produto_id, local, delta) for (produto_id, local), delta in deltas.items()]
+
+    if not _suporta_update_from():
+        for produto_id, local, delta in itens:
+            SaldoLocal.objects.filter(produto_id=produto_id, local=local).update(
+                quantidade=F('quantidade') + delta
+            )
+        return
+
+    tabela = connection.ops.quote_name(SaldoLocal._meta.db_table)
+    quantidade = connection.ops.quote_name('quantidade')
+    produto = connection.ops.quote_name('produto_id')
+    local = connection.ops.quote_name('local')
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(itens), TAMANHO_LOTE):
+            lote = itens[inicio:inicio + TAMANHO_LOTE]
+            valores = ', '.join(['(%s, %s, %s)'] * len(lote))
+            cursor.execute(
+                f'UPDATE {tabela} SET {quantidade} = {tabela}.{quantidade} + v.column3 '
+                f'FROM (VALUES {valores}) AS v '
+                f'WHERE {tabela}.{produto} = v.column1 AND {tabela}.{local} = v.column2',
+                [valor for linha in lote for valor in linha]
+            )
+
+
+def _lancar_locais(movimentacoes):
+    """Saldos por local de um lote já calculado (quantidade_anterior/nova)"""
+    variacoes = [
+        (movimentacao.produto_id, local, delta, exigir_saldo)
+        for movimentacao in movimentacoes
+        for local, delta, exigir_saldo in deltas_locais(movimentacao)
+    ]
+    # Só as origens de transferência precisam do saldo atual do local
+    conferidos = _travar_saldos_locais({
+        (produto_id, local) for produto_id, local, _, exigir_saldo in variacoes if exigir_saldo
+    })
+
+    deltas = defaultdict(Decimal)
+    for produto_id, local, delta, exigir_saldo in variacoes:
+        chave = (produto_id, local)
+        if exigir_saldo or chave in conferidos:
+            disponivel = conferidos.get(chave, Decimal('0'))
+            if exigir_saldo and disponivel + delta < 0:
+                raise EstoqueInsuficiente(produto_id, disponivel, local)
+            conferidos[chave] = disponivel + delta
+        deltas[chave] += delta
+
+    _aplicar_deltas_locais({chave: delta for chave, delta in deltas.items() if delta})
+
+
+def lancar_movimentacoes(movimentacoes):
+    """
+    Lança uma lista de movimentações não salvas de uma só vez
+
+    As movimentações são aplicadas na ordem recebida (vários movimentos do
+    mesmo produto encadeiam `quantidade_anterior`/`quantidade_nova`). Tudo
+    ou nada: uma saída sem saldo levanta EstoqueInsuficiente e nada é gravado.
+    """
+    from .lotes import alocar_lotes, gravar_alocacoes
+    from .models import MovimentacaoEstoque
+
+    if not movimentacoes:
+        return []
+
+    produto_ids = sorted({m.produto_id for m in movimentacoes})
+
+    with transaction.atomic():
+        saldos = _travar_saldos(produto_ids)
+        iniciais = dict(saldos)
+
+        for movimentacao in movimentacoes:
+            quantidade = _quantidade(movimentacao.quantidade)
+            anterior = saldos[movimentacao.produto_id]
+            nova = calcular_saldo(movimentacao.tipo, anterior, quantidade)
+            if nova < 0:
+                raise EstoqueInsuficiente(movimentacao.produto_id, anterior)
+
+            saldos[movimentacao.produto_id] = nova
+            movimentacao.quantidade_anterior = anterior
+            movimentacao.quantidade_nova = nova
+            # bulk_create não passa pelo save()
+            movimentacao.valor_total = movimentacao.quantidade * movimentacao.valor_unitario
+
+        _aplicar_deltas({
+            pk: saldos[pk] - iniciais[pk]
+            for pk in produto_ids
+            if saldos[pk] != iniciais[pk]
+        })
+        _lancar_locais(movimentacoes)
+        alocacoes = alocar_lotes(movimentacoes)
+        criadas = MovimentacaoEstoque.objects.bulk_create(movimentacoes, batch_size=TAMANHO_LOTE)
+        gravar_alocacoes(alocacoes)
+        movimentacoes_lancadas.send(sender=MovimentacaoEstoque, movimentacoes=criadas)
+
+    return criadas
@@ -0,0 +1,56 @@
+"""
+Celery tasks for Estoque app
+"""
+
+import logging
+from datetime import date, timedelta
+
+from celery import shared_task
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.core.utils import get_tenant_schemas, tenant_context
+from .custos import atualizar_custos
+from .saldos import gerar_saldos
+
+logger = logging.getLogger(__name__)
+
+# Trava contra execuções sobrepostas da apuração de custos (segundos)
+CUSTOS_TRAVA = 'estoque:custos:trava'
+CUSTOS_TRAVA_TIMEOUT = 60 * 60
+
+
+@shared_task(ignore_result=True)
+def gerar_saldos_diarios(data=None):
+    """
+    Grava o snapshot de saldos do fim do dia (padrão: ontem) de todos os tenants
+    """
+    data = date.fromisoformat(data) if data else timezone.localdate() - timedelta(days=1)
+    for schema_name in get_tenant_schemas():
+        try:
+            with tenant_context(schema_name):
+                gerar_saldos(data)
+        except Exception:
+            logger.exception('Falha ao gerar os saldos de %s (%s)', data, schema_name)
+
+
+@shared_task(ignore_result=True)
+def atualizar_custos_estoque():
+    """
+    Apura o custo das movimentações novas de todos os tenants
+
+    Uma execução por vez (duas gravariam o custo da mesma movimentação);
+    a falha de um tenant não impede os demais.
+    """
+    if not cache.add(CUSTOS_TRAVA, True, CUSTOS_TRAVA_TIMEOUT):
+        logger.info('Apuração de custos já em andamento, execução ignorada')
+        return
+    try:
+        for schema_name in get_tenant_schemas():
+            try:
+                with tenant_context(schema_name):
+                    atualizar_custos()
+            except Exception:
+                logger.exception('Falha ao apurar custos (%s)', schema_name)
+    finally:
+        cache.delete(CUSTOS_TRAVA)
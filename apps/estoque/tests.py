@@ -2,12 +2,34 @@
 Tests for Estoque app
 """
 
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.utils import timezone
 from apps.accounts.models import Tenant, Domain
 from apps.erp.models import Produto, Categoria
-from .models import MovimentacaoEstoque, Lote, Inventario, ItemInventario
+from rest_framework.test import APIClient
+from .contagem import InventarioEncerrado, registrar_leituras
+from .custos import METODO_MEDIA, METODO_PEPS, _Processamento, atualizar_custos
+from .lotes import LOTE_SALDO_INICIAL, LoteInsuficiente, previa_alocacao
+from .models import (
+    MovimentacaoEstoque, Lote, Inventario, ItemInventario, SaldoEstoqueDiario, SaldoLocal,
+    CamadaCusto, CustoMovimentacao, CustoProduto, AlocacaoLote
+)
+from .saldos import CAMPOS_POSICAO, gerar_saldos, posicao_em, saldos_em
+from .services import EstoqueInsuficiente, lancar_movimentacoes, registrar_movimentacao
+from .tasks import atualizar_custos_estoque, gerar_saldos_diarios
+from .views import EstoqueViewSet, InventarioViewSet
 
 User = get_user_model()
 
@@ -185,3 +207,930 @@ class InventarioTest(TestCase):
         
         self.assertEqual(self.inventario.total_itens, 2)
         self.assertEqual(self.inventario.total_diferencas, 2)
+
+
+class LancamentoEstoqueTest(TestCase):
+    """Lançamento atômico das movimentações no saldo do produto"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.produto = Produto.objects.create(
+            nome='Produto Teste',
+            codigo_interno='TEST001',
+            preco_custo=10.00,
+            preco_venda=15.00,
+            estoque_atual=10
+        )
+
+    def test_quantidades_anterior_e_nova(self):
+        entrada = registrar_movimentacao(self.produto, 'entrada', 5, self.user)
+        saida = registrar_movimentacao(self.produto, 'saida', Decimal('2.5'), self.user)
+
+        entrada.refresh_from_db()
+        saida.refresh_from_db()
+        self.assertEqual((entrada.quantidade_anterior, entrada.quantidade_nova), (10, 15))
+        self.assertEqual((saida.quantidade_anterior, saida.quantidade_nova), (15, Decimal('12.5')))
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, Decimal('12.5'))
+
+    def test_instancias_desatualizadas_nao_perdem_baixa(self):
+        """Duas baixas a partir do mesmo objeto em memória (antes: lost update)"""
+        caixa_1 = Produto.objects.get(pk=self.produto.pk)
+        caixa_2 = Produto.objects.get(pk=self.produto.pk)
+
+        registrar_movimentacao(caixa_1, 'saida', 3, self.user)
+        registrar_movimentacao(caixa_2, 'saida', 4, self.user)
+
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 3)
+
+    def test_saida_sem_saldo(self):
+        with self.assertRaises(EstoqueInsuficiente):
+            registrar_movimentacao(self.produto, 'saida', 11, self.user)
+
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 10)
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_inventario_e_transferencia(self):
+        inventario = registrar_movimentacao(self.produto, 'inventario', 7, self.user)
+        transferencia = registrar_movimentacao(self.produto, 'transferencia', 2, self.user)
+
+        self.assertEqual((inventario.quantidade_anterior, inventario.quantidade_nova), (10, 7))
+        self.assertEqual((transferencia.quantidade_anterior, transferencia.quantidade_nova), (7, 7))
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 7)
+
+    def test_saida_em_uma_ida_ao_banco(self):
+        """UPDATE ... RETURNING do saldo, UPDATE do saldo no local e INSERT da movimentação"""
+        registrar_movimentacao(self.produto, 'entrada', 1, self.user)
+
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_movimentacao(self.produto, 'saida', 1, self.user)
+
+        sql = [q['sql'] for q in consultas.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(sql), 3)
+        self.assertIn('RETURNING', sql[0])
+
+    def test_api_saida_insuficiente(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post('/api/estoque/saida/', {
+            'produto': self.produto.pk,
+            'quantidade': 50,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Estoque insuficiente', response.data['error'])
+
+
+class LancamentoEmLoteTest(TestCase):
+    """Movimentações em lote: bulk_create + UPDATE ... FROM (VALUES)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.produtos = [
+            Produto.objects.create(
+                nome=f'Produto {i}',
+                codigo_interno=f'LOTE{i:03d}',
+                preco_custo=10.00,
+                estoque_atual=10
+            )
+            for i in range(5)
+        ]
+
+    def movimentacao(self, produto, tipo, quantidade):
+        return MovimentacaoEstoque(
+            produto=produto,
+            tipo=tipo,
+            quantidade=quantidade,
+            valor_unitario=2,
+            usuario=self.user
+        )
+
+    def test_encadeia_movimentos_do_mesmo_produto(self):
+        p0, p1 = self.produtos[:2]
+        criadas = lancar_movimentacoes([
+            self.movimentacao(p0, 'entrada', 5),
+            self.movimentacao(p0, 'saida', 12),
+            self.movimentacao(p1, 'inventario', 4),
+        ])
+
+        self.assertEqual(
+            [(m.quantidade_anterior, m.quantidade_nova) for m in criadas],
+            [(10, 15), (15, 3), (10, 4)]
+        )
+        self.assertEqual(criadas[0].valor_total, 10)
+        p0.refresh_from_db()
+        p1.refresh_from_db()
+        self.assertEqual((p0.estoque_atual, p1.estoque_atual), (3, 4))
+
+    def test_tudo_ou_nada(self):
+        p0, p1 = self.produtos[:2]
+        with self.assertRaises(EstoqueInsuficiente):
+            lancar_movimentacoes([
+                self.movimentacao(p0, 'entrada', 5),
+                self.movimentacao(p1, 'saida', 11),
+            ])
+
+        p0.refresh_from_db()
+        self.assertEqual(p0.estoque_atual, 10)
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_consultas_nao_dependem_do_tamanho(self):
+        def consultas(quantidade):
+            movimentacoes = [
+                self.movimentacao(produto, 'entrada', 1)
+                for produto in self.produtos[:quantidade]
+            ]
+            with CaptureQueriesContext(connection) as capturadas:
+                lancar_movimentacoes(movimentacoes)
+            return len(capturadas)
+
+        self.assertEqual(consultas(1), consultas(5))
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post('/api/estoque/movimentacoes/lancar_lote/', {
+            'movimentacoes': [
+                {'produto': produto.pk, 'tipo': 'saida', 'quantidade': '2'}
+                for produto in self.produtos
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total'], 5)
+        self.assertEqual(
+            set(Produto.objects.values_list('estoque_atual', flat=True)),
+            {Decimal('8')}
+        )
+
+    def test_api_produto_inexistente(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post('/api/estoque/movimentacoes/lancar_lote/', {
+            'movimentacoes': [{'produto': 999999, 'tipo': 'entrada', 'quantidade': '1'}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_finalizar_inventario(self):
+        inventario = Inventario.objects.create(responsavel=self.user)
+        for produto, contada in zip(self.produtos, [10, 7, 12, 0, 10]):
+            ItemInventario.objects.create(
+                inventario=inventario,
+                produto=produto,
+                quantidade_sistema=10,
+                quantidade_contada=contada
+            )
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.post(f'/api/estoque/inventarios/{inventario.pk}/finalizar/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MovimentacaoEstoque.objects.filter(tipo='inventario').count(), 3)
+        self.assertEqual(
+            list(Produto.objects.order_by('codigo_interno').values_list('estoque_atual', flat=True)),
+            [10, 7, 12, 0, 10]
+        )
+        self.assertFalse(inventario.itens.exclude(diferenca=0).filter(ajustado=False).exists())
+
+    def test_adicionar_item_le_custo_junto(self):
+        inventario = Inventario.objects.create(responsavel=self.user, status='em_andamento')
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = client.post(f'/api/estoque/inventarios/{inventario.pk}/adicionar_item/', {
+                'inventario': inventario.pk, 'produto': self.produtos[0].pk,
+                'quantidade_sistema': '10', 'quantidade_contada': '8'
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['valor_diferenca'], '-20.00')
+        self.assertFalse([
+            consulta for consulta in consultas.captured_queries
+            if consulta['sql'].startswith('SELECT') and 'FROM "estoque_custoproduto"' in consulta['sql']
+        ])
+
+    def test_finalizar_consultas_nao_dependem_do_tamanho(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        def finalizar(tamanho):
+            inventario = Inventario.objects.create(responsavel=self.user)
+            for i in range(tamanho):
+                produto = Produto.objects.create(
+                    nome=f'Inventário {inventario.pk}-{i}', codigo_interno=f'INV{inventario.pk}-{i}',
+                    preco_custo=10, estoque_atual=10, controla_lote=i % 2 == 0
+                )
+                ItemInventario.objects.create(
+                    inventario=inventario, produto=produto, quantidade_sistema=10, quantidade_contada=i
+                )
+            with CaptureQueriesContext(connection) as consultas:
+                response = client.post(f'/api/estoque/inventarios/{inventario.pk}/finalizar/')
+            self.assertEqual(response.status_code, 200)
+            return len(consultas)
+
+        self.assertEqual(finalizar(5), finalizar(50))
+
+
+class SaldoEstoqueDiarioTest(TestCase):
+    """Posição de estoque em uma data (snapshot + movimentações da janela)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.produto = Produto.objects.create(
+            nome='Produto Teste',
+            codigo_interno='SALDO001',
+            preco_custo=10.00,
+            estoque_atual=0
+        )
+        hoje = timezone.localdate()
+        self.dias = [hoje - timedelta(days=n) for n in (5, 4, 3, 2)]
+        # D0: +10 (10), D1: -3 (7), D2: inventário 5 (5), D3: +2 (7)
+        for dia, tipo, quantidade in zip(self.dias, ['entrada', 'saida', 'inventario', 'entrada'], [10, 3, 5, 2]):
+            movimentacao = registrar_movimentacao(self.produto, tipo, quantidade, self.user)
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(
+                data_movimentacao=timezone.make_aware(datetime.combine(dia, time(12)))
+            )
+
+    def saldo(self, data):
+        saldos, _, base = saldos_em(data)
+        return saldos.get(self.produto.pk, 0), base
+
+    def test_sem_snapshot(self):
+        anterior = self.dias[0] - timedelta(days=1)
+        self.assertEqual(self.saldo(anterior), (0, None))
+        self.assertEqual([self.saldo(dia)[0] for dia in self.dias], [10, 7, 5, 7])
+
+    def test_com_snapshot(self):
+        self.assertEqual(gerar_saldos(self.dias[1]), 1)
+        snapshot = SaldoEstoqueDiario.objects.get(data=self.dias[1])
+        self.assertEqual((snapshot.quantidade, snapshot.valor), (7, 70))
+
+        # Depois do snapshot: reaplica a janela; antes: retrocede a partir dele
+        self.assertEqual(self.saldo(self.dias[2]), (5, self.dias[1]))
+        self.assertEqual(self.saldo(self.dias[3]), (7, self.dias[1]))
+        self.assertEqual(self.saldo(self.dias[0]), (10, self.dias[1]))
+
+    def test_snapshot_usa_custo_da_data(self):
+        gerar_saldos(self.dias[3])
+        Produto.objects.filter(pk=self.produto.pk).update(preco_custo=99)
+
+        base, produtos = posicao_em(self.dias[3])
+        self.assertEqual(base, self.dias[3])
+        self.assertEqual(produtos[0]['valor'], 70)
+
+    def test_task_noturna(self):
+        gerar_saldos_diarios(data=self.dias[2].isoformat())
+        self.assertEqual(SaldoEstoqueDiario.objects.get(data=self.dias[2]).quantidade, 5)
+
+        # Regerar a mesma data substitui o snapshot
+        gerar_saldos_diarios(data=self.dias[2].isoformat())
+        self.assertEqual(SaldoEstoqueDiario.objects.filter(data=self.dias[2]).count(), 1)
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.get('/api/estoque/posicao/historica/', {'data': self.dias[1].isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_produtos'], 1)
+        self.assertEqual(response.data['valor_total_estoque'], 70)
+
+        response = client.get('/api/estoque/posicao/historica/', {'data': '31/12/2024'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SaldoLocalTest(TestCase):
+    """Saldos por local mantidos pelo lançamento das movimentações"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.produto = Produto.objects.create(
+            nome='Produto Teste',
+            codigo_interno='LOCAL001',
+            preco_custo=10.00,
+            estoque_atual=0
+        )
+        registrar_movimentacao(self.produto, 'entrada', 10, self.user, local_destino='Loja')
+        registrar_movimentacao(self.produto, 'entrada', 5, self.user)
+
+    def saldos(self):
+        return dict(SaldoLocal.objects.filter(produto=self.produto).values_list('local', 'quantidade'))
+
+    def test_entrada_saida_e_transferencia(self):
+        registrar_movimentacao(self.produto, 'transferencia', 4, self.user, local_origem='Loja', local_destino='Depósito')
+        registrar_movimentacao(self.produto, 'saida', 2, self.user, local_origem='Depósito')
+
+        self.assertEqual(self.saldos(), {'Loja': 6, 'Principal': 5, 'Depósito': 2})
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 13)
+
+    def test_inventario_aplica_diferenca_no_local(self):
+        registrar_movimentacao(self.produto, 'inventario', 12, self.user, local_destino='Loja')
+
+        self.assertEqual(self.saldos(), {'Loja': 7, 'Principal': 5})
+
+    def test_transferencia_sem_saldo_no_local(self):
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            registrar_movimentacao(self.produto, 'transferencia', 6, self.user, local_origem='Principal', local_destino='Loja')
+
+        self.assertEqual(erro.exception.local, 'Principal')
+        self.assertEqual(self.saldos(), {'Loja': 10, 'Principal': 5})
+
+    def test_lote(self):
+        def movimentacao(tipo, quantidade, **locais):
+            return MovimentacaoEstoque(produto=self.produto, tipo=tipo, quantidade=quantidade, usuario=self.user, **locais)
+
+        lancar_movimentacoes([
+            movimentacao('entrada', 3, local_destino='Loja'),
+            movimentacao('transferencia', 13, local_origem='Loja', local_destino='Depósito'),
+            movimentacao('saida', 1, local_origem='Depósito'),
+        ])
+        self.assertEqual(self.saldos(), {'Loja': 0, 'Principal': 5, 'Depósito': 12})
+
+        with self.assertRaises(EstoqueInsuficiente):
+            lancar_movimentacoes([movimentacao('transferencia', 6, local_origem='Principal', local_destino='Loja')])
+        self.assertEqual(self.saldos()['Principal'], 5)
+
+    def test_api(self):
+        SaldoLocal.objects.filter(produto=self.produto, local='Loja').update(estoque_minimo=20)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.get('/api/estoque/posicao/locais/', {'local': 'Loja'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['saldos']), 1)
+        self.assertEqual(response.data['locais'][0]['quantidade_total'], 10)
+
+        response = client.get('/api/estoque/alertas/locais/')
+        self.assertEqual(response.data['total_alertas'], 1)
+        self.assertEqual(response.data['saldos'][0]['local'], 'Loja')
+
+        response = client.post('/api/estoque/transferencia/', {
+            'produto': self.produto.pk,
+            'quantidade': '50',
+            'local_origem': 'Loja',
+            'local_destino': 'Depósito',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Loja', response.data['error'])
+
+
+class PosicaoEstoqueTest(TestCase):
+    """Posição atual: totais agregados no banco, linhas paginadas por chave ou NDJSON"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.categoria = Categoria.objects.create(nome='Peças', tipo='produto')
+        self.produtos = [
+            Produto.objects.create(
+                nome=f'Produto {i}',
+                codigo_interno=f'POS{i:03d}',
+                categoria=self.categoria if i % 2 else None,
+                preco_custo=10.00,
+                estoque_atual=0
+            )
+            for i in range(5)
+        ]
+        for produto in self.produtos:
+            registrar_movimentacao(produto, 'entrada', 2, self.user, local_destino='Loja')
+        registrar_movimentacao(self.produtos[0], 'entrada', 1, self.user, local_destino='Depósito')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_totais_e_paginacao_por_chave(self):
+        response = self.client.get('/api/estoque/posicao/', {'limite': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_produtos'], 5)
+        self.assertEqual(response.data['quantidade_total'], 11)
+        self.assertEqual(response.data['valor_total_estoque'], 110)
+
+        ids = []
+        cursor = None
+        while True:
+            params = {'limite': 2, **({'apos': cursor} if cursor else {})}
+            pagina = self.client.get('/api/estoque/posicao/', params).data
+            ids += [p['id'] for p in pagina['produtos']]
+            cursor = pagina['proximo']
+            if cursor is None:
+                break
+        self.assertEqual(ids, sorted(p.pk for p in self.produtos))
+
+    def test_consultas_constantes(self):
+        with self.assertNumQueries(2):
+            self.client.get('/api/estoque/posicao/', {'limite': 100})
+
+    def test_limite_fora_da_faixa(self):
+        response = self.client.get('/api/estoque/posicao/', {'limite': 0})
+        self.assertEqual(len(response.data['produtos']), 1)
+        self.assertEqual(response.data['proximo'], self.produtos[0].pk)
+
+        response = self.client.get('/api/estoque/posicao/', {'limite': -3})
+        self.assertEqual(len(response.data['produtos']), 1)
+
+        with mock.patch.object(EstoqueViewSet, 'POSICAO_LIMITE_MAXIMO', 3):
+            response = self.client.get('/api/estoque/posicao/', {'limite': 100})
+        self.assertEqual(len(response.data['produtos']), 3)
+        self.assertEqual(response.data['proximo'], self.produtos[2].pk)
+
+        # Página que termina exatamente no último produto não aponta para uma vazia
+        response = self.client.get('/api/estoque/posicao/', {'limite': 5})
+        self.assertIsNone(response.data['proximo'])
+
+    def test_filtros(self):
+        response = self.client.get('/api/estoque/posicao/', {'categoria': self.categoria.pk})
+        self.assertEqual(response.data['total_produtos'], 2)
+
+        response = self.client.get('/api/estoque/posicao/', {'local': 'Depósito'})
+        self.assertEqual(response.data['total_produtos'], 1)
+        self.assertEqual(response.data['produtos'][0]['estoque_atual'], 1)
+
+    def test_ndjson(self):
+        response = self.client.get('/api/estoque/posicao/', {'formato': 'ndjson', 'local': 'Loja'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        linhas = [json.loads(linha) for linha in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(linhas), 5)
+        self.assertEqual(set(linhas[0]), set(CAMPOS_POSICAO))
+
+
+class PaginacaoMovimentacoesTest(TestCase):
+    """Histórico de movimentações paginado por (data_movimentacao, id)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.produto = Produto.objects.create(
+            nome='Produto', codigo_interno='HIST001', preco_custo=10, estoque_atual=0
+        )
+        outro = Produto.objects.create(nome='Outro', codigo_interno='HIST002', estoque_atual=0)
+        for _ in range(7):
+            registrar_movimentacao(self.produto, 'entrada', 1, self.user)
+        registrar_movimentacao(self.produto, 'saida', 1, self.user)
+        registrar_movimentacao(outro, 'entrada', 1, self.user)
+        # Empates de data: o id desempata
+        MovimentacaoEstoque.objects.filter(pk__in=list(
+            MovimentacaoEstoque.objects.order_by('pk').values_list('pk', flat=True)[2:5]
+        )).update(data_movimentacao=timezone.now() - timedelta(days=1))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def percorrer(self, url, params, chave='results'):
+        ids = []
+        while url:
+            pagina = self.client.get(url, params).data
+            ids += [movimentacao['id'] for movimentacao in pagina[chave]]
+            url, params = pagina['next'], None
+        return ids
+
+    def test_percorre_todas_sem_repetir(self):
+        ids = self.percorrer('/api/estoque/movimentacoes/', {'limite': 2})
+        esperado = list(MovimentacaoEstoque.objects.order_by('-data_movimentacao', '-id').values_list('pk', flat=True))
+        self.assertEqual(ids, esperado)
+
+    def test_filtro_com_cursor(self):
+        ids = self.percorrer('/api/estoque/movimentacoes/', {'limite': 2, 'tipo': 'entrada', 'produto': self.produto.pk})
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(set(ids)), 7)
+
+    def test_historico_do_produto(self):
+        url = f'/api/erp/produtos/{self.produto.pk}/movimentacoes/'
+        ids = self.percorrer(url, {'limite': 3}, chave='movimentacoes')
+        self.assertEqual(ids, list(
+            self.produto.movimentacoes.order_by('-data_movimentacao', '-id').values_list('pk', flat=True)
+        ))
+
+        # Página profunda custa o mesmo que a primeira
+        primeira = self.client.get(url, {'limite': 3})
+        with CaptureQueriesContext(connection) as inicio:
+            self.client.get(url, {'limite': 3})
+        with CaptureQueriesContext(connection) as fim:
+            self.client.get(primeira.data['next'])
+        self.assertEqual(len(inicio), len(fim))
+        self.assertNotIn('OFFSET', fim.captured_queries[-1]['sql'])
+
+    def test_cursor_invalido(self):
+        response = self.client.get('/api/estoque/movimentacoes/', {'cursor': 'xyz'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CustoEstoqueTest(TestCase):
+    """Motor de custos: camadas, custo médio/PEPS e processamento incremental"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.produto = Produto.objects.create(
+            nome='Produto Teste',
+            codigo_interno='CUSTO001',
+            preco_custo=10.00,
+            preco_venda=50.00,
+            estoque_atual=0
+        )
+        self.entrada(10, 10)
+        self.entrada(10, 20)
+
+    def entrada(self, quantidade, valor_unitario):
+        return registrar_movimentacao(
+            self.produto, 'entrada', quantidade, self.user, valor_unitario=valor_unitario
+        )
+
+    def saida(self, quantidade):
+        return registrar_movimentacao(
+            self.produto, 'saida', quantidade, self.user, documento='venda', documento_numero='VD1'
+        )
+
+    def custo(self, movimentacao):
+        return CustoMovimentacao.objects.get(movimentacao=movimentacao).custo_total
+
+    def test_custo_medio(self):
+        saida = self.saida(5)
+        atualizar_custos()
+
+        self.assertEqual(self.custo(saida), Decimal('75.00'))
+        custo = CustoProduto.objects.get(produto=self.produto)
+        self.assertEqual(custo.quantidade, 15)
+        self.assertEqual(custo.valor, Decimal('225.00'))
+        self.assertEqual(custo.custo_unitario, 15)
+
+    def test_peps(self):
+        primeira, segunda = self.saida(5), self.saida(10)
+        atualizar_custos(METODO_PEPS)
+
+        self.assertEqual(self.custo(primeira), Decimal('50.00'))
+        self.assertEqual(self.custo(segunda), Decimal('150.00'))
+        self.assertEqual(CustoProduto.objects.get(produto=self.produto).valor, Decimal('100.00'))
+        self.assertEqual(
+            list(CamadaCusto.objects.filter(saldo__gt=0).values_list('saldo', 'custo_unitario')),
+            [(5, 20)]
+        )
+
+    def test_incremental(self):
+        """Cada execução só processa as movimentações novas"""
+        self.assertEqual(atualizar_custos(), 2)
+        self.assertEqual(atualizar_custos(), 0)
+
+        # movimentações, 3 leituras de estado, 3 gravações (+ savepoint)
+        saida = self.saida(4)
+        with self.assertNumQueries(9):
+            self.assertEqual(atualizar_custos(), 1)
+        self.assertEqual(self.custo(saida), Decimal('60.00'))
+
+    def test_commit_tardio_de_id_menor(self):
+        """Movimentação confirmada depois de uma de id maior já apurada ainda recebe custo"""
+        # Movimentações do mesmo produto são serializadas pela trava do saldo;
+        # o id menor confirmado depois é de outro produto
+        outro = Produto.objects.create(nome='Outro', codigo_interno='CUSTO003', preco_custo=5, estoque_atual=0)
+        atrasada = registrar_movimentacao(outro, 'entrada', 4, self.user, valor_unitario=7)
+        self.saida(5)
+        campos = ('produto_id', 'tipo', 'quantidade_anterior', 'quantidade_nova',
+                  'valor_unitario', 'documento', 'data_movimentacao')
+        # A execução anterior não enxergava `atrasada` (transação ainda aberta)
+        _Processamento(METODO_MEDIA).processar(list(
+            MovimentacaoEstoque.objects.exclude(pk=atrasada.pk).order_by('pk').only(*campos)
+        ))
+
+        self.assertEqual(atualizar_custos(), 1)
+        self.assertEqual(self.custo(atrasada), Decimal('28.00'))
+        self.assertEqual(CustoProduto.objects.get(produto=outro).valor, Decimal('28.00'))
+
+    def test_task_isolada_por_tenant_e_sem_sobreposicao(self):
+        from django.core.cache import cache
+        from . import tasks
+
+        with mock.patch.object(tasks, 'get_tenant_schemas', return_value=[None, None]), \
+                mock.patch.object(tasks, 'atualizar_custos', side_effect=[RuntimeError('tenant'), 0]) as apurar, \
+                self.assertLogs('apps.estoque.tasks', 'ERROR'):
+            atualizar_custos_estoque()
+        self.assertEqual(apurar.call_count, 2)
+
+        cache.add(tasks.CUSTOS_TRAVA, True)
+        try:
+            with mock.patch.object(tasks, 'atualizar_custos') as apurar:
+                atualizar_custos_estoque()
+            apurar.assert_not_called()
+        finally:
+            cache.delete(tasks.CUSTOS_TRAVA)
+
+    def test_preco_de_custo_nao_altera_valor(self):
+        atualizar_custos()
+        Produto.objects.filter(pk=self.produto.pk).update(preco_custo=99)
+
+        produto = Produto.objects.get(pk=self.produto.pk)
+        self.assertEqual(produto.custo_unitario, 15)
+        self.assertEqual(produto.valor_estoque, 300)
+
+    def test_estoque_inicial_sem_movimentacao(self):
+        """Saldo cadastrado direto no produto entra pelo preço de custo"""
+        produto = Produto.objects.create(
+            nome='Produto Antigo', codigo_interno='CUSTO002', preco_custo=8, estoque_atual=10
+        )
+        saida = registrar_movimentacao(produto, 'saida', 2, self.user)
+        atualizar_custos()
+
+        self.assertEqual(self.custo(saida), Decimal('16.00'))
+        self.assertEqual(CustoProduto.objects.get(produto=produto).valor, Decimal('64.00'))
+
+    def test_ajuste_usa_custo_atual(self):
+        ajuste = registrar_movimentacao(self.produto, 'ajuste', 12, self.user, valor_unitario=99)
+        atualizar_custos()
+
+        self.assertEqual(self.custo(ajuste), Decimal('120.00'))
+        self.assertEqual(CustoProduto.objects.get(produto=self.produto).valor, Decimal('180.00'))
+
+    def test_lote(self):
+        """Movimentações lançadas em lote também recebem custo"""
+        lancar_movimentacoes([
+            MovimentacaoEstoque(produto=self.produto, tipo='saida', quantidade=1, usuario=self.user)
+            for _ in range(3)
+        ])
+        atualizar_custos()
+        self.assertEqual(CustoProduto.objects.get(produto=self.produto).quantidade, 17)
+
+    def test_posicao_usa_custo_apurado(self):
+        atualizar_custos(METODO_PEPS)
+        self.saida(10)
+        atualizar_custos(METODO_PEPS)
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/estoque/posicao/')
+        self.assertEqual(response.data['valor_total_estoque'], 200)
+        self.assertEqual(response.data['produtos'][0]['custo_unitario'], 20)
+
+    def test_recalculo(self):
+        saida = self.saida(5)
+        atualizar_custos_estoque()
+        self.assertEqual(self.custo(saida), Decimal('75.00'))
+
+        call_command('recalcular_custos', metodo=METODO_PEPS, stdout=open('/dev/null', 'w'))
+        self.assertEqual(self.custo(saida), Decimal('50.00'))
+        self.assertEqual(CustoMovimentacao.objects.count(), 3)
+
+
+class AlocacaoLoteTest(TestCase):
+    """Saídas de produtos com controle de lote retiram dos lotes por validade"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.produto = Produto.objects.create(
+            nome='Medicamento',
+            codigo_interno='LOTE001',
+            preco_custo=10.00,
+            preco_venda=20.00,
+            controla_lote=True
+        )
+        hoje = timezone.localdate()
+        for numero, dias in [('L30', 30), ('L10', 10), ('VENCIDO', -1), ('SEMVAL', None)]:
+            validade = hoje + timedelta(days=dias) if dias is not None else None
+            registrar_movimentacao(
+                self.produto, 'entrada', 5, self.user, lote=numero, data_validade=validade
+            )
+
+    def saldo(self, numero):
+        return Lote.objects.get(produto=self.produto, numero_lote=numero).quantidade
+
+    def saida(self, quantidade, **campos):
+        return registrar_movimentacao(self.produto, 'saida', quantidade, self.user, **campos)
+
+    def test_entrada_cria_e_soma_lote(self):
+        self.assertEqual(Lote.objects.filter(produto=self.produto).count(), 4)
+        registrar_movimentacao(self.produto, 'entrada', 2, self.user, lote='L30')
+        self.assertEqual(self.saldo('L30'), 7)
+
+    def test_saida_fefo(self):
+        movimentacao = self.saida(7)
+
+        self.assertEqual(self.saldo('L10'), 0)
+        self.assertEqual(self.saldo('L30'), 3)
+        self.assertEqual(self.saldo('SEMVAL'), 5)
+        self.assertEqual(
+            list(movimentacao.alocacoes_lote.values_list('lote__numero_lote', 'quantidade')),
+            [('L10', 5), ('L30', 2)]
+        )
+
+    def test_saida_em_um_lote_recebe_numero(self):
+        movimentacao = self.saida(2)
+        self.assertEqual(movimentacao.lote, 'L10')
+        self.assertEqual(MovimentacaoEstoque.objects.get(pk=movimentacao.pk).lote, 'L10')
+
+    def test_lote_informado(self):
+        self.saida(2, lote='L30')
+        self.assertEqual(self.saldo('L30'), 3)
+        self.assertEqual(self.saldo('L10'), 5)
+
+    def test_lote_vencido_nao_e_usado(self):
+        with self.assertRaises(LoteInsuficiente):
+            self.saida(1, lote='VENCIDO')
+
+        # 15 em lotes válidos; o saldo do produto (20) não mudou
+        with self.assertRaises(LoteInsuficiente):
+            self.saida(16)
+        self.assertEqual(Produto.objects.get(pk=self.produto.pk).estoque_atual, 20)
+        self.assertEqual(self.saldo('L10'), 5)
+
+    def test_produto_sem_controle_de_lote(self):
+        produto = Produto.objects.create(
+            nome='Comum', codigo_interno='LOTE002', preco_custo=1, estoque_atual=5
+        )
+        registrar_movimentacao(produto, 'saida', 2, self.user)
+        self.assertFalse(AlocacaoLote.objects.exists())
+
+    def test_produto_carregado_sem_controla_lote(self):
+        # Produtos lidos com .only(): controla_lote vem na consulta única, não um por movimentação
+        produtos = [Produto.objects.only('id', 'preco_custo').get(pk=self.produto.pk) for _ in range(3)]
+        movimentacoes = [
+            MovimentacaoEstoque(produto=produto, tipo='saida', quantidade=1, usuario=self.user)
+            for produto in produtos
+        ]
+        with CaptureQueriesContext(connection) as consultas:
+            lancar_movimentacoes(movimentacoes)
+        self.assertEqual(
+            sum('"erp_produto"."controla_lote"' in consulta['sql'] for consulta in consultas.captured_queries), 1
+        )
+        self.assertEqual(self.saldo('L10'), 2)
+
+    def test_lancamento_em_lote(self):
+        lancar_movimentacoes([
+            MovimentacaoEstoque(produto_id=self.produto.pk, tipo='saida', quantidade=4, usuario=self.user),
+            MovimentacaoEstoque(produto_id=self.produto.pk, tipo='saida', quantidade=4, usuario=self.user),
+        ])
+        self.assertEqual(self.saldo('L10'), 0)
+        self.assertEqual(self.saldo('L30'), 2)
+        self.assertEqual(AlocacaoLote.objects.count(), 3)
+
+    def test_previa_uma_consulta(self):
+        outro = Produto.objects.create(nome='Outro', codigo_interno='LOTE003', controla_lote=True)
+        with self.assertNumQueries(1):
+            previa = previa_alocacao([(self.produto.pk, 7), (outro.pk, 1), (self.produto.pk, 9)])
+
+        self.assertEqual([(lote.numero_lote, q) for lote, q in previa[0][2]], [('L10', 5), ('L30', 2)])
+        self.assertEqual(previa[1][3], 1)
+        self.assertEqual([(lote.numero_lote, q) for lote, q in previa[2][2]], [('L30', 3), ('SEMVAL', 5)])
+        self.assertEqual(previa[2][3], 1)
+        # Nada é reservado
+        self.assertEqual(self.saldo('L10'), 5)
+
+    def test_previa_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post('/api/estoque/lotes/alocacao/', {
+            'itens': [{'produto': self.produto.pk, 'quantidade': '6'}]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        item = response.data['itens'][0]
+        self.assertEqual([lote['numero_lote'] for lote in item['lotes']], ['L10', 'L30'])
+        self.assertEqual(item['faltando'], 0)
+
+    def test_entrada_sem_lote_vai_para_saldo_inicial(self):
+        registrar_movimentacao(self.produto, 'entrada', 3, self.user)
+        self.assertEqual(self.saldo(LOTE_SALDO_INICIAL), 3)
+        self.assertIsNone(Lote.objects.get(produto=self.produto, numero_lote=LOTE_SALDO_INICIAL).data_validade)
+
+        # Sem validade, o saldo inicial é o último a sair e pode ser vendido
+        self.saida(17)
+        self.assertEqual(self.saldo(LOTE_SALDO_INICIAL), 1)
+        self.assertEqual(Produto.objects.get(pk=self.produto.pk).estoque_atual, 6)
+
+    def test_estoque_anterior_ao_controle_pode_sair(self):
+        produto = Produto.objects.create(
+            nome='Passou a controlar', codigo_interno='LOTE004', preco_custo=1, estoque_atual=10, controla_lote=True
+        )
+        registrar_movimentacao(produto, 'saida', 4, self.user)
+        lote = Lote.objects.get(produto=produto)
+        self.assertEqual((lote.numero_lote, lote.quantidade), (LOTE_SALDO_INICIAL, 6))
+
+    def test_ajuste_leva_lotes_ao_novo_saldo(self):
+        # Baixa: primeiro os vencidos, depois por validade
+        registrar_movimentacao(self.produto, 'inventario', 8, self.user)
+        self.assertEqual(self.saldo('VENCIDO'), 0)
+        self.assertEqual(self.saldo('L10'), 0)
+        self.assertEqual(self.saldo('L30'), 3)
+        self.assertEqual(self.saldo('SEMVAL'), 5)
+
+        # Sobra sem lote informado vai para o saldo inicial; com lote, para o lote
+        registrar_movimentacao(self.produto, 'ajuste', 10, self.user)
+        self.assertEqual(self.saldo(LOTE_SALDO_INICIAL), 2)
+        registrar_movimentacao(self.produto, 'ajuste', 11, self.user, lote='L30')
+        self.assertEqual(self.saldo('L30'), 4)
+
+        total = Lote.objects.filter(produto=self.produto).aggregate(total=Sum('quantidade'))['total']
+        self.assertEqual(total, Produto.objects.get(pk=self.produto.pk).estoque_atual)
+
+    def test_migracao_saldo_inicial(self):
+        migracao = import_module('apps.estoque.migrations.0007_lote_saldo_inicial')
+        Produto.objects.filter(pk=self.produto.pk).update(estoque_atual=26)
+        sem_lotes = Produto.objects.create(
+            nome='Sem lotes', codigo_interno='LOTE005', estoque_atual=4, controla_lote=True
+        )
+        Produto.objects.create(nome='Comum', codigo_interno='LOTE006', estoque_atual=4)
+
+        migracao.saldo_inicial_em_lote(django_apps, None)
+
+        self.assertEqual(self.saldo(LOTE_SALDO_INICIAL), 6)
+        self.assertEqual(
+            list(Lote.objects.filter(produto=sem_lotes).values_list('numero_lote', 'quantidade')),
+            [(LOTE_SALDO_INICIAL, 4)]
+        )
+        self.assertEqual(Lote.objects.count(), 6)
+
+
+class LeiturasInventarioTest(TestCase):
+    """Leituras de coletor em lote no inventário"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.produto1 = Produto.objects.create(
+            nome='Produto 1', codigo_interno='P001', codigo_barras='789001', preco_custo=10, estoque_atual=10
+        )
+        self.produto2 = Produto.objects.create(
+            nome='Produto 2', codigo_interno='P002', preco_custo=5, estoque_atual=20
+        )
+        for codigo in ('P003', 'P004'):
+            Produto.objects.create(nome=codigo, codigo_interno=codigo, codigo_barras='789999')
+        self.inventario = Inventario.objects.create(responsavel=self.user, status='em_andamento')
+
+    def item(self, produto):
+        return ItemInventario.objects.get(inventario=self.inventario, produto=produto)
+
+    def test_lote_com_erros_por_linha(self):
+        itens, erros = registrar_leituras(self.inventario, [
+            ('789001', 1), ('789001', 1), ('P002', 5), ('XXX', 1), ('789001', 1), ('789999', 1)
+        ])
+
+        self.assertEqual(len(itens), 2)
+        self.assertEqual([(erro['linha'], erro['codigo']) for erro in erros], [(3, 'XXX'), (5, '789999')])
+        item = self.item(self.produto1)
+        self.assertEqual((item.quantidade_sistema, item.quantidade_contada, item.diferenca), (10, 3, -7))
+        self.assertEqual(item.valor_diferenca, -70)
+        self.assertEqual(self.item(self.produto2).quantidade_contada, 5)
+
+    def test_lotes_somam_na_contagem(self):
+        registrar_leituras(self.inventario, [('789001', 1)])
+        Produto.objects.filter(pk=self.produto1.pk).update(estoque_atual=50)
+        registrar_leituras(self.inventario, [('P001', 4)])
+
+        item = self.item(self.produto1)
+        self.assertEqual(item.quantidade_contada, 5)
+        # O saldo do sistema é o da primeira leitura
+        self.assertEqual(item.quantidade_sistema, 10)
+        self.assertEqual(ItemInventario.objects.filter(inventario=self.inventario).count(), 1)
+
+    def test_modo_substituir(self):
+        registrar_leituras(self.inventario, [('789001', 8)])
+        registrar_leituras(self.inventario, [('789001', 2)], modo='substituir')
+        self.assertEqual(self.item(self.produto1).quantidade_contada, 2)
+
+    def test_consultas_constantes(self):
+        produtos = [
+            Produto.objects.create(nome=f'Massa {i}', codigo_interno=f'M{i:03d}', codigo_barras=f'78{i:04d}')
+            for i in range(50)
+        ]
+        with CaptureQueriesContext(connection) as pequeno:
+            registrar_leituras(self.inventario, [('789001', 1)])
+        with CaptureQueriesContext(connection) as grande:
+            registrar_leituras(self.inventario, [(produto.codigo_barras, 1) for produto in produtos] * 4)
+
+        self.assertEqual(len(grande), len(pequeno))
+        self.assertEqual(ItemInventario.objects.get(produto=produtos[0]).quantidade_contada, 4)
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = f'/api/estoque/inventarios/{self.inventario.pk}/leituras/'
+
+        response = client.post(url, {
+            'leituras': [{'codigo': '789001'}, {'codigo': 'XXX', 'quantidade': '2'}]
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['produtos'], 1)
+        self.assertEqual(response.data['erros'][0]['linha'], 1)
+
+        Inventario.objects.filter(pk=self.inventario.pk).update(status='concluido')
+        response = client.post(url, {'leituras': [{'codigo': '789001'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_inventario_finalizado_durante_a_leitura(self):
+        # A instância lida antes da trava ainda diz 'em_andamento'
+        Inventario.objects.filter(pk=self.inventario.pk).update(status='concluido')
+        with self.assertRaises(InventarioEncerrado):
+            registrar_leituras(self.inventario, [('789001', 1)])
+        self.assertFalse(ItemInventario.objects.exists())
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        with mock.patch.object(InventarioViewSet, 'get_object', return_value=self.inventario):
+            response = client.post(
+                f'/api/estoque/inventarios/{self.inventario.pk}/leituras/',
+                {'leituras': [{'codigo': '789001'}]}, format='json'
+            )
+            self.assertEqual(response.status_code, 400)
+            response = client.post(f'/api/estoque/inventarios/{self.inventario.pk}/finalizar/')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(ItemInventario.objects.exists())
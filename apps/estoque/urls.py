@@ -22,5 +22,8 @@ urlpatterns = [
     path('ajuste/', views.EstoqueViewSet.as_view({'post': 'ajuste'}), name='ajuste'),
     path('transferencia/', views.EstoqueViewSet.as_view({'post': 'transferencia'}), name='transferencia'),
     path('posicao/', views.EstoqueViewSet.as_view({'get': 'posicao'}), name='posicao'),
+    path('posicao/historica/', views.EstoqueViewSet.as_view({'get': 'posicao_historica'}), name='posicao-historica'),
     path('alertas/', views.EstoqueViewSet.as_view({'get': 'alertas'}), name='alertas'),
+    path('posicao/locais/', views.EstoqueViewSet.as_view({'get': 'posicao_local'}), name='posicao-local'),
+    path('alertas/locais/', views.EstoqueViewSet.as_view({'get': 'alertas_local'}), name='alertas-local'),
 ]
@@ -2,14 +2,23 @@
 Views for Estoque models
 """
 
+from datetime import datetime
+
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.mixins import StreamingExportMixin, ndjson_em_blocos
+from apps.core.pagination import KeysetPagination
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db import models as django_models
-from .models import MovimentacaoEstoque, Lote, Inventario, ItemInventario
+from django.db import models as django_models, transaction
+from .models import MovimentacaoEstoque, Lote, Inventario, ItemInventario, SaldoLocal
+from .contagem import InventarioEncerrado, registrar_leituras
+from .lotes import previa_alocacao
+from .saldos import CAMPOS_POSICAO, posicao_atual, posicao_em, totais_posicao
+from .services import EstoqueInsuficiente, lancar_movimentacoes, registrar_movimentacao
 from apps.erp.models import Produto
 from .serializers import (
     MovimentacaoEstoqueSerializer,
@@ -19,18 +28,30 @@ from .serializers import (
     InventarioListSerializer,
     ItemInventarioSerializer,
     EntradaEstoqueSerializer,
+    MovimentacaoLoteSerializer,
     SaidaEstoqueSerializer,
     AjusteEstoqueSerializer,
     TransferenciaEstoqueSerializer,
+    AlocacaoLotesSerializer,
+    LeiturasInventarioSerializer,
 )
 
 
-class MovimentacaoEstoqueViewSet(viewsets.ModelViewSet):
+class MovimentacaoPagination(KeysetPagination):
+    """Movimentações da mais recente para a mais antiga (índices por filtro + data/id)"""
+    ordering = ('-data_movimentacao', '-id')
+
+
+class MovimentacaoEstoqueViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for MovimentacaoEstoque
+    
+    The list is paginated by key (?cursor=, newest first); ?ordering= only
+    applies to the export.
     """
     queryset = MovimentacaoEstoque.objects.select_related('produto', 'usuario').all()
     permission_classes = [AllowAny]
+    pagination_class = MovimentacaoPagination
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['produto__nome', 'produto__codigo_interno', 'documento_numero', 'motivo']
     ordering_fields = ['data_movimentacao', 'quantidade', 'valor_total']
@@ -40,6 +61,39 @@ class MovimentacaoEstoqueViewSet(viewsets.ModelViewSet):
         if self.action == 'list':
             return MovimentacaoEstoqueListSerializer
         return MovimentacaoEstoqueSerializer
+    
+    @action(detail=False, methods=['post'])
+    def lancar_lote(self, request):
+        """
+        Lança várias movimentações de uma vez ({"movimentacoes": [...]})
+        
+        Tudo ou nada: se alguma saída não tiver saldo, nada é gravado.
+        """
+        serializer = MovimentacaoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        movimentacoes = [
+            MovimentacaoEstoque(
+                produto_id=dados.pop('produto'),
+                usuario=request.user,
+                **dados
+            )
+            for dados in serializer.validated_data['movimentacoes']
+        ]
+        
+        try:
+            criadas = lancar_movimentacoes(movimentacoes)
+        except EstoqueInsuficiente as e:
+            return Response({
+                'error': str(e),
+                'produto': e.produto_id
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'message': f'{len(criadas)} movimentações lançadas',
+            'total': len(criadas),
+            'produtos': len({m.produto_id for m in criadas})
+        }, status=status.HTTP_201_CREATED)
 
 
 class LoteViewSet(viewsets.ModelViewSet):
@@ -71,18 +125,57 @@ class LoteViewSet(viewsets.ModelViewSet):
         
         serializer = self.get_serializer(lotes, many=True)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def alocacao(self, request):
+        """
+        Preview FEFO lot allocation for a basket (one query, nothing is reserved)
+        """
+        serializer = AlocacaoLotesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        itens = [(item['produto'], item['quantidade']) for item in serializer.validated_data['itens']]
+        return Response({
+            'itens': [
+                {
+                    'produto': produto_id,
+                    'quantidade': quantidade,
+                    'lotes': [
+                        {
+                            'lote': lote.id,
+                            'numero_lote': lote.numero_lote,
+                            'data_validade': lote.data_validade,
+                            'quantidade': usado,
+                        }
+                        for lote, usado in retiradas
+                    ],
+                    'faltando': faltando,
+                }
+                for produto_id, quantidade, retiradas, faltando in previa_alocacao(itens)
+            ]
+        })
 
 
 class InventarioViewSet(viewsets.ModelViewSet):
     """
     ViewSet for Inventario
     """
-    queryset = Inventario.objects.select_related('responsavel').prefetch_related('itens').all()
+    queryset = Inventario.objects.select_related('responsavel').prefetch_related(
+        django_models.Prefetch('itens', queryset=ItemInventario.objects.select_related('produto'))
+    ).all()
     permission_classes = [AllowAny]
     filter_backends = [filters.OrderingFilter, DjangoFilterBackend]
     ordering_fields = ['data_inicio', 'data_conclusao']
     filterset_fields = ['status', 'responsavel']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('leituras', 'finalizar'):
+            # Cada lote de leituras não precisa carregar os itens já contados;
+            # finalizar relê o inventário travado
+            queryset = queryset.prefetch_related(None)
+        return queryset
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return InventarioListSerializer
@@ -117,6 +210,33 @@ class InventarioViewSet(viewsets.ModelViewSet):
         
         return Response(ItemInventarioSerializer(item).data, status=status.HTTP_201_CREATED)
     
+    @action(detail=True, methods=['post'])
+    def leituras(self, request, pk=None):
+        """
+        Ingest a batch of barcode scans (codigo, quantidade)
+        """
+        inventario = self.get_object()
+        
+        if inventario.status != 'em_andamento':
+            return Response({
+                'error': 'Inventário não está em andamento'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = LeiturasInventarioSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        leituras = [(item['codigo'], item['quantidade']) for item in serializer.validated_data['leituras']]
+        try:
+            itens, erros = registrar_leituras(inventario, leituras, serializer.validated_data['modo'])
+        except InventarioEncerrado as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'leituras': len(leituras),
+            'produtos': len(itens),
+            'erros': erros
+        })
+    
     @action(detail=True, methods=['post'])
     def finalizar(self, request, pk=None):
         """
@@ -129,12 +249,21 @@ class InventarioViewSet(viewsets.ModelViewSet):
                 'error': 'Inventário não está em andamento'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Adjust stock for all items with differences
-        itens_ajustados = 0
-        for item in inventario.itens.filter(ajustado=False):
-            if item.diferenca != 0:
-                # Create adjustment movement
-                MovimentacaoEstoque.objects.create(
+        with transaction.atomic():
+            # Trava o inventário: leituras em andamento terminam antes e as
+            # seguintes encontram o inventário concluído
+            inventario = Inventario.objects.select_for_update().get(pk=inventario.pk)
+            if inventario.status != 'em_andamento':
+                return Response({
+                    'error': 'Inventário não está em andamento'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # Adjust stock for all items with differences, in one batch
+            itens = list(
+                inventario.itens.filter(ajustado=False).exclude(diferenca=0).select_related('produto')
+            )
+            movimentacoes = [
+                MovimentacaoEstoque(
                     produto=item.produto,
                     tipo='inventario',
                     quantidade=item.quantidade_contada,
@@ -144,15 +273,17 @@ class InventarioViewSet(viewsets.ModelViewSet):
                     documento_numero=str(inventario.id),
                     usuario=request.user
                 )
-                
-                item.ajustado = True
-                item.save()
-                itens_ajustados += 1
-        
-        # Update inventory status
-        inventario.status = 'concluido'
-        inventario.data_conclusao = timezone.now()
-        inventario.save()
+                for item in itens
+            ]
+            lancar_movimentacoes(movimentacoes)
+            ItemInventario.objects.filter(pk__in=[item.pk for item in itens]).update(ajustado=True)
+            
+            # Update inventory status
+            inventario.status = 'concluido'
+            inventario.data_conclusao = timezone.now()
+            inventario.save()
+        itens_ajustados = len(itens)
+        inventario = super().get_queryset().get(pk=inventario.pk)
         
         return Response({
             'message': f'Inventário finalizado. {itens_ajustados} itens ajustados.',
@@ -174,17 +305,17 @@ class EstoqueViewSet(viewsets.ViewSet):
         
         produto = Produto.objects.get(pk=serializer.validated_data['produto'])
         
-        movimentacao = MovimentacaoEstoque.objects.create(
+        movimentacao = registrar_movimentacao(
             produto=produto,
             tipo='entrada',
             quantidade=serializer.validated_data['quantidade'],
+            usuario=request.user,
             valor_unitario=serializer.validated_data['valor_unitario'],
             lote=serializer.validated_data.get('lote', ''),
             data_validade=serializer.validated_data.get('data_validade'),
             documento='nota_fiscal',
             documento_numero=serializer.validated_data.get('documento_numero', ''),
-            motivo=serializer.validated_data.get('motivo', 'Entrada de estoque'),
-            usuario=request.user
+            motivo=serializer.validated_data.get('motivo', 'Entrada de estoque')
         )
         
         return Response(
@@ -200,22 +331,21 @@ class EstoqueViewSet(viewsets.ViewSet):
         
         produto = Produto.objects.get(pk=serializer.validated_data['produto'])
         
-        # Check if there's enough stock
-        if produto.estoque_atual < serializer.validated_data['quantidade']:
-            return Response({
-                'error': f'Estoque insuficiente. Disponível: {produto.estoque_atual}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        movimentacao = MovimentacaoEstoque.objects.create(
-            produto=produto,
-            tipo='saida',
-            quantidade=serializer.validated_data['quantidade'],
-            valor_unitario=produto.preco_custo,
-            documento='ajuste_manual',
-            documento_numero=serializer.validated_data.get('documento_numero', ''),
-            motivo=serializer.validated_data.get('motivo', 'Saída de estoque'),
-            usuario=request.user
-        )
+        # Saldo conferido no próprio UPDATE (seguro com saídas concorrentes)
+        try:
+            movimentacao = registrar_movimentacao(
+                produto=produto,
+                tipo='saida',
+                quantidade=serializer.validated_data['quantidade'],
+                usuario=request.user,
+                valor_unitario=produto.preco_custo,
+                documento='ajuste_manual',
+                documento_numero=serializer.validated_data.get('documento_numero', ''),
+                lote=serializer.validated_data.get('lote', ''),
+                motivo=serializer.validated_data.get('motivo', 'Saída de estoque')
+            )
+        except EstoqueInsuficiente as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(
             MovimentacaoEstoqueSerializer(movimentacao).data,
@@ -230,14 +360,14 @@ class EstoqueViewSet(viewsets.ViewSet):
         
         produto = Produto.objects.get(pk=serializer.validated_data['produto'])
         
-        movimentacao = MovimentacaoEstoque.objects.create(
+        movimentacao = registrar_movimentacao(
             produto=produto,
             tipo='ajuste',
             quantidade=serializer.validated_data['quantidade_nova'],
+            usuario=request.user,
             valor_unitario=produto.preco_custo,
             documento='ajuste_manual',
-            motivo=serializer.validated_data['motivo'],
-            usuario=request.user
+            motivo=serializer.validated_data['motivo']
         )
         
         return Response(
@@ -253,39 +383,132 @@ class EstoqueViewSet(viewsets.ViewSet):
         
         produto = Produto.objects.get(pk=serializer.validated_data['produto'])
         
-        movimentacao = MovimentacaoEstoque.objects.create(
-            produto=produto,
-            tipo='transferencia',
-            quantidade=serializer.validated_data['quantidade'],
-            valor_unitario=produto.preco_custo,
-            local_origem=serializer.validated_data['local_origem'],
-            local_destino=serializer.validated_data['local_destino'],
-            documento='transferencia',
-            motivo=serializer.validated_data.get('motivo', 'Transferência de estoque'),
-            usuario=request.user
-        )
+        # O saldo do local de origem é conferido no próprio UPDATE
+        try:
+            movimentacao = registrar_movimentacao(
+                produto=produto,
+                tipo='transferencia',
+                quantidade=serializer.validated_data['quantidade'],
+                usuario=request.user,
+                valor_unitario=produto.preco_custo,
+                local_origem=serializer.validated_data['local_origem'],
+                local_destino=serializer.validated_data['local_destino'],
+                documento='transferencia',
+                motivo=serializer.validated_data.get('motivo', 'Transferência de estoque')
+            )
+        except EstoqueInsuficiente as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(
             MovimentacaoEstoqueSerializer(movimentacao).data,
             status=status.HTTP_201_CREATED
         )
     
+    POSICAO_LIMITE = 500
+    POSICAO_LIMITE_MAXIMO = 5000
+    
     @action(detail=False, methods=['get'])
     def posicao(self, request):
-        """Current stock position"""
-        produtos = Produto.objects.filter(active=True, tipo='produto').values(
-            'id', 'codigo_interno', 'nome', 'estoque_atual',
-            'estoque_minimo', 'preco_custo'
-        ).annotate(
-            valor_estoque=django_models.F('estoque_atual') * django_models.F('preco_custo')
+        """
+        Current stock position
+        
+        Filters: ?categoria=id&local=nome. Totals come from one aggregate;
+        rows are paginated by key (?apos=<último id>&limite=500, next cursor
+        in `proximo`) or streamed whole with ?formato=ndjson.
+        """
+        params = request.query_params
+        try:
+            categoria = int(params['categoria']) if params.get('categoria') else None
+            apos = int(params['apos']) if params.get('apos') else None
+            limite = max(1, min(int(params.get('limite', self.POSICAO_LIMITE)), self.POSICAO_LIMITE_MAXIMO))
+        except ValueError:
+            return Response({
+                'error': 'categoria, apos e limite devem ser números'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        local = params.get('local') or None
+        
+        if params.get('formato') == 'ndjson':
+            linhas = posicao_atual(categoria, local).iterator(chunk_size=2000)
+            return StreamingHttpResponse(
+                ndjson_em_blocos(linhas, CAMPOS_POSICAO),
+                content_type='application/x-ndjson'
+            )
+        
+        # Uma linha a mais só para saber se há próxima página
+        linhas = list(posicao_atual(categoria, local, apos)[:limite + 1])
+        produtos = [dict(zip(CAMPOS_POSICAO, linha)) for linha in linhas[:limite]]
+        
+        return Response({
+            **totais_posicao(categoria, local),
+            'produtos': produtos,
+            'proximo': produtos[-1]['id'] if len(linhas) > limite else None
+        })
+    
+    @action(detail=False, methods=['get'])
+    def posicao_historica(self, request):
+        """
+        Stock position at the end of a date (?data=AAAA-MM-DD[&produto=id])
+        """
+        try:
+            data = datetime.strptime(request.query_params.get('data', ''), '%Y-%m-%d').date()
+            produto_id = request.query_params.get('produto')
+            produto_id = int(produto_id) if produto_id else None
+        except ValueError:
+            return Response({
+                'error': 'Informe data=AAAA-MM-DD e, opcionalmente, produto=<id>'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        base, produtos = posicao_em(data, produto_id)
+        
+        return Response({
+            'data': data,
+            'snapshot_base': base,
+            'produtos': produtos,
+            'total_produtos': len(produtos),
+            'quantidade_total': sum(p['quantidade'] for p in produtos),
+            'valor_total_estoque': sum(p['valor'] for p in produtos)
+        })
+    
+    @action(detail=False, methods=['get'])
+    def posicao_local(self, request):
+        """Stock position per location (?local=...&produto=id)"""
+        saldos = SaldoLocal.objects.filter(produto__active=True).exclude(quantidade=0)
+        if request.query_params.get('local'):
+            saldos = saldos.filter(local=request.query_params['local'])
+        if request.query_params.get('produto'):
+            saldos = saldos.filter(produto_id=request.query_params['produto'])
+        
+        locais = saldos.order_by('local').values('local').annotate(
+            total_produtos=django_models.Count('id'),
+            quantidade_total=django_models.Sum('quantidade')
         )
         
-        total_valor = sum(p['valor_estoque'] for p in produtos)
+        return Response({
+            'locais': list(locais),
+            'saldos': list(saldos.values(
+                'produto_id', 'produto__codigo_interno', 'produto__nome',
+                'local', 'quantidade', 'estoque_minimo'
+            ))
+        })
+    
+    @action(detail=False, methods=['get'])
+    def alertas_local(self, request):
+        """Stock alerts per location (below the location minimum)"""
+        saldos = SaldoLocal.objects.filter(
+            produto__active=True,
+            quantidade__lt=django_models.F('estoque_minimo')
+        )
+        if request.query_params.get('local'):
+            saldos = saldos.filter(local=request.query_params['local'])
+        
+        saldos = saldos.values(
+            'produto_id', 'produto__codigo_interno', 'produto__nome',
+            'local', 'quantidade', 'estoque_minimo'
+        )
         
         return Response({
-            'produtos': list(produtos),
-            'total_produtos': produtos.count(),
-            'valor_total_estoque': total_valor
+            'saldos': list(saldos),
+            'total_alertas': len(saldos)
         })
     
     @action(detail=False, methods=['get'])
@@ -6,6 +6,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from apps.core.models import BaseModel
+from apps.core.sequencias import proximo_numero
 from apps.erp.models import Cliente, Fornecedor
 
 User = get_user_model()
@@ -172,10 +173,7 @@ class ContaPagar(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.numero:
-            # Generate automatic number
-            ultimo = ContaPagar.objects.order_by('-id').first()
-            proximo_id = (ultimo.id + 1) if ultimo else 1
-            self.numero = f'CP{proximo_id:06d}'
+            self.numero = proximo_numero(ContaPagar, 'CP')
         
         super().save(*args, **kwargs)
     
@@ -308,10 +306,7 @@ class ContaReceber(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.numero:
-            # Generate automatic number
-            ultimo = ContaReceber.objects.order_by('-id').first()
-            proximo_id = (ultimo.id + 1) if ultimo else 1
-            self.numero = f'CR{proximo_id:06d}'
+            self.numero = proximo_numero(ContaReceber, 'CR')
         
         super().save(*args, **kwargs)
     
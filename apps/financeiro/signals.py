@@ -2,10 +2,11 @@
 Signals for automatic financial updates
 """
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
-from .models import ContaPagar, ContaReceber, FluxoCaixa
+from .models import ContaPagar, ContaReceber, FluxoCaixa, CategoriaDRE
+from apps.relatorios.snapshots import invalidar_dre, invalidar_todos
 
 
 @receiver(post_save, sender=ContaPagar)
@@ -82,3 +83,45 @@ def verificar_atraso_receber(sender, instance, **kwargs):
         if instance.data_vencimento < hoje:
             instance.status = 'atrasado'
             instance.save(update_fields=['status'])
+
+
+@receiver(pre_save, sender=ContaPagar)
+@receiver(pre_save, sender=ContaReceber)
+def guardar_data_liquidacao_anterior(sender, instance, **kwargs):
+    """
+    Guarda a data de pagamento/recebimento anterior para invalidar o DRE
+    também no mês de origem quando a data muda
+    """
+    campo = 'data_pagamento' if sender is ContaPagar else 'data_recebimento'
+    instance._data_liquidacao_anterior = None
+    if instance.pk:
+        instance._data_liquidacao_anterior = sender.objects.filter(
+            pk=instance.pk
+        ).values_list(campo, flat=True).first()
+
+
+@receiver(post_save, sender=ContaPagar)
+@receiver(post_delete, sender=ContaPagar)
+def invalidar_dre_conta_pagar(sender, instance, **kwargs):
+    """
+    Invalida o snapshot do DRE do mês do pagamento
+    """
+    invalidar_dre(instance.data_pagamento, getattr(instance, '_data_liquidacao_anterior', None))
+
+
+@receiver(post_save, sender=ContaReceber)
+@receiver(post_delete, sender=ContaReceber)
+def invalidar_dre_conta_receber(sender, instance, **kwargs):
+    """
+    Invalida o snapshot do DRE do mês do recebimento
+    """
+    invalidar_dre(instance.data_recebimento, getattr(instance, '_data_liquidacao_anterior', None))
+
+
+@receiver(post_save, sender=CategoriaDRE)
+@receiver(post_delete, sender=CategoriaDRE)
+def invalidar_dre_categoria(sender, instance, **kwargs):
+    """
+    Categorias alteradas (ex.: desativadas) afetam todos os meses
+    """
+    invalidar_todos()
@@ -7,6 +7,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.mixins import StreamingExportMixin
 from django.utils import timezone
 from django.db.models import Sum, Q
 from decimal import Decimal
@@ -44,7 +45,7 @@ class ContaBancariaViewSet(viewsets.ModelViewSet):
     ordering_fields = ['banco', 'saldo_atual']
 
 
-class ContaPagarViewSet(viewsets.ModelViewSet):
+class ContaPagarViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     """ViewSet for ContaPagar"""
     queryset = ContaPagar.objects.select_related('fornecedor', 'categoria', 'conta_bancaria').all()
     permission_classes = [IsAuthenticated]
@@ -106,7 +107,7 @@ class ContaPagarViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class ContaReceberViewSet(viewsets.ModelViewSet):
+class ContaReceberViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     """ViewSet for ContaReceber"""
     queryset = ContaReceber.objects.select_related('cliente', 'categoria', 'conta_bancaria').all()
     permission_classes = [IsAuthenticated]
@@ -0,0 +1,154 @@
+"""
+Camada analítica dos relatórios (pandas/NumPy)
+
+Carrega fatias colunares do banco com uma única consulta
+(`values_list` → DataFrame) e calcula os agregados de forma vetorizada:
+percentis, médias, curva ABC e pivots por período.
+"""
+
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+
+CHUNK_SIZE = 5000
+
+
+def carregar(queryset, *campos, numericos=()):
+    """
+    DataFrame com as colunas `campos` do queryset (uma consulta)
+
+    Colunas em `numericos` (Decimal no banco) são convertidas para float.
+    """
+    df = pd.DataFrame.from_records(
+        queryset.values_list(*campos).iterator(chunk_size=CHUNK_SIZE),
+        columns=list(campos)
+    )
+    for coluna in numericos:
+        df[coluna] = pd.to_numeric(df[coluna], errors='coerce').astype(float)
+    return df
+
+
+def _arredondar(valor, casas=2):
+    return None if valor is None or pd.isna(valor) else round(float(valor), casas)
+
+
+def estatisticas(serie, percentis=(50, 90), casas=2):
+    """Quantidade, média, mínimo, máximo e percentis (pXX) de uma série"""
+    serie = pd.Series(serie, dtype=float).dropna()
+    resultado = {'quantidade': int(serie.size)}
+    if serie.empty:
+        resultado.update({'media': None, 'minimo': None, 'maximo': None})
+        resultado.update({f'p{p}': None for p in percentis})
+        return resultado
+
+    valores = np.percentile(serie.to_numpy(), percentis)
+    resultado.update({
+        'media': _arredondar(serie.mean(), casas),
+        'minimo': _arredondar(serie.min(), casas),
+        'maximo': _arredondar(serie.max(), casas),
+    })
+    resultado.update({f'p{p}': _arredondar(v, casas) for p, v in zip(percentis, valores)})
+    return resultado
+
+
+def _datas_locais(serie):
+    """Datas/datetimes como datetime64 sem fuso, no fuso horário corrente"""
+    datas = pd.to_datetime(serie)
+    if getattr(datas.dt, 'tz', None) is not None:
+        datas = datas.dt.tz_convert(str(timezone.get_current_timezone())).dt.tz_localize(None)
+    return datas
+
+
+def duracao_dias(df, inicio, fim):
+    """Série com a duração em dias (fracionários) entre duas colunas datetime"""
+    if df.empty:
+        return pd.Series(dtype=float)
+    delta = pd.to_datetime(df[fim], utc=True) - pd.to_datetime(df[inicio], utc=True)
+    return delta.dt.total_seconds() / 86400
+
+
+def curva_abc(df, chave, valor, limites=(80, 95)):
+    """
+    Classificação ABC por participação acumulada no valor
+
+    Retorna lista de dicts ordenada pelo valor: chave, valor, percentual,
+    percentual_acumulado e classe (A até limites[0]%, B até limites[1]%, C).
+    """
+    if df.empty:
+        return []
+
+    totais = df.groupby(chave, sort=False)[valor].sum().sort_values(ascending=False)
+    total = totais.sum()
+    if not total:
+        return []
+
+    percentual = totais / total * 100
+    acumulado = percentual.cumsum().round(6)
+    # O item de maior valor é sempre A, mesmo que sozinho passe do limite
+    primeiro = np.arange(len(totais)) == 0
+    classe = np.select(
+        [(acumulado <= limites[0]) | primeiro, acumulado <= limites[1]],
+        ['A', 'B'],
+        default='C'
+    )
+    return [
+        {
+            chave: item,
+            valor: _arredondar(v),
+            'percentual': _arredondar(p),
+            'percentual_acumulado': _arredondar(a),
+            'classe': c,
+        }
+        for item, v, p, a, c in zip(totais.index, totais.to_numpy(), percentual.to_numpy(),
+                                    acumulado.to_numpy(), classe)
+    ]
+
+
+def pivot_periodo(df, data, valor, colunas=None, freq='D'):
+    """
+    Soma de `valor` por período (freq pandas: 'D', 'W', 'M'...) e,
+    opcionalmente, por categoria em `colunas`
+
+    Retorna DataFrame indexado pelo início do período.
+    """
+    if df.empty:
+        return pd.DataFrame()
+
+    periodo = _datas_locais(df[data]).dt.to_period(freq).dt.start_time
+    agrupado = df.assign(periodo=periodo)
+    if colunas:
+        return agrupado.pivot_table(
+            index='periodo', columns=colunas, values=valor, aggfunc='sum', fill_value=0
+        )
+    return agrupado.groupby('periodo')[[valor]].sum()
+
+
+def totais_por_periodo(df, data, valor, freq='D', nome_periodo='dia'):
+    """Total e quantidade de registros por período, como lista de dicts"""
+    if df.empty:
+        return []
+
+    periodo = _datas_locais(df[data]).dt.to_period(freq).dt.start_time
+    agrupado = df.groupby(periodo.rename('periodo'))[valor].agg(['sum', 'count'])
+    return [
+        {nome_periodo: inicio.date(), 'total': _arredondar(total), 'quantidade': int(quantidade)}
+        for inicio, total, quantidade in zip(agrupado.index, agrupado['sum'], agrupado['count'])
+    ]
+
+
+def pivot_para_registros(pivot, nome_indice='dia', nome_coluna='tipo', nome_valor='total'):
+    """Converte um pivot por período/categoria em lista de registros longos"""
+    if pivot.empty:
+        return []
+
+    longo = pivot.stack().reset_index()
+    longo.columns = [nome_indice, nome_coluna, nome_valor]
+    longo = longo[longo[nome_valor] != 0]
+    return [
+        {
+            nome_indice: linha[nome_indice].date(),
+            nome_coluna: linha[nome_coluna],
+            nome_valor: _arredondar(linha[nome_valor]),
+        }
+        for linha in longo.to_dict('records')
+    ]
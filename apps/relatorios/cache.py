@@ -0,0 +1,112 @@
+"""
+Cache dos relatórios por tenant
+
+As respostas ficam no cache sob uma chave que inclui o schema do tenant,
+uma versão e os parâmetros da requisição. Alterações nos dados só
+incrementam a versão do tenant (ver `signals.py`); as chaves antigas
+deixam de ser lidas e expiram sozinhas.
+
+Com réplica de leitura (`reporting`), logo após uma invalidação a réplica
+ainda pode não ter os dados novos: durante RELATORIOS_REPLICA_ATRASO
+segundos os relatórios são recalculados no primário, para não gravar
+números antigos sob a versão nova.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.response import Response
+
+from apps.core.routers import banco_relatorios_configurado, usar_banco_primario
+from apps.core.utils import get_schema_name
+
+# Parâmetros que geram respostas binárias (PDF/Excel) não são cacheados
+PARAMS_SEM_CACHE = ('export', 'format')
+
+
+def _schema():
+    return get_schema_name() or 'public'
+
+
+def _chave_versao(schema):
+    return f'relatorios:versao:{schema}'
+
+
+def _chave_primario(schema):
+    return f'relatorios:primario:{schema}'
+
+
+def versao_atual(schema=None):
+    """Versão dos dados do tenant (1 se ainda não existir)"""
+    chave = _chave_versao(schema or _schema())
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, 1, None)
+        versao = cache.get(chave, 1)
+    return versao
+
+
+def invalidar_relatorios(schema=None):
+    """Incrementa a versão do tenant, invalidando todos os relatórios cacheados"""
+    schema = schema or _schema()
+    chave = _chave_versao(schema)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, 2, None)
+    if banco_relatorios_configurado():
+        cache.set(_chave_primario(schema), True, getattr(settings, 'RELATORIOS_REPLICA_ATRASO', 30))
+
+
+def ler_do_primario(schema=None):
+    """A réplica pode ainda não ter a última alteração do tenant"""
+    return banco_relatorios_configurado() and bool(cache.get(_chave_primario(schema or _schema())))
+
+
+def chave_relatorio(nome, params):
+    """
+    Chave do relatório para o tenant, versão e parâmetros atuais
+
+    Inclui a data de hoje: KPIs como "vence hoje" e "atrasadas" mudam na
+    virada do dia mesmo sem alteração nos dados.
+    """
+    schema = _schema()
+    itens = sorted((k, tuple(params.getlist(k))) for k in params.keys())
+    assinatura = hashlib.md5(repr(itens).encode()).hexdigest()
+    hoje = timezone.localdate().isoformat()
+    return f'relatorios:{schema}:v{versao_atual(schema)}:{nome}:{hoje}:{assinatura}'
+
+
+def relatorio_em_cache(nome, timeout=None):
+    """
+    Decorator para `get` de APIViews de relatórios
+
+    Serve `response.data` do cache quando disponível e grava respostas 200.
+    """
+    def decorator(metodo):
+        @wraps(metodo)
+        def wrapper(self, request, *args, **kwargs):
+            if any(p in request.query_params for p in PARAMS_SEM_CACHE):
+                return metodo(self, request, *args, **kwargs)
+
+            chave = chave_relatorio(nome, request.query_params)
+            data = cache.get(chave)
+            if data is not None:
+                return Response(data)
+
+            if ler_do_primario():
+                with usar_banco_primario():
+                    response = metodo(self, request, *args, **kwargs)
+            else:
+                response = metodo(self, request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                cache.set(
+                    chave, response.data,
+                    timeout or getattr(settings, 'RELATORIOS_CACHE_TIMEOUT', 900)
+                )
+            return response
+        return wrapper
+    return decorator
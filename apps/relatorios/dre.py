@@ -0,0 +1,364 @@
+"""
+Motor de cálculo do DRE (Demonstrativo de Resultado do Exercício)
+
+Calcula todas as categorias de todos os meses de um intervalo com um
+punhado de consultas agrupadas por mês (uma por fonte de dados) e monta
+as linhas do DRE em memória. O custo das mercadorias vendidas e das
+peças das OS é o apurado pelo motor de custos do estoque.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from apps.vendas.models import Venda
+from apps.assistencia.models import OrdemServico
+from apps.estoque.models import CustoMovimentacao
+from apps.financeiro.models import ContaPagar, ContaReceber
+
+
+# Status de venda que geram receita
+VENDA_STATUS_RECEITA = ['faturado', 'entregue', 'finalizada']
+
+# Chaves das fontes que não vêm de CategoriaDRE (as demais chaves são
+# os códigos das categorias: '5', '6', '7', '8'...)
+VENDA_RECEITA = 'venda_receita'
+VENDA_DESCONTO = 'venda_desconto'
+VENDA_CUSTO = 'venda_custo'
+OS_SERVICOS = 'os_servicos'
+OS_PECAS = 'os_pecas'
+OS_FRETE = 'os_frete'
+OS_DESCONTO = 'os_desconto'
+OS_CUSTO = 'os_custo'
+
+ZERO = Decimal('0')
+
+
+def limites_mes(ano, mes):
+    """Primeiro e último dia do mês"""
+    inicio = date(ano, mes, 1)
+    if mes == 12:
+        fim = date(ano + 1, 1, 1) - timedelta(days=1)
+    else:
+        fim = date(ano, mes + 1, 1) - timedelta(days=1)
+    return inicio, fim
+
+
+def meses_do_intervalo(inicio, fim):
+    """Lista de (ano, mes) entre duas datas, inclusive"""
+    meses = []
+    ano, mes = inicio.year, inicio.month
+    while (ano, mes) <= (fim.year, fim.month):
+        meses.append((ano, mes))
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+
+def limites_datetime(inicio, fim):
+    """Converte [inicio, fim] em datas para [inicio 00:00, fim+1 00:00)"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(inicio, time.min), tz),
+        timezone.make_aware(datetime.combine(fim + timedelta(days=1), time.min), tz),
+    )
+
+
+def _chave_mes(valor):
+    """Normaliza o retorno de TruncMonth (date ou datetime) para (ano, mes)"""
+    return (valor.year, valor.month)
+
+
+class DREEngine:
+    """
+    Calcula os valores brutos do DRE mês a mês para um intervalo de datas
+
+    Os valores brutos são somas por chave (código da categoria DRE ou
+    fonte de vendas/OS) e podem ser somados entre meses livremente; as
+    linhas do DRE são derivadas deles por `calcular_linhas`.
+    """
+
+    def __init__(self, inicio, fim):
+        self.inicio = inicio
+        self.fim = fim
+
+    def valores_por_mes(self):
+        """
+        Retorna {(ano, mes): {chave: Decimal}} para todos os meses do intervalo
+        """
+        meses = {mes: defaultdict(Decimal) for mes in meses_do_intervalo(self.inicio, self.fim)}
+        for mes, chave, valor in self._consultar():
+            if valor:
+                meses[mes][chave] += Decimal(valor)
+        return meses
+
+    def valores_totais(self):
+        """Valores brutos somados de todo o intervalo"""
+        totais = defaultdict(Decimal)
+        for valores in self.valores_por_mes().values():
+            for chave, valor in valores.items():
+                totais[chave] += valor
+        return totais
+
+    # ------------------------------------------------------------------
+    # Consultas agrupadas por mês
+    # ------------------------------------------------------------------
+    def _consultar(self):
+        """Gera tuplas ((ano, mes), chave, valor) de todas as fontes"""
+        yield from self._contas()
+        yield from self._vendas()
+        yield from self._ordens_servico()
+
+    def _contas(self):
+        """Categorias DRE: despesas/custos/deduções pagas e receitas recebidas"""
+        pagar = ContaPagar.objects.filter(
+            status='pago',
+            data_pagamento__gte=self.inicio,
+            data_pagamento__lte=self.fim,
+            categoria_dre__ativo=True,
+        ).exclude(
+            categoria_dre__tipo='receita'
+        ).annotate(
+            mes=TruncMonth('data_pagamento')
+        ).values('mes', 'categoria_dre__codigo').annotate(
+            total=Sum('valor_original')
+        ).order_by()
+
+        receber = ContaReceber.objects.filter(
+            status='recebido',
+            data_recebimento__gte=self.inicio,
+            data_recebimento__lte=self.fim,
+            categoria_dre__ativo=True,
+            categoria_dre__tipo='receita',
+        ).annotate(
+            mes=TruncMonth('data_recebimento')
+        ).values('mes', 'categoria_dre__codigo').annotate(
+            total=Sum('valor_original')
+        ).order_by()
+
+        for linha in list(pagar) + list(receber):
+            yield _chave_mes(linha['mes']), linha['categoria_dre__codigo'], linha['total']
+
+    def _vendas(self):
+        """Receita, descontos e custo das mercadorias vendidas"""
+        dt_inicio, dt_fim = limites_datetime(self.inicio, self.fim)
+
+        vendas = Venda.objects.filter(
+            status__in=VENDA_STATUS_RECEITA,
+            data_venda__gte=dt_inicio,
+            data_venda__lt=dt_fim,
+        ).annotate(
+            mes=TruncMonth('data_venda')
+        ).values('mes').annotate(
+            receita=Sum(F('valor_produtos') + F('valor_acrescimo')),
+            desconto=Sum('valor_desconto'),
+        ).order_by()
+
+        for linha in vendas:
+            mes = _chave_mes(linha['mes'])
+            yield mes, VENDA_RECEITA, linha['receita']
+            yield mes, VENDA_DESCONTO, linha['desconto']
+
+        # Custo apurado pelo motor de custos nas saídas das vendas
+        custos = CustoMovimentacao.objects.filter(
+            movimentacao__documento='venda',
+            movimentacao__data_movimentacao__gte=dt_inicio,
+            movimentacao__data_movimentacao__lt=dt_fim,
+            movimentacao__documento_numero__in=Venda.objects.filter(
+                status__in=VENDA_STATUS_RECEITA
+            ).values('numero'),
+        ).annotate(
+            mes=TruncMonth('movimentacao__data_movimentacao')
+        ).values('mes').annotate(
+            custo=Sum('custo_total')
+        ).order_by()
+
+        for linha in custos:
+            yield _chave_mes(linha['mes']), VENDA_CUSTO, linha['custo']
+
+    def _ordens_servico(self):
+        """Serviços, peças, frete, descontos e custo das peças das OS"""
+        dt_inicio, dt_fim = limites_datetime(self.inicio, self.fim)
+
+        ordens = OrdemServico.objects.filter(
+            data_abertura__gte=dt_inicio,
+            data_abertura__lt=dt_fim,
+        ).annotate(
+            mes=TruncMonth('data_abertura')
+        ).values('mes').annotate(
+            servicos=Sum('valor_servico'),
+            pecas=Sum('valor_pecas'),
+            frete=Sum('valor_frete'),
+            desconto=Sum('valor_desconto'),
+        ).order_by()
+
+        for linha in ordens:
+            mes = _chave_mes(linha['mes'])
+            yield mes, OS_SERVICOS, linha['servicos']
+            yield mes, OS_PECAS, linha['pecas']
+            yield mes, OS_FRETE, linha['frete']
+            yield mes, OS_DESCONTO, linha['desconto']
+
+        custos = CustoMovimentacao.objects.filter(
+            movimentacao__documento='os',
+            movimentacao__data_movimentacao__gte=dt_inicio,
+            movimentacao__data_movimentacao__lt=dt_fim,
+        ).annotate(
+            mes=TruncMonth('movimentacao__data_movimentacao')
+        ).values('mes').annotate(
+            custo=Sum('custo_total')
+        ).order_by()
+
+        for linha in custos:
+            yield _chave_mes(linha['mes']), OS_CUSTO, linha['custo']
+
+
+def calcular_linhas(brutos):
+    """
+    Deriva todas as linhas do DRE a partir dos valores brutos de um período
+
+    Retorna o mesmo dicionário de valores (em float) usado pelas views.
+    """
+    def v(chave):
+        return brutos.get(chave, ZERO) or ZERO
+
+    # ---------- Receita Bruta ----------
+    vendas_produtos = v(VENDA_RECEITA)
+    vendas_mercadorias = v(OS_PECAS)
+    prestacao_servicos = v(OS_SERVICOS)
+    frete = v(OS_FRETE)
+    receita_bruta_total = vendas_produtos + vendas_mercadorias + prestacao_servicos + frete
+
+    # ---------- Deduções ----------
+    devolucoes = v('5')
+    abatimentos = v('6') + v(VENDA_DESCONTO) + v(OS_DESCONTO)
+    impostos = v('7')
+    deducoes_total = devolucoes + abatimentos + impostos
+
+    # ---------- Receita Líquida ----------
+    receita_liquida = receita_bruta_total - deducoes_total
+
+    # ---------- Custos ----------
+    custo_produtos = v('8')
+    custo_mercadorias = v(VENDA_CUSTO)
+    custo_servicos = v(OS_CUSTO) + v('10')
+    custos_total = custo_produtos + custo_mercadorias + custo_servicos
+
+    # ---------- Lucro Bruto ----------
+    lucro_bruto = receita_liquida - custos_total
+
+    # ---------- Despesas Operacionais ----------
+    despesas_vendas = v('11')
+    despesas_administrativas = v('12')
+    pagamento_salarios = v('13')
+    despesas_operacionais_total = despesas_vendas + despesas_administrativas + pagamento_salarios
+
+    # ---------- Despesas Financeiras Líquidas ----------
+    despesas_financeiras_liquidas = v('15') - v('14')
+
+    # ---------- Outras Receitas e Despesas ----------
+    outras_receitas_despesas = (v('16') + v('17') + v('21')) - (v('18') + v('22'))
+
+    # ---------- Resultado Operacional ----------
+    resultado_operacional = (
+        lucro_bruto - despesas_operacionais_total
+        + despesas_financeiras_liquidas + outras_receitas_despesas
+    )
+
+    # ---------- Provisão IR/CSLL e Participações ----------
+    provisao_ir_csll = v('19')
+    lucro_antes_participacoes = resultado_operacional - provisao_ir_csll
+    participacoes = v('20')
+
+    # ---------- Lucro Líquido ----------
+    lucro_liquido = lucro_antes_participacoes - participacoes
+    margem_liquida = (lucro_liquido / receita_bruta_total * 100) if receita_bruta_total > 0 else 0
+
+    return {
+        'vendas_produtos': float(vendas_produtos),
+        'vendas_mercadorias': float(vendas_mercadorias),
+        'prestacao_servicos': float(prestacao_servicos),
+        'frete': float(frete),
+        'receita_bruta_total': float(receita_bruta_total),
+        'devolucoes': float(devolucoes),
+        'abatimentos': float(abatimentos),
+        'impostos': float(impostos),
+        'deducoes_total': float(deducoes_total),
+        'receita_liquida': float(receita_liquida),
+        'custo_produtos': float(custo_produtos),
+        'custo_mercadorias': float(custo_mercadorias),
+        'custo_servicos': float(custo_servicos),
+        'custos_total': float(custos_total),
+        'lucro_bruto': float(lucro_bruto),
+        'despesas_vendas': float(despesas_vendas),
+        'despesas_administrativas': float(despesas_administrativas),
+        'pagamento_salarios': float(pagamento_salarios),
+        'despesas_operacionais_total': float(despesas_operacionais_total),
+        'despesas_financeiras_liquidas': float(despesas_financeiras_liquidas),
+        'outras_receitas_despesas': float(outras_receitas_despesas),
+        'resultado_operacional': float(resultado_operacional),
+        'provisao_ir_csll': float(provisao_ir_csll),
+        'lucro_antes_participacoes': float(lucro_antes_participacoes),
+        'participacoes': float(participacoes),
+        'lucro_liquido': float(lucro_liquido),
+        'margem_liquida': round(float(margem_liquida), 2),
+    }
+
+
+# ----------------------------------------------------------------------
+# Comparativo entre períodos
+# ----------------------------------------------------------------------
+GRANULARIDADES = ('mes', 'trimestre', 'ano')
+
+
+def rotulo_periodo(ano, mes, granularidade):
+    """Rótulo do período que contém o mês: '2024-03', '2024-T1' ou '2024'"""
+    if granularidade == 'ano':
+        return str(ano)
+    if granularidade == 'trimestre':
+        return f'{ano}-T{(mes - 1) // 3 + 1}'
+    return f'{ano}-{mes:02d}'
+
+
+def agrupar_meses(meses, granularidade):
+    """
+    Agrupa [(ano, mes)] em períodos consecutivos da granularidade
+
+    Retorna [(rotulo, [(ano, mes), ...])] na ordem cronológica.
+    """
+    periodos = []
+    for ano, mes in meses:
+        rotulo = rotulo_periodo(ano, mes, granularidade)
+        if not periodos or periodos[-1][0] != rotulo:
+            periodos.append((rotulo, []))
+        periodos[-1][1].append((ano, mes))
+    return periodos
+
+
+def somar_brutos(valores_por_mes, meses):
+    """Soma os valores brutos de vários meses (são aditivos)"""
+    totais = defaultdict(Decimal)
+    for mes in meses:
+        for chave, valor in valores_por_mes[mes].items():
+            totais[chave] += valor
+    return totais
+
+
+def variacoes(anterior, atual):
+    """
+    Delta e variação percentual, linha a linha, entre dois períodos
+
+    A variação é None quando o valor anterior é zero.
+    """
+    resultado = {}
+    for linha, valor in atual.items():
+        base = anterior.get(linha, 0)
+        delta = valor - base
+        resultado[linha] = {
+            'delta': round(delta, 2),
+            'percentual': round(delta / abs(base) * 100, 2) if base else None,
+        }
+    return resultado
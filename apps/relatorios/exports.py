@@ -0,0 +1,157 @@
+"""
+Builders dos relatórios exportáveis
+
+Cada builder recebe os parâmetros da requisição (QueryDict ou dict) e
+retorna as planilhas [(titulo, cabecalhos, linhas)] ou o conteúdo do
+arquivo. São usados tanto pelas views (resposta direta) quanto pelos
+jobs assíncronos (`jobs.py`).
+"""
+
+import io
+
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+
+from apps.vendas.models import Venda
+from apps.estoque.models import MovimentacaoEstoque
+from apps.financeiro.models import ContaPagar, ContaReceber
+from .dre import VENDA_STATUS_RECEITA
+from .utils import StreamingExcelExporter
+
+
+def filtrar_vendas(params):
+    """Vendas com receita filtradas por data_inicio, data_fim e cliente_id"""
+    vendas = Venda.objects.filter(status__in=VENDA_STATUS_RECEITA)
+    if params.get('data_inicio'):
+        vendas = vendas.filter(data_venda__gte=params['data_inicio'])
+    if params.get('data_fim'):
+        vendas = vendas.filter(data_venda__lte=params['data_fim'])
+    if params.get('cliente_id'):
+        vendas = vendas.filter(cliente_id=params['cliente_id'])
+    return vendas
+
+
+def planilhas_vendas(params):
+    linhas = StreamingExcelExporter.linhas(
+        filtrar_vendas(params).order_by('data_venda', 'id'),
+        'numero', 'data_venda', 'cliente__nome_razao_social', 'vendedor__username',
+        'status', 'valor_produtos', 'valor_desconto', 'valor_acrescimo', 'valor_total'
+    )
+    return [(
+        'Vendas',
+        ['Número', 'Data', 'Cliente', 'Vendedor', 'Status',
+         'Produtos', 'Desconto', 'Acréscimo', 'Total'],
+        linhas
+    )]
+
+
+def planilhas_estoque(params):
+    movimentacoes = MovimentacaoEstoque.objects.all()
+    if params.get('data_inicio'):
+        movimentacoes = movimentacoes.filter(data_movimentacao__gte=params['data_inicio'])
+    if params.get('data_fim'):
+        movimentacoes = movimentacoes.filter(data_movimentacao__lte=params['data_fim'])
+
+    linhas = StreamingExcelExporter.linhas(
+        movimentacoes.order_by('data_movimentacao', 'id'),
+        'data_movimentacao', 'tipo', 'produto__codigo_interno', 'produto__nome',
+        'quantidade', 'quantidade_anterior', 'quantidade_nova', 'valor_unitario',
+        'valor_total', 'documento', 'documento_numero', 'lote', 'motivo', 'usuario__username'
+    )
+    return [(
+        'Movimentações',
+        ['Data', 'Tipo', 'Código', 'Produto', 'Quantidade', 'Qtd. Anterior', 'Qtd. Nova',
+         'Valor Unitário', 'Valor Total', 'Documento', 'Nº Documento', 'Lote', 'Motivo', 'Usuário'],
+        linhas
+    )]
+
+
+def planilhas_financeiro(params):
+    """Contas a receber e a pagar por vencimento"""
+    periodo = {}
+    if params.get('data_inicio'):
+        periodo['data_vencimento__gte'] = params['data_inicio']
+    if params.get('data_fim'):
+        periodo['data_vencimento__lte'] = params['data_fim']
+
+    receber = StreamingExcelExporter.linhas(
+        ContaReceber.objects.filter(**periodo).order_by('data_vencimento', 'id'),
+        'numero', 'descricao', 'cliente__nome_razao_social', 'categoria__nome', 'data_emissao',
+        'data_vencimento', 'data_recebimento', 'valor_original', 'valor_recebido', 'status'
+    )
+    pagar = StreamingExcelExporter.linhas(
+        ContaPagar.objects.filter(**periodo).order_by('data_vencimento', 'id'),
+        'numero', 'descricao', 'fornecedor__razao_social', 'categoria__nome', 'data_emissao',
+        'data_vencimento', 'data_pagamento', 'valor_original', 'valor_pago', 'status'
+    )
+    return [
+        ('Contas a Receber',
+         ['Número', 'Descrição', 'Cliente', 'Categoria', 'Emissão', 'Vencimento',
+          'Recebimento', 'Valor Original', 'Valor Recebido', 'Status'],
+         receber),
+        ('Contas a Pagar',
+         ['Número', 'Descrição', 'Fornecedor', 'Categoria', 'Emissão', 'Vencimento',
+          'Pagamento', 'Valor Original', 'Valor Pago', 'Status'],
+         pagar),
+    ]
+
+
+# ----------------------------------------------------------------------
+# DRE
+# ----------------------------------------------------------------------
+def dados_dre(params):
+    """DRE mensal (com `mes`) ou anual, como retornado pela API"""
+    from .views_dre import DREBaseView
+
+    ano = int(params.get('ano') or timezone.now().year)
+    mes = params.get('mes')
+    calculator = DREBaseView()
+    if mes:
+        return calculator._calcular_dre_mensal(ano, int(mes))
+    return calculator._calcular_dre_anual(ano)
+
+
+def _achatar(prefix, obj, sep):
+    """Achata dicts/listas aninhados em (campo, valor)"""
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            yield from _achatar(f"{prefix}{k}{sep}", v, sep)
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj, 1):
+            yield from _achatar(f"{prefix}{i}{sep}", v, sep)
+    else:
+        yield prefix.rstrip(sep), obj
+
+
+def planilhas_dre(params):
+    return [('DRE', ['Campo', 'Valor'], _achatar('', dados_dre(params), '_'))]
+
+
+def pdf_dre(params):
+    """Conteúdo (bytes) do PDF do DRE"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    elements = [Paragraph('Relatório DRE', styles['Title'])]
+    rows = [[campo, str(valor)] for campo, valor in _achatar('', dados_dre(params), ' ')]
+    table = Table(rows, colWidths=[200, 300])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(table)
+    doc.build(elements)
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def nome_arquivo_dre(params, extensao):
+    ano = params.get('ano') or timezone.now().year
+    mes = params.get('mes')
+    return f'dre_{ano}_{mes if mes else "annual"}.{extensao}'
@@ -0,0 +1,187 @@
+"""
+Jobs assíncronos de relatórios
+
+`solicitar_relatorio` cria (ou reaproveita) um RelatorioJob e agenda a
+task Celery; `gerar_relatorio` roda no worker, grava o arquivo em
+MEDIA_ROOT e marca a expiração; `limpar_expirados` remove arquivos e
+registros vencidos.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.core.utils import get_schema_name
+from . import exports
+from .models import RelatorioJob
+from .utils import StreamingExcelExporter
+
+logger = logging.getLogger(__name__)
+
+# Builders por tipo e formato
+PLANILHAS = {
+    'dre': exports.planilhas_dre,
+    'vendas': exports.planilhas_vendas,
+    'estoque': exports.planilhas_estoque,
+    'financeiro': exports.planilhas_financeiro,
+}
+PDFS = {
+    'dre': exports.pdf_dre,
+}
+
+# Frequência de atualização do progresso (em linhas)
+INTERVALO_PROGRESSO = 1000
+
+
+def formatos_disponiveis(tipo):
+    formatos = []
+    if tipo in PLANILHAS:
+        formatos.append('xlsx')
+    if tipo in PDFS:
+        formatos.append('pdf')
+    return formatos
+
+
+def _expiracao():
+    return timedelta(hours=getattr(settings, 'RELATORIOS_JOB_EXPIRACAO_HORAS', 24))
+
+
+def _tempo_maximo():
+    return timedelta(minutes=getattr(settings, 'RELATORIOS_JOB_TEMPO_MAXIMO_MINUTOS', 60))
+
+
+def chave_job(tipo, formato, parametros):
+    """Identifica requisições idênticas"""
+    conteudo = json.dumps([tipo, formato, parametros], sort_keys=True, default=str)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def solicitar_relatorio(tipo, formato, parametros, usuario=None):
+    """
+    Retorna (job, criado)
+
+    Reaproveita um job idêntico em andamento (dentro do tempo máximo) ou
+    concluído e ainda não expirado; caso contrário cria um novo e agenda
+    a geração após o commit.
+    """
+    if formato not in formatos_disponiveis(tipo):
+        raise ValueError(f'Formato {formato!r} indisponível para o relatório {tipo!r}')
+
+    agora = timezone.now()
+    chave = chave_job(tipo, formato, parametros)
+    existente = RelatorioJob.objects.filter(chave=chave).filter(
+        Q(status__in=['pendente', 'processando'], criado_em__gte=agora - _tempo_maximo()) |
+        Q(status='concluido', expira_em__gt=agora)
+    ).order_by('-criado_em').first()
+    if existente:
+        if usuario is not None and existente.usuario_id != usuario.pk:
+            existente.solicitantes.add(usuario)
+        return existente, False
+
+    job = RelatorioJob.objects.create(
+        tipo=tipo,
+        formato=formato,
+        parametros=parametros,
+        chave=chave,
+        usuario=usuario
+    )
+    schema_name = get_schema_name()
+    transaction.on_commit(lambda: _agendar(job.pk, schema_name))
+    return job, True
+
+
+def _agendar(job_id, schema_name):
+    from .tasks import gerar_relatorio_job
+
+    try:
+        gerar_relatorio_job.delay(job_id, schema_name=schema_name)
+    except Exception as e:
+        logger.error('Não foi possível agendar o relatório %s: %s', job_id, e)
+        RelatorioJob.objects.filter(pk=job_id).update(
+            status='erro', erro='Fila de processamento indisponível'
+        )
+
+
+def _acompanhar(job, linhas, planilha, total_planilhas):
+    """Repassa as linhas atualizando progresso/linhas processadas do job"""
+    inicio = 5 + 85 * planilha // total_planilhas
+    fim = 5 + 85 * (planilha + 1) // total_planilhas
+    contadas = 0
+    for linha in linhas:
+        yield linha
+        contadas += 1
+        if contadas % INTERVALO_PROGRESSO == 0:
+            RelatorioJob.objects.filter(pk=job.pk).update(
+                linhas_processadas=job.linhas_processadas + contadas,
+                progresso=inicio
+            )
+    job.linhas_processadas += contadas
+    RelatorioJob.objects.filter(pk=job.pk).update(
+        linhas_processadas=job.linhas_processadas,
+        progresso=fim
+    )
+
+
+def gerar_relatorio(job):
+    """Gera o arquivo do job (executado pelo worker)"""
+    job.status = 'processando'
+    job.progresso = 5
+    job.save(update_fields=['status', 'progresso'])
+
+    try:
+        nome = f'{job.tipo}.{job.formato}'
+        if job.formato == 'pdf':
+            conteudo = ContentFile(PDFS[job.tipo](job.parametros))
+        else:
+            planilhas = PLANILHAS[job.tipo](job.parametros)
+            planilhas = [
+                (titulo, cabecalhos, _acompanhar(job, linhas, i, len(planilhas)))
+                for i, (titulo, cabecalhos, linhas) in enumerate(planilhas)
+            ]
+            conteudo = File(StreamingExcelExporter.gerar_arquivo(planilhas))
+
+        with conteudo:
+            job.arquivo.save(nome, conteudo, save=False)
+    except Exception as e:
+        logger.exception('Erro ao gerar relatório %s', job.pk)
+        job.status = 'erro'
+        job.erro = str(e)
+        job.save(update_fields=['status', 'erro'])
+        return job
+
+    agora = timezone.now()
+    job.status = 'concluido'
+    job.progresso = 100
+    job.concluido_em = agora
+    job.expira_em = agora + _expiracao()
+    job.save(update_fields=['arquivo', 'status', 'progresso', 'linhas_processadas', 'concluido_em', 'expira_em'])
+    return job
+
+
+def limpar_expirados():
+    """Remove arquivos e jobs expirados (e jobs com erro antigos)"""
+    agora = timezone.now()
+    expirados = RelatorioJob.objects.filter(
+        Q(expira_em__lte=agora) |
+        Q(status='erro', criado_em__lte=agora - _expiracao())
+    )
+    removidos = 0
+    for job in expirados.iterator():
+        if job.arquivo:
+            job.arquivo.delete(save=False)
+        job.delete()
+        removidos += 1
+    return removidos
+
+
+def nome_download(job):
+    return f'relatorio_{job.tipo}_{job.pk}{os.path.splitext(job.arquivo.name)[1]}'
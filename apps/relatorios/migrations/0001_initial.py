@@ -0,0 +1,31 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DRESnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano', models.IntegerField(verbose_name='Ano')),
+                ('mes', models.IntegerField(verbose_name='Mês')),
+                ('codigo', models.CharField(max_length=30, verbose_name='Código')),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor')),
+                ('calculado_em', models.DateTimeField(auto_now=True, verbose_name='Calculado em')),
+            ],
+            options={
+                'verbose_name': 'Snapshot do DRE',
+                'verbose_name_plural': 'Snapshots do DRE',
+                'ordering': ['ano', 'mes', 'codigo'],
+                'unique_together': {('ano', 'mes', 'codigo')},
+            },
+        ),
+    ]
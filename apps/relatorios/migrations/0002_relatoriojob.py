@@ -0,0 +1,42 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:47
+
+import apps.relatorios.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('relatorios', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatorioJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('dre', 'DRE'), ('vendas', 'Vendas'), ('estoque', 'Movimentações de Estoque'), ('financeiro', 'Contas a Receber/Pagar')], max_length=20, verbose_name='Tipo')),
+                ('formato', models.CharField(choices=[('xlsx', 'Excel'), ('pdf', 'PDF')], default='xlsx', max_length=10, verbose_name='Formato')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parâmetros')),
+                ('chave', models.CharField(db_index=True, max_length=64, verbose_name='Chave')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=20, verbose_name='Status')),
+                ('progresso', models.PositiveSmallIntegerField(default=0, verbose_name='Progresso (%)')),
+                ('linhas_processadas', models.PositiveIntegerField(default=0, verbose_name='Linhas Processadas')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('arquivo', models.FileField(blank=True, upload_to=apps.relatorios.models.caminho_relatorio, verbose_name='Arquivo')),
+                ('expira_em', models.DateTimeField(blank=True, null=True, verbose_name='Expira em')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('concluido_em', models.DateTimeField(blank=True, null=True, verbose_name='Concluído em')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='relatorio_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Job de Relatório',
+                'verbose_name_plural': 'Jobs de Relatórios',
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['chave', 'status'], name='relatorios__chave_71f223_idx'), models.Index(fields=['expira_em'], name='relatorios__expira__e998e3_idx')],
+            },
+        ),
+    ]
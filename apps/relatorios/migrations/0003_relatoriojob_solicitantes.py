@@ -0,0 +1,20 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('relatorios', '0002_relatoriojob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatoriojob',
+            name='solicitantes',
+            field=models.ManyToManyField(blank=True, related_name='relatorio_jobs_reaproveitados', to=settings.AUTH_USER_MODEL, verbose_name='Solicitantes'),
+        ),
+    ]
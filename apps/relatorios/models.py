@@ -1,2 +1,118 @@
-# Relatórios Module
-# No models needed - uses aggregations from other modules
+"""
+Relatorios Models - Snapshots materializados e jobs de relatórios
+"""
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class DRESnapshot(models.Model):
+    """
+    Valor bruto do DRE de um mês fechado, por chave
+
+    A chave é o código da CategoriaDRE ('5', '12'...) ou uma das fontes
+    de vendas/OS definidas em `apps.relatorios.dre`. Cada mês calculado
+    tem também uma linha sentinela (`CHAVE_MES_CALCULADO`) para que meses
+    sem movimento não sejam recalculados a cada leitura.
+    """
+    CHAVE_MES_CALCULADO = '__mes__'
+
+    ano = models.IntegerField('Ano')
+    mes = models.IntegerField('Mês')
+    codigo = models.CharField('Código', max_length=30)
+    valor = models.DecimalField('Valor', max_digits=15, decimal_places=2, default=0)
+    calculado_em = models.DateTimeField('Calculado em', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Snapshot do DRE'
+        verbose_name_plural = 'Snapshots do DRE'
+        ordering = ['ano', 'mes', 'codigo']
+        unique_together = ['ano', 'mes', 'codigo']
+
+    def __str__(self):
+        return f'DRE {self.mes:02d}/{self.ano} - {self.codigo}: {self.valor}'
+
+
+def caminho_relatorio(instance, filename):
+    """media/relatorios/<schema>/<AAAA>/<MM>/<job>_<arquivo>"""
+    from apps.core.utils import get_schema_name
+
+    agora = timezone.now()
+    schema = get_schema_name() or 'public'
+    return f'relatorios/{schema}/{agora:%Y/%m}/{instance.pk}_{filename}'
+
+
+class RelatorioJob(models.Model):
+    """
+    Geração assíncrona de um relatório (PDF/XLSX)
+
+    Requisições idênticas (mesmo tipo, formato e parâmetros) compartilham a
+    `chave`: enquanto um job está em andamento ou seu arquivo não expirou,
+    ele é reaproveitado em vez de gerar outro. Quem reaproveita entra em
+    `solicitantes` e, com o `usuario`, é quem pode consultar e baixar o job.
+    """
+    TIPO_CHOICES = [
+        ('dre', 'DRE'),
+        ('vendas', 'Vendas'),
+        ('estoque', 'Movimentações de Estoque'),
+        ('financeiro', 'Contas a Receber/Pagar'),
+    ]
+
+    FORMATO_CHOICES = [
+        ('xlsx', 'Excel'),
+        ('pdf', 'PDF'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+
+    tipo = models.CharField('Tipo', max_length=20, choices=TIPO_CHOICES)
+    formato = models.CharField('Formato', max_length=10, choices=FORMATO_CHOICES, default='xlsx')
+    parametros = models.JSONField('Parâmetros', default=dict, blank=True)
+    chave = models.CharField('Chave', max_length=64, db_index=True)
+
+    status = models.CharField('Status', max_length=20, choices=STATUS_CHOICES, default='pendente')
+    progresso = models.PositiveSmallIntegerField('Progresso (%)', default=0)
+    linhas_processadas = models.PositiveIntegerField('Linhas Processadas', default=0)
+    erro = models.TextField('Erro', blank=True)
+
+    arquivo = models.FileField('Arquivo', upload_to=caminho_relatorio, blank=True)
+    expira_em = models.DateTimeField('Expira em', null=True, blank=True)
+
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='relatorio_jobs',
+        verbose_name='Usuário'
+    )
+    solicitantes = models.ManyToManyField(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        related_name='relatorio_jobs_reaproveitados',
+        verbose_name='Solicitantes'
+    )
+    criado_em = models.DateTimeField('Criado em', auto_now_add=True)
+    concluido_em = models.DateTimeField('Concluído em', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Job de Relatório'
+        verbose_name_plural = 'Jobs de Relatórios'
+        ordering = ['-criado_em']
+        indexes = [
+            models.Index(fields=['chave', 'status']),
+            models.Index(fields=['expira_em']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_tipo_display()} ({self.formato}) - {self.get_status_display()}'
+
+    @property
+    def expirado(self):
+        return self.expira_em is not None and self.expira_em <= timezone.now()
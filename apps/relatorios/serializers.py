@@ -0,0 +1,48 @@
+"""
+Serializers for Relatorios models
+"""
+
+from rest_framework import serializers
+from django.urls import reverse
+from .models import RelatorioJob
+from .jobs import formatos_disponiveis
+
+
+class RelatorioJobSerializer(serializers.ModelSerializer):
+    """Serializer for RelatorioJob"""
+    
+    tipo_display = serializers.CharField(source='get_tipo_display', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    download_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = RelatorioJob
+        fields = [
+            'id', 'tipo', 'tipo_display', 'formato', 'parametros', 'status', 'status_display',
+            'progresso', 'linhas_processadas', 'erro', 'download_url', 'expira_em',
+            'criado_em', 'concluido_em'
+        ]
+        read_only_fields = [
+            'id', 'status', 'progresso', 'linhas_processadas', 'erro',
+            'expira_em', 'criado_em', 'concluido_em'
+        ]
+    
+    def get_download_url(self, obj):
+        if obj.status != 'concluido' or obj.expirado:
+            return None
+        url = reverse('relatorios:job-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+    
+    def validate_parametros(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Parâmetros devem ser um objeto')
+        return value
+    
+    def validate(self, attrs):
+        formato = attrs.get('formato', 'xlsx')
+        if formato not in formatos_disponiveis(attrs['tipo']):
+            raise serializers.ValidationError({
+                'formato': 'Formato indisponível para este relatório'
+            })
+        return attrs
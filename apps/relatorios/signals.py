@@ -0,0 +1,58 @@
+"""
+Signals for Relatorios app
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.core.utils import get_schema_name
+from apps.vendas.models import ItemVenda, Venda
+from apps.assistencia.models import OrdemServico
+from apps.compras.models import ItemPedidoCompra, PedidoCompra
+from apps.financeiro.models import ContaPagar, ContaReceber
+from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.signals import custos_atualizados, movimentacoes_lancadas
+from apps.erp.models import Produto
+from .cache import invalidar_relatorios
+from .snapshots import invalidar_dre
+
+
+@receiver(post_save, sender=Venda)
+@receiver(post_delete, sender=Venda)
+# Os totais da venda mudam por UPDATE quando um item muda (sem post_save de Venda)
+@receiver(post_save, sender=ItemVenda)
+@receiver(post_delete, sender=ItemVenda)
+@receiver(post_save, sender=PedidoCompra)
+@receiver(post_delete, sender=PedidoCompra)
+@receiver(post_save, sender=ItemPedidoCompra)
+@receiver(post_delete, sender=ItemPedidoCompra)
+@receiver(post_save, sender=OrdemServico)
+@receiver(post_delete, sender=OrdemServico)
+@receiver(post_save, sender=ContaPagar)
+@receiver(post_delete, sender=ContaPagar)
+@receiver(post_save, sender=ContaReceber)
+@receiver(post_delete, sender=ContaReceber)
+@receiver(post_save, sender=MovimentacaoEstoque)
+@receiver(post_delete, sender=MovimentacaoEstoque)
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+@receiver(movimentacoes_lancadas)
+@receiver(custos_atualizados)
+def invalidar_cache_relatorios(sender, **kwargs):
+    """
+    Invalida os relatórios cacheados do tenant após o commit
+
+    Invalidar antes do commit permitiria que outra requisição recolocasse
+    no cache os dados antigos.
+    """
+    schema_name = get_schema_name()
+    transaction.on_commit(lambda: invalidar_relatorios(schema_name))
+
+
+@receiver(custos_atualizados)
+def invalidar_dre_custos(sender, datas, **kwargs):
+    """
+    Invalida o DRE dos meses cujas saídas receberam custo
+    """
+    invalidar_dre(*datas)
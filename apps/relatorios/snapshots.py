@@ -0,0 +1,154 @@
+"""
+Snapshots mensais do DRE
+
+Meses fechados não mudam, então seus valores brutos são lidos da tabela
+DRESnapshot. Meses abertos, parciais ou ainda não materializados são
+calculados pelo DREEngine. Salvar/excluir um lançamento de um mês fechado
+invalida apenas aquele mês e agenda seu recálculo via Celery.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.core.utils import get_schema_name
+from .dre import DREEngine, limites_mes, meses_do_intervalo
+from .models import DRESnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _mes_atual():
+    hoje = timezone.localdate()
+    return (hoje.year, hoje.month)
+
+
+def mes_fechado(ano, mes):
+    """Meses anteriores ao mês corrente"""
+    return (ano, mes) < _mes_atual()
+
+
+def valores_por_mes(inicio, fim):
+    """
+    Valores brutos do DRE por mês, lendo snapshots dos meses fechados
+
+    Retorna o mesmo formato de `DREEngine.valores_por_mes`. Meses fechados
+    ausentes da tabela são calculados e materializados na mesma chamada.
+    """
+    meses = meses_do_intervalo(inicio, fim)
+    # Apenas meses inteiros dentro do intervalo podem vir do snapshot
+    elegiveis = {
+        (ano, mes) for ano, mes in meses
+        if mes_fechado(ano, mes)
+        and limites_mes(ano, mes)[0] >= inicio
+        and limites_mes(ano, mes)[1] <= fim
+    }
+
+    resultado = {}
+    if elegiveis:
+        snapshots = DRESnapshot.objects.filter(
+            ano__gte=inicio.year,
+            ano__lte=fim.year
+        ).values_list('ano', 'mes', 'codigo', 'valor')
+        for ano, mes, codigo, valor in snapshots:
+            if (ano, mes) not in elegiveis:
+                continue
+            valores = resultado.setdefault((ano, mes), defaultdict(Decimal))
+            if codigo != DRESnapshot.CHAVE_MES_CALCULADO:
+                valores[codigo] += valor
+
+    pendentes = [m for m in meses if m not in resultado]
+    if pendentes:
+        # Um único passe do engine cobre todos os meses pendentes
+        inicio_calculo = max(inicio, date(*pendentes[0], 1))
+        fim_calculo = min(fim, limites_mes(*pendentes[-1])[1])
+        calculados = DREEngine(inicio_calculo, fim_calculo).valores_por_mes()
+
+        materializar = {}
+        for mes in pendentes:
+            resultado[mes] = calculados[mes]
+            if mes in elegiveis:
+                materializar[mes] = calculados[mes]
+        if materializar:
+            salvar_snapshots(materializar)
+
+    return {mes: resultado[mes] for mes in meses}
+
+
+def valores_totais(inicio, fim):
+    """Valores brutos somados de todo o intervalo"""
+    totais = defaultdict(Decimal)
+    for valores in valores_por_mes(inicio, fim).values():
+        for chave, valor in valores.items():
+            totais[chave] += valor
+    return totais
+
+
+def _linhas_snapshot(meses):
+    linhas = []
+    for (ano, mes), valores in meses.items():
+        linhas.append(DRESnapshot(ano=ano, mes=mes, codigo=DRESnapshot.CHAVE_MES_CALCULADO))
+        for codigo, valor in valores.items():
+            linhas.append(DRESnapshot(ano=ano, mes=mes, codigo=codigo, valor=valor))
+    return linhas
+
+
+def salvar_snapshots(meses):
+    """Materializa meses ainda sem snapshot ({(ano, mes): valores})"""
+    DRESnapshot.objects.bulk_create(_linhas_snapshot(meses), ignore_conflicts=True)
+
+
+def recalcular_mes(ano, mes):
+    """Recalcula e substitui o snapshot de um mês fechado"""
+    if not mes_fechado(ano, mes):
+        return
+
+    inicio, fim = limites_mes(ano, mes)
+    valores = DREEngine(inicio, fim).valores_por_mes()[(ano, mes)]
+
+    with transaction.atomic():
+        DRESnapshot.objects.filter(ano=ano, mes=mes).delete()
+        DRESnapshot.objects.bulk_create(_linhas_snapshot({(ano, mes): valores}))
+
+
+def invalidar_dre(*datas):
+    """
+    Invalida o snapshot dos meses fechados das datas informadas
+
+    Aceita date, datetime ou None. O recálculo é agendado após o commit;
+    até lá, leituras recalculam o mês diretamente.
+    """
+    meses = set()
+    for data in datas:
+        if data is None:
+            continue
+        if isinstance(data, datetime):
+            data = timezone.localtime(data).date() if timezone.is_aware(data) else data.date()
+        if mes_fechado(data.year, data.month):
+            meses.add((data.year, data.month))
+
+    schema_name = get_schema_name()
+    for ano, mes in meses:
+        DRESnapshot.objects.filter(ano=ano, mes=mes).delete()
+        transaction.on_commit(
+            lambda ano=ano, mes=mes: _agendar_recalculo(schema_name, ano, mes)
+        )
+
+
+def invalidar_todos():
+    """Invalida todos os snapshots (ex.: categorias DRE alteradas)"""
+    DRESnapshot.objects.all().delete()
+
+
+def _agendar_recalculo(schema_name, ano, mes):
+    from .tasks import recalcular_dre_mes
+
+    try:
+        recalcular_dre_mes.delay(ano, mes, schema_name=schema_name)
+    except Exception as e:
+        # Sem broker o mês continua invalidado e é recalculado na próxima leitura
+        logger.warning('Não foi possível agendar recálculo do DRE %02d/%d: %s', mes, ano, e)
@@ -0,0 +1,51 @@
+"""
+Celery tasks for Relatorios app
+"""
+
+from celery import shared_task
+
+from apps.core.routers import usar_banco_relatorios
+from apps.core.utils import get_tenant_schemas, tenant_context
+from .jobs import gerar_relatorio, limpar_expirados
+from .models import RelatorioJob
+from .snapshots import recalcular_mes
+
+
+@shared_task(ignore_result=True)
+def recalcular_dre_mes(ano, mes, schema_name=None):
+    """
+    Recalcula o snapshot do DRE de um mês fechado
+    """
+    with tenant_context(schema_name):
+        recalcular_mes(ano, mes)
+
+
+@shared_task(ignore_result=True)
+def recalcular_dre_ano(ano, schema_name=None):
+    """
+    Recalcula os snapshots de todos os meses fechados de um ano
+    """
+    with tenant_context(schema_name):
+        for mes in range(1, 13):
+            recalcular_mes(ano, mes)
+
+
+@shared_task(ignore_result=True)
+def gerar_relatorio_job(job_id, schema_name=None):
+    """
+    Gera o arquivo de um RelatorioJob
+    """
+    with tenant_context(schema_name), usar_banco_relatorios():
+        job = RelatorioJob.objects.filter(pk=job_id, status='pendente').first()
+        if job:
+            gerar_relatorio(job)
+
+
+@shared_task(ignore_result=True)
+def limpar_relatorios_expirados():
+    """
+    Remove relatórios expirados de todos os tenants
+    """
+    for schema_name in get_tenant_schemas():
+        with tenant_context(schema_name):
+            limpar_expirados()
@@ -0,0 +1,632 @@
+"""
+Tests for Relatorios app
+"""
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+import openpyxl
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from apps.core.routers import ReportingRouter, banco_relatorios_configurado, usar_banco_relatorios
+from apps.erp.models import Produto, Cliente
+from apps.vendas.models import Venda, ItemVenda
+from apps.assistencia.models import OrdemServico
+from apps.financeiro.models import CategoriaFinanceira, CategoriaDRE, ContaPagar, FluxoCaixa
+from apps.estoque.custos import atualizar_custos
+from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.services import registrar_movimentacao
+from . import analytics
+from .dre import DREEngine, calcular_linhas
+from .jobs import limpar_expirados, solicitar_relatorio
+from .models import DRESnapshot, RelatorioJob
+from .snapshots import recalcular_mes, valores_por_mes
+from .views import (
+    DashboardView, RelatorioVendasView, RelatorioEstoqueView, RelatorioFinanceiroView, RelatorioOSView
+)
+from .views_dre import DREBaseView, DREExportView
+
+User = get_user_model()
+
+
+class DRETestMixin:
+    """Dados de um ano com vendas, OS e despesas classificadas no DRE"""
+
+    ano = 2024
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.cliente = Cliente.objects.create(
+            nome_razao_social='Cliente Teste',
+            cpf_cnpj='12345678901',
+            telefone_principal='11999999999'
+        )
+        self.produto = Produto.objects.create(
+            nome='Produto Teste',
+            codigo_interno='TEST001',
+            preco_custo=40.00,
+            preco_venda=100.00,
+            estoque_atual=100
+        )
+        CategoriaDRE.criar_categorias_padrao()
+        self.categoria_despesa = CategoriaFinanceira.objects.create(nome='Despesas', tipo='despesa')
+
+        # Março: venda de 2 unidades (R$ 200, custo R$ 80) com R$ 20 de desconto
+        self.criar_venda(date(self.ano, 3, 10), quantidade=2, desconto=20)
+        # Julho: venda de 1 unidade (R$ 100, custo R$ 40)
+        self.criar_venda(date(self.ano, 7, 5), quantidade=1)
+        # Março: OS com R$ 150 de serviço
+        os = OrdemServico.objects.create(
+            cliente=self.cliente,
+            tecnico=self.user,
+            equipamento='Notebook',
+            defeito_relatado='Não liga',
+            valor_servico=150
+        )
+        OrdemServico.objects.filter(pk=os.pk).update(data_abertura=self.momento(date(self.ano, 3, 20)))
+        # Março: despesas administrativas (12) e impostos (7) pagos
+        self.criar_despesa('12', date(self.ano, 3, 15), 30)
+        self.criar_despesa('7', date(self.ano, 3, 31), 10)
+        # Fora do ano: não deve entrar
+        self.criar_despesa('12', date(self.ano + 1, 1, 1), 999)
+        atualizar_custos()
+
+    def momento(self, dia):
+        return timezone.make_aware(datetime.combine(dia, datetime.min.time().replace(hour=12)))
+
+    def criar_venda(self, dia, quantidade, desconto=0):
+        venda = Venda.objects.create(cliente=self.cliente, vendedor=self.user, valor_desconto=desconto)
+        ItemVenda.objects.create(venda=venda, produto=self.produto, quantidade=quantidade, preco_unitario=100)
+        Venda.objects.filter(pk=venda.pk).update(status='faturado', data_venda=self.momento(dia))
+        # Saída do faturamento, na data da venda
+        movimentacao = registrar_movimentacao(
+            self.produto, 'saida', quantidade, self.user,
+            valor_unitario=100, documento='venda', documento_numero=venda.numero
+        )
+        MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(data_movimentacao=self.momento(dia))
+        return venda
+
+    def criar_despesa(self, codigo, dia, valor):
+        return ContaPagar.objects.create(
+            categoria=self.categoria_despesa,
+            categoria_dre=CategoriaDRE.objects.get(codigo=codigo),
+            descricao=f'Despesa {codigo}',
+            valor_original=valor,
+            valor_pago=valor,
+            data_emissao=dia,
+            data_vencimento=dia,
+            data_pagamento=dia,
+            status='pago'
+        )
+
+
+class DREEngineTest(DRETestMixin, TestCase):
+    def test_valores_por_mes(self):
+        """Valores brutos são separados por mês"""
+        meses = DREEngine(date(self.ano, 1, 1), date(self.ano, 12, 31)).valores_por_mes()
+
+        self.assertEqual(len(meses), 12)
+        self.assertEqual(meses[(self.ano, 3)]['venda_receita'], Decimal('200'))
+        self.assertEqual(meses[(self.ano, 3)]['venda_custo'], Decimal('80'))
+        self.assertEqual(meses[(self.ano, 3)]['os_servicos'], Decimal('150'))
+        self.assertEqual(meses[(self.ano, 3)]['12'], Decimal('30'))
+        self.assertEqual(meses[(self.ano, 7)]['venda_receita'], Decimal('100'))
+        self.assertNotIn('12', meses[(self.ano, 7)])
+
+    def test_calcular_linhas(self):
+        """Linhas do DRE derivadas dos valores brutos de março"""
+        valores = calcular_linhas(DREEngine(date(self.ano, 3, 1), date(self.ano, 3, 31)).valores_totais())
+
+        self.assertEqual(valores['receita_bruta_total'], 350.0)
+        self.assertEqual(valores['abatimentos'], 20.0)
+        self.assertEqual(valores['impostos'], 10.0)
+        self.assertEqual(valores['receita_liquida'], 320.0)
+        self.assertEqual(valores['custo_mercadorias'], 80.0)
+        self.assertEqual(valores['lucro_bruto'], 240.0)
+        self.assertEqual(valores['despesas_administrativas'], 30.0)
+        self.assertEqual(valores['lucro_liquido'], 210.0)
+
+    def test_engine_consultas_constantes(self):
+        """Engine usa uma consulta agrupada por fonte, não por mês/categoria"""
+        with self.assertNumQueries(6):
+            DREEngine(date(self.ano, 1, 1), date(self.ano, 12, 31)).valores_por_mes()
+
+    def test_dre_anual(self):
+        """DRE anual com os 12 meses e totais"""
+        dre = DREBaseView()._calcular_dre_anual(self.ano)
+
+        self.assertEqual(len(dre['meses']), 12)
+        self.assertEqual(dre['meses'][2]['lucro_liquido'], 210.0)
+        self.assertEqual(dre['meses'][6]['receita_bruta'], 100.0)
+        self.assertEqual(dre['totais']['receita_bruta'], 450.0)
+        self.assertEqual(dre['totais']['lucro_liquido'], 270.0)
+
+    def test_dre_mensal(self):
+        """DRE mensal mantém a estrutura da resposta"""
+        dre = DREBaseView()._calcular_dre_mensal(self.ano, 3)
+
+        self.assertEqual(dre['periodo']['data_fim'], f'{self.ano}-03-31')
+        self.assertEqual(dre['receita_bruta']['total'], 350.0)
+        self.assertEqual(dre['deducoes']['total'], 30.0)
+        self.assertEqual(dre['lucro_liquido'], 210.0)
+
+
+class DRESnapshotTest(DRETestMixin, TestCase):
+    def test_anual_materializa_meses_fechados(self):
+        """Primeira leitura materializa; a segunda lê só a tabela de snapshots"""
+        DREBaseView()._calcular_dre_anual(self.ano)
+        self.assertEqual(
+            DRESnapshot.objects.filter(ano=self.ano, codigo=DRESnapshot.CHAVE_MES_CALCULADO).count(),
+            12
+        )
+
+        with self.assertNumQueries(1):
+            dre = DREBaseView()._calcular_dre_anual(self.ano)
+
+        self.assertEqual(dre['meses'][2]['lucro_liquido'], 210.0)
+        self.assertEqual(dre['totais']['lucro_liquido'], 270.0)
+
+    def test_mes_parcial_nao_usa_snapshot(self):
+        """Intervalos que cortam um mês são calculados direto"""
+        valores_por_mes(date(self.ano, 3, 1), date(self.ano, 3, 31))
+        DRESnapshot.objects.filter(ano=self.ano, mes=3, codigo='12').update(valor=0)
+
+        meses = valores_por_mes(date(self.ano, 3, 1), date(self.ano, 3, 20))
+        self.assertEqual(meses[(self.ano, 3)]['12'], Decimal('30'))
+
+    def test_lancamento_invalida_mes(self):
+        """Salvar um lançamento num mês fechado invalida só aquele mês"""
+        DREBaseView()._calcular_dre_anual(self.ano)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.criar_despesa('12', date(self.ano, 3, 20), 50)
+            self.assertFalse(DRESnapshot.objects.filter(ano=self.ano, mes=3).exists())
+            self.assertTrue(DRESnapshot.objects.filter(ano=self.ano, mes=7).exists())
+
+        # Recálculo agendado após o commit (Celery eager nos testes)
+        self.assertEqual(DRESnapshot.objects.get(ano=self.ano, mes=3, codigo='12').valor, Decimal('80'))
+
+        dre = DREBaseView()._calcular_dre_mensal(self.ano, 3)
+        self.assertEqual(dre['lucro_liquido'], 160.0)
+
+    def test_recalcular_mes(self):
+        """Recálculo substitui o snapshot com valores atuais"""
+        recalcular_mes(self.ano, 3)
+        self.criar_despesa('12', date(self.ano, 3, 20), 50)
+        recalcular_mes(self.ano, 3)
+
+        valor = DRESnapshot.objects.get(ano=self.ano, mes=3, codigo='12').valor
+        self.assertEqual(valor, Decimal('80'))
+
+
+class DREComparativoTest(DRETestMixin, TestCase):
+    url = '/api/relatorios/dre/comparativo/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_trimestral(self):
+        """Quatro trimestres com variação sobre o trimestre anterior"""
+        response = self.client.get(self.url, {
+            'inicio': f'{self.ano}-01', 'fim': f'{self.ano}-12', 'granularidade': 'trimestre'
+        })
+        self.assertEqual(response.status_code, 200)
+
+        periodos = response.data['periodos']
+        self.assertEqual([p['periodo'] for p in periodos], [f'{self.ano}-T{t}' for t in range(1, 5)])
+        self.assertIsNone(periodos[0]['variacao'])
+        self.assertEqual(periodos[0]['valores']['lucro_liquido'], 210.0)
+        self.assertEqual(periodos[2]['valores']['lucro_liquido'], 60.0)
+        self.assertEqual(periodos[1]['variacao']['lucro_liquido'], {'delta': -210.0, 'percentual': -100.0})
+        self.assertEqual(periodos[2]['variacao']['lucro_liquido'], {'delta': 60.0, 'percentual': None})
+
+    def test_periodos_personalizados(self):
+        """Comparação ano contra ano com intervalos explícitos"""
+        response = self.client.get(self.url, {
+            'periodos': f'{self.ano}-01:{self.ano}-12,{self.ano + 1}-01:{self.ano + 1}-12'
+        })
+        self.assertEqual(response.status_code, 200)
+
+        atual = response.data['periodos'][1]
+        self.assertEqual(response.data['periodos'][0]['valores']['receita_bruta_total'], 450.0)
+        self.assertEqual(atual['valores']['despesas_administrativas'], 999.0)
+        self.assertEqual(atual['variacao']['despesas_administrativas']['delta'], 969.0)
+        self.assertEqual(atual['variacao']['despesas_administrativas']['percentual'], 3230.0)
+
+    def test_parametros_invalidos(self):
+        """Granularidade e meses inválidos retornam 400"""
+        self.assertEqual(self.client.get(self.url, {'granularidade': 'semana'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'inicio': '2024-13'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(self.url, {'inicio': f'{self.ano}-06', 'fim': f'{self.ano}-01'}).status_code,
+            400
+        )
+
+
+class DashboardTest(DRETestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def get_dashboard(self, **params):
+        request = APIRequestFactory().get('/api/relatorios/dashboard/', params)
+        force_authenticate(request, user=self.user)
+        return DashboardView.as_view()(request)
+
+    def test_kpis_do_mes(self):
+        """KPIs do mês e variação sobre o mês anterior"""
+        self.criar_venda(date(self.ano, 2, 10), quantidade=1)
+        response = self.get_dashboard(ano=self.ano, mes=3)
+        self.assertEqual(response.status_code, 200)
+
+        kpis = response.data['kpis']
+        self.assertEqual(kpis['vendas_mes']['total'], 180.0)
+        self.assertEqual(kpis['vendas_mes']['quantidade'], 1)
+        self.assertEqual(kpis['vendas_mes']['variacao'], 80)
+        self.assertEqual(kpis['os_mes']['quantidade'], 1)
+        self.assertEqual(kpis['os_mes']['abertas'], 1)
+        self.assertEqual(response.data['graficos']['vendas'][2], 180.0)
+        self.assertEqual(response.data['graficos']['vendas'][6], 100.0)
+        self.assertEqual(response.data['graficos']['servicos'][2], 150.0)
+
+    def test_consultas_constantes(self):
+        """Uma consulta por tabela de KPI e por série do gráfico"""
+        with self.assertNumQueries(10):
+            self.get_dashboard(ano=self.ano, mes=3)
+
+
+class RelatorioCacheTest(DashboardTest):
+    def test_repeticao_sem_consultas(self):
+        """Segunda carga do dashboard vem do cache, sem consultas"""
+        primeira = self.get_dashboard(ano=self.ano, mes=3)
+        with self.assertNumQueries(0):
+            segunda = self.get_dashboard(ano=self.ano, mes=3)
+        self.assertEqual(primeira.data, segunda.data)
+
+    def test_parametros_diferentes(self):
+        """Parâmetros diferentes usam chaves diferentes"""
+        self.get_dashboard(ano=self.ano, mes=3)
+        response = self.get_dashboard(ano=self.ano, mes=7)
+        self.assertEqual(response.data['kpis']['vendas_mes']['total'], 100.0)
+
+    def test_invalidacao_por_signal(self):
+        """Salvar uma venda incrementa a versão após o commit"""
+        self.get_dashboard(ano=self.ano, mes=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.criar_venda(date(self.ano, 3, 12), quantidade=1)
+
+        with self.assertNumQueries(10):
+            response = self.get_dashboard(ano=self.ano, mes=3)
+        self.assertEqual(response.data['kpis']['vendas_mes']['quantidade'], 2)
+
+    def test_invalidacao_por_compra(self):
+        """Pedidos de compra entram em compras_anual: também invalidam"""
+        from apps.compras.models import PedidoCompra
+        from apps.erp.models import Fornecedor
+
+        self.get_dashboard(ano=self.ano, mes=3)
+        fornecedor = Fornecedor.objects.create(razao_social='Fornecedor', cnpj='12345678000190')
+        with self.captureOnCommitCallbacks(execute=True):
+            PedidoCompra.objects.create(
+                fornecedor=fornecedor, comprador=self.user, status='aprovado',
+                data_entrega_prevista=date(self.ano, 3, 20)
+            )
+
+        with self.assertNumQueries(10):
+            self.get_dashboard(ano=self.ano, mes=3)
+
+    def test_recalculo_no_primario_apos_invalidacao(self):
+        """Com réplica, o recálculo logo após a invalidação lê do primário"""
+        from unittest import mock
+        from rest_framework.response import Response
+        from rest_framework.views import APIView
+        from apps.core import routers
+        from . import cache as relatorios_cache
+
+        bancos = []
+
+        class Espia(APIView):
+            @relatorios_cache.relatorio_em_cache('espia')
+            def get(self, request):
+                bancos.append(ReportingRouter().db_for_read(Venda))
+                return Response({'ok': True})
+
+        def consultar():
+            request = APIRequestFactory().get('/')
+            force_authenticate(request, user=self.user)
+            token = routers._usar_reporting.set(True)
+            try:
+                Espia.as_view()(request)
+            finally:
+                routers._usar_reporting.reset(token)
+
+        with mock.patch.object(relatorios_cache, 'banco_relatorios_configurado', return_value=True):
+            relatorios_cache.invalidar_relatorios()
+            consultar()
+            # Passado o atraso da réplica, volta a ler dela
+            cache.delete(relatorios_cache._chave_primario(relatorios_cache._schema()))
+            cache.incr(relatorios_cache._chave_versao(relatorios_cache._schema()))
+            consultar()
+
+        self.assertEqual(bancos, [None, 'reporting'])
+
+    def test_export_nao_usa_cache(self):
+        """Exportações não são servidas do cache"""
+        self.get_dashboard(ano=self.ano, mes=3)
+        with self.assertNumQueries(10):
+            self.get_dashboard(ano=self.ano, mes=3, export='json')
+
+
+class StreamingExcelTest(DRETestMixin, TestCase):
+    def exportar(self, view, **params):
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.user)
+        response = view.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+
+    def test_vendas(self):
+        """Exporta uma linha por venda, em ordem cronológica"""
+        wb = self.exportar(RelatorioVendasView, export='xlsx')
+        linhas = list(wb['Vendas'].values)
+        self.assertEqual(linhas[0][0], 'Número')
+        self.assertEqual(len(linhas), 3)
+        self.assertEqual(linhas[1][1], datetime(self.ano, 3, 10, 12))
+        self.assertEqual(linhas[1][-1], 180)
+
+    def test_estoque(self):
+        """Exporta as movimentações de estoque"""
+        MovimentacaoEstoque.objects.create(
+            produto=self.produto, tipo='entrada', quantidade=5, valor_unitario=40, usuario=self.user
+        )
+        # As saídas das vendas do mixin ficam em anos anteriores
+        wb = self.exportar(RelatorioEstoqueView, export='xlsx', data_inicio=f'{self.ano + 1}-01-01')
+        linhas = list(wb['Movimentações'].values)
+        self.assertEqual(len(linhas), 2)
+        self.assertEqual(linhas[1][3], 'Produto Teste')
+        self.assertEqual(linhas[1][8], 200)
+
+    def test_financeiro(self):
+        """Contas a receber e a pagar em planilhas separadas, filtradas por vencimento"""
+        wb = self.exportar(
+            RelatorioFinanceiroView, export='xlsx',
+            data_inicio=f'{self.ano}-01-01', data_fim=f'{self.ano}-12-31'
+        )
+        self.assertEqual(wb.sheetnames, ['Contas a Receber', 'Contas a Pagar'])
+        self.assertEqual(len(list(wb['Contas a Pagar'].values)), 3)
+
+    def test_dre(self):
+        """DRE anual achatado em Campo/Valor"""
+        wb = self.exportar(DREExportView, ano=self.ano, format='xlsx')
+        valores = dict(wb['DRE'].values)
+        self.assertEqual(valores['totais_lucro_liquido'], 270)
+        self.assertEqual(valores['meses_3_lucro_liquido'], 210)
+
+
+class RelatorioJobTest(DRETestMixin, TestCase):
+    url = '/api/relatorios/jobs/'
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+    def solicitar(self, **dados):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, dados, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response
+
+    def test_gera_arquivo(self):
+        """Job é processado pela task e o arquivo fica disponível para download"""
+        response = self.solicitar(tipo='vendas', formato='xlsx', parametros={'data_inicio': f'{self.ano}-01-01'})
+        self.assertFalse(response.data['reaproveitado'])
+
+        job = self.client.get(f"{self.url}{response.data['id']}/").data
+        self.assertEqual(job['status'], 'concluido')
+        self.assertEqual(job['progresso'], 100)
+        self.assertEqual(job['linhas_processadas'], 2)
+        self.assertIsNotNone(job['expira_em'])
+
+        download = self.client.get(f"{self.url}{job['id']}/download/")
+        self.assertEqual(download.status_code, 200)
+        wb = openpyxl.load_workbook(BytesIO(b''.join(download.streaming_content)))
+        self.assertEqual(len(list(wb['Vendas'].values)), 3)
+
+    def test_dre_pdf(self):
+        """DRE em PDF"""
+        response = self.solicitar(tipo='dre', formato='pdf', parametros={'ano': self.ano})
+        job = RelatorioJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, 'concluido')
+        with job.arquivo.open('rb') as arquivo:
+            self.assertTrue(arquivo.read().startswith(b'%PDF'))
+
+    def test_requisicoes_identicas_reaproveitam(self):
+        """Mesmo tipo/formato/parâmetros reaproveita o job recente"""
+        primeiro = self.solicitar(tipo='estoque', formato='xlsx', parametros={'data_inicio': '2024-01-01'})
+        segundo = self.solicitar(tipo='estoque', formato='xlsx', parametros={'data_inicio': '2024-01-01'})
+        outro = self.solicitar(tipo='estoque', formato='xlsx', parametros={'data_inicio': '2024-02-01'})
+
+        self.assertEqual(primeiro.data['id'], segundo.data['id'])
+        self.assertTrue(segundo.data['reaproveitado'])
+        self.assertNotEqual(primeiro.data['id'], outro.data['id'])
+
+    def test_acesso_restrito_a_quem_solicitou(self):
+        """Outro usuário só vê/baixa o job se tiver pedido o mesmo relatório"""
+        response = self.solicitar(tipo='vendas', formato='xlsx', parametros={})
+        job_id = response.data['id']
+        outro = APIClient()
+        outro.force_authenticate(user=User.objects.create_user(username='outro', password='test123'))
+
+        self.assertEqual(outro.get(f'{self.url}{job_id}/').status_code, 404)
+        self.assertEqual(outro.get(f'{self.url}{job_id}/download/').status_code, 404)
+        self.assertEqual(outro.get(self.url).data['count'], 0)
+
+        reaproveitado = outro.post(self.url, {'tipo': 'vendas', 'formato': 'xlsx', 'parametros': {}}, format='json')
+        self.assertEqual(reaproveitado.data['id'], job_id)
+        self.assertEqual(outro.get(f'{self.url}{job_id}/').status_code, 200)
+        self.assertEqual(outro.get(f'{self.url}{job_id}/download/').status_code, 200)
+
+    def test_formato_invalido(self):
+        """Formato sem gerador retorna 400"""
+        response = self.client.post(self.url, {'tipo': 'vendas', 'formato': 'pdf'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_download_pendente(self):
+        """Download antes da conclusão retorna 409"""
+        job, _ = solicitar_relatorio('vendas', 'xlsx', {}, usuario=self.user)
+        response = self.client.get(f'{self.url}{job.pk}/download/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_limpeza_expirados(self):
+        """Jobs expirados perdem arquivo e registro; um novo pedido gera outro job"""
+        response = self.solicitar(tipo='vendas', formato='xlsx', parametros={})
+        job = RelatorioJob.objects.get(pk=response.data['id'])
+        caminho = job.arquivo.path
+        RelatorioJob.objects.filter(pk=job.pk).update(expira_em=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(limpar_expirados(), 1)
+        self.assertFalse(RelatorioJob.objects.filter(pk=job.pk).exists())
+        self.assertFalse(os.path.exists(caminho))
+
+
+class AnalyticsTest(DRETestMixin, TestCase):
+    def get(self, view, **params):
+        cache.clear()
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.user)
+        response = view.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_estatisticas(self):
+        """Média e percentis com interpolação linear"""
+        resultado = analytics.estatisticas([1, 2, 3, 4, 10], percentis=(50, 90))
+        self.assertEqual(resultado, {
+            'quantidade': 5, 'media': 4.0, 'minimo': 1.0, 'maximo': 10.0, 'p50': 3.0, 'p90': 7.6
+        })
+        self.assertIsNone(analytics.estatisticas([])['p90'])
+
+    def test_curva_abc(self):
+        """Classes pela participação acumulada antes de cada item"""
+        df = analytics.pd.DataFrame({'produto': ['a', 'b', 'c', 'a', 'd'], 'valor': [50, 20, 6, 20, 4]})
+        curva = analytics.curva_abc(df, 'produto', 'valor')
+        self.assertEqual([(i['produto'], i['classe']) for i in curva], [('a', 'A'), ('b', 'B'), ('c', 'C'), ('d', 'C')])
+        self.assertEqual(curva[0]['percentual'], 70.0)
+
+    def test_tempo_conclusao_os(self):
+        """p50/p90 do tempo de conclusão das OS"""
+        abertura = self.momento(date(self.ano, 5, 1))
+        for dias in (1, 2, 3, 10):
+            os = OrdemServico.objects.create(
+                cliente=self.cliente, tecnico=self.user, equipamento='Notebook', defeito_relatado='Não liga'
+            )
+            OrdemServico.objects.filter(pk=os.pk).update(
+                status='concluida', data_abertura=abertura, data_conclusao=abertura + timedelta(days=dias)
+            )
+
+        dados = self.get(RelatorioOSView)
+        self.assertEqual(dados['tempo_medio_conclusao_dias'], 4.0)
+        self.assertEqual(dados['tempo_conclusao_dias']['p50'], 2.5)
+        self.assertEqual(dados['tempo_conclusao_dias']['p90'], 7.9)
+
+    def test_relatorio_vendas(self):
+        """Resumo, vendas por dia, ticket e curva ABC"""
+        dados = self.get(RelatorioVendasView)
+        self.assertEqual(dados['resumo'], {'total_vendas': 280.0, 'quantidade': 2, 'ticket_medio': 140.0})
+        self.assertEqual(dados['vendas_por_dia'], [
+            {'dia': date(self.ano, 3, 10), 'total': 180.0, 'quantidade': 1},
+            {'dia': date(self.ano, 7, 5), 'total': 100.0, 'quantidade': 1},
+        ])
+        self.assertEqual(dados['ticket']['p50'], 140.0)
+        self.assertEqual(dados['curva_abc_produtos'][0]['classe'], 'A')
+
+    def test_fluxo_caixa_por_dia(self):
+        """Fluxo de caixa agrupado por dia e tipo"""
+        for dia, tipo, valor in [(15, 'saida', 30), (15, 'saida', 5), (15, 'entrada', 100), (31, 'saida', 10)]:
+            FluxoCaixa.objects.create(
+                data=date(self.ano, 3, dia), tipo=tipo, categoria=self.categoria_despesa,
+                descricao='Movimento', valor=valor
+            )
+        dados = self.get(RelatorioFinanceiroView, data_inicio=f'{self.ano}-01-01', data_fim=f'{self.ano}-12-31')
+        self.assertEqual(dados['fluxo_caixa'], [
+            {'dia': date(self.ano, 3, 15), 'tipo': 'entrada', 'total': 100.0},
+            {'dia': date(self.ano, 3, 15), 'tipo': 'saida', 'total': 35.0},
+            {'dia': date(self.ano, 3, 31), 'tipo': 'saida', 'total': 10.0},
+        ])
+
+
+class ReportingRouterTest(TestCase):
+    """Roteamento das leituras de relatórios"""
+
+    def test_leituras_fora_do_contexto(self):
+        """Fora de usar_banco_relatorios as leituras ficam no primário"""
+        self.assertIsNone(ReportingRouter().db_for_read(Venda))
+        self.assertIsNone(ReportingRouter().db_for_write(Venda))
+
+    def test_transacao_aberta_fica_no_primario(self):
+        """TestCase roda dentro de atomic: a réplica não veria os dados do teste"""
+        with usar_banco_relatorios() as alias:
+            self.assertEqual(alias, 'default')
+            self.assertIsNone(ReportingRouter().db_for_read(Venda))
+        self.assertIsNone(ReportingRouter().db_for_read(Venda))
+
+    def test_escrita_de_instancia_lida_da_replica(self):
+        venda = Venda(numero='1')
+        venda._state.db = 'reporting'
+        self.assertEqual(ReportingRouter().db_for_write(Venda, instance=venda), 'default')
+
+    def test_migracoes_bloqueadas_na_replica(self):
+        self.assertFalse(ReportingRouter().allow_migrate('reporting', 'vendas'))
+        self.assertIsNone(ReportingRouter().allow_migrate('default', 'vendas'))
+
+
+@skipUnless(banco_relatorios_configurado(), 'REPORTING_DATABASE_URL não configurado')
+class ReportingDatabaseTest(DRETestMixin, TransactionTestCase):
+    """
+    Leituras reais no alias `reporting`
+
+    TransactionTestCase para que o espelho (TEST MIRROR) enxergue os dados
+    gravados pela conexão primária.
+    """
+    databases = {'default', 'reporting'} if banco_relatorios_configurado() else {'default'}
+
+    def test_contexto(self):
+        with usar_banco_relatorios() as alias:
+            self.assertEqual(alias, 'reporting')
+            self.assertEqual(ReportingRouter().db_for_read(Venda), 'reporting')
+            self.assertEqual(ReportingRouter().db_for_read(RelatorioJob), 'default')
+        self.assertIsNone(ReportingRouter().db_for_read(Venda))
+
+    def test_dashboard_le_do_banco_relatorios(self):
+        cache.clear()
+        request = APIRequestFactory().get('/api/relatorios/dashboard/', {'ano': self.ano, 'mes': 3})
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connections['reporting']) as reporting, \
+                CaptureQueriesContext(connections['default']) as default:
+            response = DashboardView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(reporting.captured_queries), 10)
+        self.assertEqual(len(default.captured_queries), 0)
@@ -2,19 +2,27 @@
 URL patterns for Reports app
 """
 
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
 from . import views
-from .views_dre import DREView, DREExportView
+from .views_dre import DREView, DREExportView, DREComparativoView
+from .views_jobs import RelatorioJobViewSet
 
 app_name = 'relatorios'
 
+router = DefaultRouter()
+router.register(r'jobs', RelatorioJobViewSet, basename='job')
+
 urlpatterns = [
+    path('', include(router.urls)),
+    
     # Dashboard
     path('dashboard/', views.DashboardView.as_view(), name='dashboard'),
     
     # DRE
     path('dre/', DREView.as_view(), name='dre'),
     path('dre/export/', DREExportView.as_view(), name='dre-export'),
+    path('dre/comparativo/', DREComparativoView.as_view(), name='dre-comparativo'),
     
     # Relatórios específicos
     path('vendas/', views.RelatorioVendasView.as_view(), name='vendas'),
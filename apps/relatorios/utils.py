@@ -10,9 +10,13 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from io import BytesIO
 from datetime import datetime
+import tempfile
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
+from django.http import FileResponse
+from django.utils import timezone
 
 
 class PDFExporter:
@@ -287,3 +291,66 @@ class ExcelExporter:
         wb.save(buffer)
         buffer.seek(0)
         return buffer
+
+
+class StreamingExcelExporter:
+    """
+    Excel export in openpyxl write-only mode for large reports
+
+    Rows come from iterators (e.g. ``queryset.values_list().iterator()``),
+    openpyxl writes each sheet straight to a temporary file and the final
+    .xlsx is sent in blocks, so memory use does not grow with row count.
+    """
+    CHUNK_SIZE = 2000
+    BLOCK_SIZE = 64 * 1024
+    CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    @classmethod
+    def linhas(cls, queryset, *campos):
+        """Iterate a queryset as tuples, fetching CHUNK_SIZE rows at a time"""
+        return queryset.values_list(*campos).iterator(chunk_size=cls.CHUNK_SIZE)
+
+    @staticmethod
+    def _valor(valor):
+        # Excel does not support timezones
+        if isinstance(valor, datetime) and timezone.is_aware(valor):
+            return timezone.localtime(valor).replace(tzinfo=None)
+        return valor
+
+    @staticmethod
+    def _cabecalho(ws, titulo):
+        cell = WriteOnlyCell(ws, value=titulo)
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid")
+        return cell
+
+    @classmethod
+    def gerar_arquivo(cls, planilhas):
+        """
+        Write sheets to a temporary file
+
+        planilhas: iterable of (titulo, cabecalhos, linhas)
+        """
+        wb = openpyxl.Workbook(write_only=True)
+        for titulo, cabecalhos, linhas in planilhas:
+            ws = wb.create_sheet(title=titulo[:31])
+            ws.append([cls._cabecalho(ws, c) for c in cabecalhos])
+            for linha in linhas:
+                ws.append([cls._valor(v) for v in linha])
+
+        arquivo = tempfile.TemporaryFile()
+        wb.save(arquivo)
+        arquivo.seek(0)
+        return arquivo
+
+    @classmethod
+    def response(cls, planilhas, filename):
+        """StreamingHttpResponse (FileResponse) with the generated workbook"""
+        response = FileResponse(
+            cls.gerar_arquivo(planilhas),
+            as_attachment=True,
+            filename=filename,
+            content_type=cls.CONTENT_TYPE
+        )
+        response.block_size = cls.BLOCK_SIZE
+        return response
@@ -9,31 +9,39 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from rest_framework.decorators import action
 from django.db.models import Sum, Count, Avg, Q, F
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from django.http import HttpResponse
 from io import BytesIO
 
+from apps.core.routers import BancoRelatoriosMixin
+
 # Models
 from apps.vendas.models import Venda, ItemVenda
 from apps.compras.models import PedidoCompra
 from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.saldos import totais_posicao
 from apps.financeiro.models import ContaPagar, ContaReceber, FluxoCaixa
 from apps.assistencia.models import OrdemServico
 from apps.erp.models import Cliente, Fornecedor, Produto
 from apps.crm.models import Oportunidade
 
 # Export utilities
-from .utils import PDFExporter, ExcelExporter
+from .utils import PDFExporter, ExcelExporter, StreamingExcelExporter
+from .dre import VENDA_STATUS_RECEITA, limites_datetime
+from .cache import relatorio_em_cache
+from . import analytics, exports
 
 
-class DashboardView(APIView):
+class DashboardView(BancoRelatoriosMixin, APIView):
     """
     Dashboard geral com KPIs principais
     Baseado no sistema PHP existente
     """
     # permission_classes = [IsAuthenticated]  # Desabilitado para teste local
     
+    @relatorio_em_cache('dashboard')
     def get(self, request):
         # Parâmetros
         ano = int(request.query_params.get('ano', timezone.now().year))
@@ -51,92 +59,76 @@ class DashboardView(APIView):
         mes_passado_inicio = (inicio_mes - timedelta(days=1)).replace(day=1)
         mes_passado_fim = inicio_mes - timedelta(days=1)
         
-        # ========== VENDAS DO MÊS ==========
-        vendas_mes = Venda.objects.filter(
-            data_venda__gte=inicio_mes,
-            data_venda__lte=fim_mes,
-            status='finalizada'
-        )
+        # Uma consulta por tabela: cada KPI é um agregado condicional
+        dt_mes = limites_datetime(inicio_mes, fim_mes)
+        dt_mes_passado = limites_datetime(mes_passado_inicio, mes_passado_fim)
+        no_mes = Q(data_venda__gte=dt_mes[0], data_venda__lt=dt_mes[1])
+        no_mes_passado = Q(data_venda__gte=dt_mes_passado[0], data_venda__lt=dt_mes_passado[1])
         
-        vendas_stats = vendas_mes.aggregate(
-            total=Sum('valor_total'),
-            descontos=Sum('valor_desconto')
+        # ========== VENDAS DO MÊS ==========
+        vendas_stats = Venda.objects.filter(
+            data_venda__gte=dt_mes_passado[0],
+            data_venda__lt=dt_mes[1],
+            status__in=VENDA_STATUS_RECEITA
+        ).aggregate(
+            total=Sum('valor_total', filter=no_mes),
+            descontos=Sum('valor_desconto', filter=no_mes),
+            quantidade=Count('id', filter=no_mes),
+            total_mes_passado=Sum('valor_total', filter=no_mes_passado)
         )
         
         total_vendas_mes = vendas_stats['total'] or 0
         total_descontos = vendas_stats['descontos'] or 0
-        qtd_vendas_mes = vendas_mes.count()
+        qtd_vendas_mes = vendas_stats['quantidade']
         
         # Vendas mês passado para comparação
-        vendas_mes_passado = Venda.objects.filter(
-            data_venda__gte=mes_passado_inicio,
-            data_venda__lte=mes_passado_fim,
-            status='finalizada'
-        ).aggregate(total=Sum('valor_total'))['total'] or 0
+        vendas_mes_passado = vendas_stats['total_mes_passado'] or 0
         
         # ========== ORDENS DE SERVIÇO DO MÊS ==========
-        os_mes = OrdemServico.objects.filter(
-            data_abertura__gte=inicio_mes,
-            data_abertura__lte=fim_mes
-        )
-        
-        os_stats = os_mes.aggregate(
+        os_stats = OrdemServico.objects.filter(
+            data_abertura__gte=dt_mes[0],
+            data_abertura__lt=dt_mes[1]
+        ).aggregate(
             total=Sum('valor_total'),
             servicos=Sum('valor_servico'),
-            pecas=Sum('valor_pecas')
+            pecas=Sum('valor_pecas'),
+            quantidade=Count('id'),
+            abertas=Count('id', filter=Q(status__in=['aberta', 'em_andamento', 'aguardando_pecas'])),
+            concluidas=Count('id', filter=Q(status='concluida'))
         )
         
         total_os = os_stats['total'] or 0
         valor_servicos = os_stats['servicos'] or 0
         valor_pecas_os = os_stats['pecas'] or 0
-        qtd_os_mes = os_mes.count()
-        
-        # ========== CONTAS A RECEBER ==========
-        # Hoje
-        contas_receber_hoje = ContaReceber.objects.filter(
-            status='pendente',
-            data_vencimento=hoje
-        ).aggregate(total=Sum('valor_original'))['total'] or 0
-        
-        # Este mês
-        contas_receber_mes = ContaReceber.objects.filter(
-            status='pendente',
-            data_vencimento__gte=hoje,
-            data_vencimento__lte=fim_mes
-        ).aggregate(total=Sum('valor_original'))['total'] or 0
-        
-        # Atrasadas
-        contas_receber_atrasadas = ContaReceber.objects.filter(
-            status='pendente',
-            data_vencimento__lt=hoje
-        ).aggregate(total=Sum('valor_original'))['total'] or 0
-        
-        # ========== CONTAS A PAGAR ==========
-        # Hoje
-        contas_pagar_hoje = ContaPagar.objects.filter(
-            status='pendente',
-            data_vencimento=hoje
-        ).aggregate(total=Sum('valor_original'))['total'] or 0
-        
-        # Este mês
-        contas_pagar_mes = ContaPagar.objects.filter(
-            status='pendente',
-            data_vencimento__gte=hoje,
-            data_vencimento__lte=fim_mes
-        ).aggregate(total=Sum('valor_original'))['total'] or 0
-        
-        # Atrasadas
-        contas_pagar_atrasadas = ContaPagar.objects.filter(
-            status='pendente',
-            data_vencimento__lt=hoje
-        ).aggregate(total=Sum('valor_original'))['total'] or 0
+        qtd_os_mes = os_stats['quantidade']
+        
+        # ========== CONTAS A RECEBER / A PAGAR ==========
+        # Hoje, restante do mês e atrasadas (pendentes)
+        vencimentos = dict(
+            hoje=Sum('valor_original', filter=Q(status='pendente', data_vencimento=hoje)),
+            mes=Sum('valor_original', filter=Q(
+                status='pendente', data_vencimento__gte=hoje, data_vencimento__lte=fim_mes
+            )),
+            atrasadas=Sum('valor_original', filter=Q(status='pendente', data_vencimento__lt=hoje)),
+        )
         
-        # ========== DESPESAS DO MÊS ==========
-        despesas_mes = ContaPagar.objects.filter(
-            data_pagamento__gte=inicio_mes,
-            data_pagamento__lte=fim_mes,
-            status='pago'
-        ).aggregate(total=Sum('valor_original'))['total'] or 0
+        receber_stats = ContaReceber.objects.filter(status='pendente').aggregate(**vencimentos)
+        contas_receber_hoje = receber_stats['hoje'] or 0
+        contas_receber_mes = receber_stats['mes'] or 0
+        contas_receber_atrasadas = receber_stats['atrasadas'] or 0
+        
+        # Despesas do mês (pagas) vêm na mesma consulta das contas a pagar
+        pagar_stats = ContaPagar.objects.filter(
+            Q(status='pendente') |
+            Q(status='pago', data_pagamento__gte=inicio_mes, data_pagamento__lte=fim_mes)
+        ).aggregate(
+            despesas_mes=Sum('valor_original', filter=Q(status='pago')),
+            **vencimentos
+        )
+        contas_pagar_hoje = pagar_stats['hoje'] or 0
+        contas_pagar_mes = pagar_stats['mes'] or 0
+        contas_pagar_atrasadas = pagar_stats['atrasadas'] or 0
+        despesas_mes = pagar_stats['despesas_mes'] or 0
         
         # ========== GRÁFICOS ANUAIS ==========
         graficos_anuais = self._get_graficos_anuais(ano)
@@ -159,16 +151,8 @@ class DashboardView(APIView):
                 'os_mes': {
                     'total': float(total_os),
                     'quantidade': qtd_os_mes,
-                    'abertas': OrdemServico.objects.filter(
-                        data_abertura__gte=inicio_mes,
-                        data_abertura__lte=fim_mes,
-                        status__in=['aberta', 'em_andamento', 'aguardando_pecas']
-                    ).count(),
-                    'concluidas': OrdemServico.objects.filter(
-                        data_abertura__gte=inicio_mes,
-                        data_abertura__lte=fim_mes,
-                        status='concluida'
-                    ).count()
+                    'abertas': os_stats['abertas'],
+                    'concluidas': os_stats['concluidas']
                 },
                 'financeiro_mes': {
                     'receber': float(contas_receber_mes),
@@ -220,58 +204,48 @@ class DashboardView(APIView):
     def _get_graficos_anuais(self, ano):
         """
         Gera dados para gráficos anuais (12 meses)
+        
+        Uma consulta agrupada por mês para cada modelo.
         """
-        vendas_mensal = []
-        compras_mensal = []
-        os_servicos_mensal = []
-        os_produtos_mensal = []
-        
-        for mes in range(1, 13):
-            # Calcular início e fim do mês
-            inicio = timezone.datetime(ano, mes, 1).date()
-            if mes == 12:
-                fim = timezone.datetime(ano + 1, 1, 1).date() - timedelta(days=1)
-            else:
-                fim = timezone.datetime(ano, mes + 1, 1).date() - timedelta(days=1)
-            
-            # Vendas
-            vendas = Venda.objects.filter(
-                data_venda__gte=inicio,
-                data_venda__lte=fim,
-                status='finalizada'
-            ).aggregate(
-                total=Sum('valor_total')
-            )
-            
-            vendas_mensal.append(float(vendas['total'] or 0))
-            
-            # Compras (Custos)
-            compras = PedidoCompra.objects.filter(
-                data_pedido__gte=inicio,
-                data_pedido__lte=fim,
-                status__in=['aprovado', 'recebido', 'concluido']
-            ).aggregate(
-                total=Sum('valor_total')
-            )
-            compras_mensal.append(float(compras['total'] or 0))
-            
-            # OS
-            os = OrdemServico.objects.filter(
-                data_abertura__gte=inicio,
-                data_abertura__lte=fim
-            ).aggregate(
-                servicos=Sum('valor_servico'),
-                pecas=Sum('valor_pecas')
-            )
-            
-            os_servicos_mensal.append(float(os['servicos'] or 0))
-            os_produtos_mensal.append(float(os['pecas'] or 0))
+        inicio, fim = limites_datetime(date(ano, 1, 1), date(ano, 12, 31))
+        
+        def por_mes(queryset, campo, **somas):
+            series = {nome: [0.0] * 12 for nome in somas}
+            linhas = queryset.filter(**{
+                f'{campo}__gte': inicio,
+                f'{campo}__lt': fim
+            }).annotate(
+                mes=TruncMonth(campo)
+            ).values('mes').annotate(**somas).order_by()
+            for linha in linhas:
+                for nome in somas:
+                    series[nome][linha['mes'].month - 1] = float(linha[nome] or 0)
+            return series
+        
+        # Vendas
+        vendas = por_mes(
+            Venda.objects.filter(status__in=VENDA_STATUS_RECEITA), 'data_venda',
+            total=Sum('valor_total')
+        )
+        
+        # Compras (Custos)
+        compras = por_mes(
+            PedidoCompra.objects.filter(status__in=['aprovado', 'recebido', 'concluido']), 'data_pedido',
+            total=Sum('valor_total')
+        )
+        
+        # OS
+        os = por_mes(
+            OrdemServico.objects.all(), 'data_abertura',
+            servicos=Sum('valor_servico'),
+            pecas=Sum('valor_pecas')
+        )
         
         return {
-            'vendas_anual': vendas_mensal,
-            'compras_anual': compras_mensal,
-            'os_servicos_anual': os_servicos_mensal,
-            'os_produtos_anual': os_produtos_mensal,
+            'vendas_anual': vendas['total'],
+            'compras_anual': compras['total'],
+            'os_servicos_anual': os['servicos'],
+            'os_produtos_anual': os['pecas'],
             'meses': ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
         }
     
@@ -337,7 +311,7 @@ class DashboardView(APIView):
         
         # Formatar OS
         for os in movimentacoes['os']:
-            tecnico = venda.get('tecnico__first_name', '')
+            tecnico = os.get('tecnico__first_name', '')
             resultado.append({
                 'id': os['id'],
                 'tipo': 'os',
@@ -366,7 +340,7 @@ class DashboardView(APIView):
 
 
 
-class RelatorioVendasView(APIView):
+class RelatorioVendasView(BancoRelatoriosMixin, APIView):
     """
     Relatório de vendas por período
     """
@@ -374,36 +348,27 @@ class RelatorioVendasView(APIView):
     
     def get(self, request):
         # Parâmetros
-        data_inicio = request.query_params.get('data_inicio')
-        data_fim = request.query_params.get('data_fim')
-        cliente_id = request.query_params.get('cliente_id')
         produto_id = request.query_params.get('produto_id')
         
-        # Query base
-        vendas = Venda.objects.filter(status='finalizada')
+        # Query base com filtros
+        vendas = exports.filtrar_vendas(request.query_params)
         
-        # Filtros
-        if data_inicio:
-            vendas = vendas.filter(data_venda__gte=data_inicio)
-        if data_fim:
-            vendas = vendas.filter(data_venda__lte=data_fim)
-        if cliente_id:
-            vendas = vendas.filter(cliente_id=cliente_id)
+        if request.query_params.get('export') == 'xlsx':
+            return StreamingExcelExporter.response(
+                exports.planilhas_vendas(request.query_params), 'relatorio_vendas.xlsx'
+            )
         
-        # Resumo
-        resumo = vendas.aggregate(
-            total_vendas=Sum('valor_total'),
-            quantidade=Count('id'),
-            ticket_medio=Avg('valor_total')
-        )
+        # Resumo, vendas por dia e estatísticas do ticket (uma consulta)
+        vendas_df = analytics.carregar(vendas, 'data_venda', 'valor_total', numericos=['valor_total'])
+        vendas_por_dia = analytics.totais_por_periodo(vendas_df, 'data_venda', 'valor_total', freq='D')
+        ticket = analytics.estatisticas(vendas_df['valor_total'], percentis=(50, 90))
         
-        # Vendas por dia
-        vendas_por_dia = vendas.extra(
-            select={'dia': 'DATE(data_venda)'}
-        ).values('dia').annotate(
-            total=Sum('valor_total'),
-            quantidade=Count('id')
-        ).order_by('dia')
+        # Curva ABC dos produtos vendidos no período
+        itens_df = analytics.carregar(
+            ItemVenda.objects.filter(venda__in=vendas, produto__isnull=False),
+            'produto__nome', 'preco_total', numericos=['preco_total']
+        )
+        curva_abc = analytics.curva_abc(itens_df, 'produto__nome', 'preco_total')
         
         # Vendas por produto (se filtrado)
         vendas_por_produto = None
@@ -421,44 +386,52 @@ class RelatorioVendasView(APIView):
             'numero',
             'data_venda',
             'cliente__nome_razao_social',
-            'valor_total',
-            'desconto',
-            'valor_liquido'
+            'valor_produtos',
+            'valor_desconto',
+            'valor_total'
         ).order_by('-data_venda')
         
         return Response({
             'resumo': {
-                'total_vendas': float(resumo['total_vendas'] or 0),
-                'quantidade': resumo['quantidade'],
-                'ticket_medio': float(resumo['ticket_medio'] or 0)
+                'total_vendas': float(vendas_df['valor_total'].sum()),
+                'quantidade': ticket['quantidade'],
+                'ticket_medio': ticket['media'] or 0
             },
-            'vendas_por_dia': list(vendas_por_dia),
+            'vendas_por_dia': vendas_por_dia,
+            'ticket': ticket,
+            'curva_abc_produtos': curva_abc,
             'vendas_por_produto': vendas_por_produto,
             'vendas': list(vendas_lista)
         })
 
 
-class RelatorioEstoqueView(APIView):
+class RelatorioEstoqueView(BancoRelatoriosMixin, APIView):
     """
     Relatório de estoque atual e movimentações
     """
     # permission_classes = [IsAuthenticated]  # Desabilitado para teste local
     
+    @relatorio_em_cache('estoque')
     def get(self, request):
+        if request.query_params.get('export') == 'xlsx':
+            return StreamingExcelExporter.response(
+                exports.planilhas_estoque(request.query_params), 'relatorio_estoque.xlsx'
+            )
+        
         # Produtos com estoque baixo
         produtos_estoque_baixo = Produto.objects.filter(
-            quantidade_estoque__lte=F('estoque_minimo')
+            active=True,
+            tipo='produto',
+            estoque_atual__lte=F('estoque_minimo')
         ).values(
-            'codigo',
+            'codigo_interno',
             'nome',
-            'quantidade_estoque',
+            'estoque_atual',
             'estoque_minimo'
         )
         
-        # Valor total em estoque
-        valor_estoque = Produto.objects.aggregate(
-            valor_total=Sum(F('quantidade_estoque') * F('preco_custo'))
-        )['valor_total'] or 0
+        # Valor total em estoque (mesmo aggregate da posição de estoque)
+        valor_estoque = totais_posicao()['valor_total_estoque']
         
         # Movimentações recentes
         movimentacoes = MovimentacaoEstoque.objects.select_related(
@@ -487,16 +460,22 @@ class RelatorioEstoqueView(APIView):
         })
 
 
-class RelatorioFinanceiroView(APIView):
+class RelatorioFinanceiroView(BancoRelatoriosMixin, APIView):
     """
     Relatório financeiro - DRE simplificado
     """
     # permission_classes = [IsAuthenticated]  # Desabilitado para teste local
     
+    @relatorio_em_cache('financeiro')
     def get(self, request):
         data_inicio = request.query_params.get('data_inicio')
         data_fim = request.query_params.get('data_fim')
         
+        if request.query_params.get('export') == 'xlsx':
+            return StreamingExcelExporter.response(
+                exports.planilhas_financeiro(request.query_params), 'relatorio_financeiro.xlsx'
+            )
+        
         # Receitas
         receitas = ContaReceber.objects.filter(status='recebido')
         if data_inicio:
@@ -519,18 +498,17 @@ class RelatorioFinanceiroView(APIView):
         lucro = total_receitas - total_despesas
         margem = (lucro / total_receitas * 100) if total_receitas > 0 else 0
         
-        # Fluxo de caixa
+        # Fluxo de caixa por dia e tipo
         fluxo = FluxoCaixa.objects.all()
         if data_inicio:
-            fluxo = fluxo.filter(data_movimentacao__gte=data_inicio)
+            fluxo = fluxo.filter(data__gte=data_inicio)
         if data_fim:
-            fluxo = fluxo.filter(data_movimentacao__lte=data_fim)
+            fluxo = fluxo.filter(data__lte=data_fim)
         
-        fluxo_por_dia = fluxo.extra(
-            select={'dia': 'DATE(data_movimentacao)'}
-        ).values('dia', 'tipo').annotate(
-            total=Sum('valor')
-        ).order_by('dia')
+        fluxo_df = analytics.carregar(fluxo, 'data', 'tipo', 'valor', numericos=['valor'])
+        fluxo_por_dia = analytics.pivot_para_registros(
+            analytics.pivot_periodo(fluxo_df, 'data', 'valor', colunas='tipo', freq='D')
+        )
         
         # Contas a receber por vencimento
         hoje = timezone.now().date()
@@ -564,7 +542,7 @@ class RelatorioFinanceiroView(APIView):
                 'lucro': float(lucro),
                 'margem_percentual': round(margem, 2)
             },
-            'fluxo_caixa': list(fluxo_por_dia),
+            'fluxo_caixa': fluxo_por_dia,
             'contas_receber': {
                 'vencidas': float(contas_receber_vencidas),
                 'vencer_7dias': float(contas_receber_vencer_7dias)
@@ -576,12 +554,13 @@ class RelatorioFinanceiroView(APIView):
         })
 
 
-class RelatorioOSView(APIView):
+class RelatorioOSView(BancoRelatoriosMixin, APIView):
     """
     Relatório de Ordens de Serviço
     """
     # permission_classes = [IsAuthenticated]  # Desabilitado para teste local
     
+    @relatorio_em_cache('os')
     def get(self, request):
         data_inicio = request.query_params.get('data_inicio')
         data_fim = request.query_params.get('data_fim')
@@ -621,22 +600,15 @@ class RelatorioOSView(APIView):
             valor_total=Sum('valor_total')
         ).order_by('-quantidade')
         
-        # Tempo médio de conclusão
-        os_concluidas = OrdemServico.objects.filter(
-            status='concluida',
-            data_conclusao__isnull=False
+        # Tempo de conclusão (dias): média e percentis vetorizados
+        os_concluidas = analytics.carregar(
+            OrdemServico.objects.filter(status='concluida', data_conclusao__isnull=False),
+            'data_abertura', 'data_conclusao'
+        )
+        tempo_conclusao = analytics.estatisticas(
+            analytics.duracao_dias(os_concluidas, 'data_abertura', 'data_conclusao'),
+            percentis=(50, 90), casas=1
         )
-        
-        tempo_medio = None
-        if os_concluidas.exists():
-            tempos = []
-            for os in os_concluidas:
-                if os.data_conclusao and os.data_abertura:
-                    delta = os.data_conclusao - os.data_abertura
-                    tempos.append(delta.days)
-            
-            if tempos:
-                tempo_medio = sum(tempos) / len(tempos)
         
         return Response({
             'resumo': {
@@ -645,5 +617,6 @@ class RelatorioOSView(APIView):
             },
             'por_status': list(os_por_status),
             'por_tecnico': list(os_por_tecnico),
-            'tempo_medio_conclusao_dias': round(tempo_medio, 1) if tempo_medio else None
+            'tempo_medio_conclusao_dias': tempo_conclusao['media'],
+            'tempo_conclusao_dias': tempo_conclusao
         })
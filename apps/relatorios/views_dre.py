@@ -4,30 +4,30 @@
 Provides:
 - DREBaseView: API view that returns DRE data (monthly or annual) as JSON.
 - DREExportView: API view that returns PDF or Excel export of the DRE.
+- DREComparativoView: API view that compares the DRE across several periods.
 - DREView: Alias for backward compatibility (imports expecting DREView).
 """
 
-from datetime import timedelta
+from datetime import date
 
 from django.http import HttpResponse
 from django.utils import timezone
-from django.db.models import Sum
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-import io
-import pandas as pd
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 
-# Application models
-from apps.vendas.models import Venda
-from apps.assistencia.models import OrdemServico
-from apps.financeiro.models import ContaPagar, ContaReceber, CategoriaDRE
+from apps.core.routers import BancoRelatoriosMixin
 
+# DRE calculation engine
+from .dre import (
+    GRANULARIDADES, agrupar_meses, calcular_linhas, limites_mes,
+    meses_do_intervalo, somar_brutos, variacoes,
+)
+from . import exports, snapshots
+from .utils import StreamingExcelExporter
 
-class DREBaseView(APIView):
+
+class DREBaseView(BancoRelatoriosMixin, APIView):
     """Base view that calculates DRE data.
 
     GET parameters:
@@ -47,11 +47,7 @@ class DREBaseView(APIView):
     # ---------------------------------------------------------------------
     def _calcular_dre_mensal(self, ano, mes):
         """Calculate DRE for a specific month."""
-        inicio = timezone.datetime(ano, mes, 1).date()
-        if mes == 12:
-            fim = timezone.datetime(ano + 1, 1, 1).date() - timedelta(days=1)
-        else:
-            fim = timezone.datetime(ano, mes + 1, 1).date() - timedelta(days=1)
+        inicio, fim = limites_mes(ano, mes)
         valores = self._calcular_valores_periodo(inicio, fim)
         dre = {
             'periodo': {
@@ -110,13 +106,10 @@ class DREBaseView(APIView):
             'despesas_operacionais': 0,
             'lucro_liquido': 0,
         }
+        # All 12 months come from a single grouped pass over each source
+        brutos_por_mes = snapshots.valores_por_mes(date(ano, 1, 1), date(ano, 12, 31))
         for mes in range(1, 13):
-            inicio = timezone.datetime(ano, mes, 1).date()
-            if mes == 12:
-                fim = timezone.datetime(ano + 1, 1, 1).date() - timedelta(days=1)
-            else:
-                fim = timezone.datetime(ano, mes + 1, 1).date() - timedelta(days=1)
-            valores = self._calcular_valores_periodo(inicio, fim)
+            valores = calcular_linhas(brutos_por_mes[(ano, mes)])
             # Accumulate totals
             totais['receita_bruta'] += valores['receita_bruta_total']
             totais['deducoes'] += valores['deducoes_total']
@@ -154,201 +147,119 @@ class DREBaseView(APIView):
 
     def _calcular_valores_periodo(self, inicio, fim):
         """Calculate all financial values for a given period."""
-        # ---------- Receita Bruta ----------
-        vendas = Venda.objects.filter(
-            data_venda__gte=inicio,
-            data_venda__lte=fim,
-            status='finalizada'
-        ).aggregate(total=Sum('valor_total'), custo=Sum('custo_total'), frete=Sum('frete'), desconto=Sum('desconto'))
-        vendas_produtos = vendas['total'] or 0
-        custo_mercadorias = vendas['custo'] or 0
-        frete_vendas = vendas['frete'] or 0
-        desconto_vendas = vendas['desconto'] or 0
-
-        os = OrdemServico.objects.filter(
-            data_abertura__gte=inicio,
-            data_abertura__lte=fim
-        ).aggregate(servicos=Sum('valor_servicos'), produtos=Sum('valor_produtos'), custos=Sum('custo_total'), frete=Sum('frete'), desconto=Sum('desconto'))
-        prestacao_servicos = os['servicos'] or 0
-        vendas_mercadorias = os['produtos'] or 0
-        custo_servicos = os['custos'] or 0
-        frete_os = os['frete'] or 0
-        desconto_os = os['desconto'] or 0
-
-        frete = frete_vendas + frete_os
-        receita_bruta_total = vendas_produtos + vendas_mercadorias + prestacao_servicos + frete
-
-        # ---------- Deduções ----------
-        categorias_valores = self._buscar_valores_categorias(inicio, fim)
-        devolucoes = categorias_valores.get('5', 0)
-        abatimentos = categorias_valores.get('6', 0) + desconto_vendas + desconto_os
-        impostos = categorias_valores.get('7', 0)
-        deducoes_total = devolucoes + abatimentos + impostos
-
-        # ---------- Receita Líquida ----------
-        receita_liquida = receita_bruta_total - deducoes_total
-
-        # ---------- Custos ----------
-        custo_produtos = categorias_valores.get('8', 0)
-        custos_total = custo_produtos + custo_mercadorias + custo_servicos
-
-        # ---------- Lucro Bruto ----------
-        lucro_bruto = receita_liquida - custos_total
-
-        # ---------- Despesas Operacionais ----------
-        despesas_vendas = categorias_valores.get('11', 0)
-        despesas_administrativas = categorias_valores.get('12', 0)
-        pagamento_salarios = categorias_valores.get('13', 0)
-        despesas_operacionais_total = despesas_vendas + despesas_administrativas + pagamento_salarios
+        return calcular_linhas(snapshots.valores_totais(inicio, fim))
 
-        # ---------- Despesas Financeiras Líquidas ----------
-        despesas_financeiras = categorias_valores.get('14', 0)
-        variacoes_cambiais = categorias_valores.get('15', 0)
-        despesas_financeiras_liquidas = variacoes_cambiais - despesas_financeiras
 
-        # ---------- Outras Receitas e Despesas ----------
-        equivalencia_patrimonial = categorias_valores.get('16', 0)
-        venda_bens = categorias_valores.get('17', 0)
-        custo_venda_bens = categorias_valores.get('18', 0)
-        outras_receitas = categorias_valores.get('21', 0)
-        outras_despesas = categorias_valores.get('22', 0)
-        outras_receitas_despesas = (equivalencia_patrimonial + venda_bens + outras_receitas) - (custo_venda_bens + outras_despesas)
-
-        # ---------- Resultado Operacional ----------
-        resultado_operacional = lucro_bruto - despesas_operacionais_total + despesas_financeiras_liquidas + outras_receitas_despesas
-
-        # ---------- Provisão IR/CSLL ----------
-        provisao_ir_csll = categorias_valores.get('19', 0)
-
-        # ---------- Lucro antes Participações ----------
-        lucro_antes_participacoes = resultado_operacional - provisao_ir_csll
-
-        # ---------- Participações ----------
-        participacoes = categorias_valores.get('20', 0)
-
-        # ---------- Lucro Líquido ----------
-        lucro_liquido = lucro_antes_participacoes - participacoes
+class DREExportView(BancoRelatoriosMixin, APIView):
+    """Export DRE report as PDF or Excel.
 
-        # ---------- Margem Líquida ----------
-        margem_liquida = (lucro_liquido / receita_bruta_total * 100) if receita_bruta_total > 0 else 0
+    Query parameters are the same as DREBaseView (ano, mes) plus `format` (pdf|xlsx).
+    """
 
-        return {
-            'vendas_produtos': float(vendas_produtos),
-            'vendas_mercadorias': float(vendas_mercadorias),
-            'prestacao_servicos': float(prestacao_servicos),
-            'frete': float(frete),
-            'receita_bruta_total': float(receita_bruta_total),
-            'devolucoes': float(devolucoes),
-            'abatimentos': float(abatimentos),
-            'impostos': float(impostos),
-            'deducoes_total': float(deducoes_total),
-            'receita_liquida': float(receita_liquida),
-            'custo_produtos': float(custo_produtos),
-            'custo_mercadorias': float(custo_mercadorias),
-            'custo_servicos': float(custo_servicos),
-            'custos_total': float(custos_total),
-            'lucro_bruto': float(lucro_bruto),
-            'despesas_vendas': float(despesas_vendas),
-            'despesas_administrativas': float(despesas_administrativas),
-            'pagamento_salarios': float(pagamento_salarios),
-            'despesas_operacionais_total': float(despesas_operacionais_total),
-            'despesas_financeiras_liquidas': float(despesas_financeiras_liquidas),
-            'outras_receitas_despesas': float(outras_receitas_despesas),
-            'resultado_operacional': float(resultado_operacional),
-            'provisao_ir_csll': float(provisao_ir_csll),
-            'lucro_antes_participacoes': float(lucro_antes_participacoes),
-            'participacoes': float(participacoes),
-            'lucro_liquido': float(lucro_liquido),
-            'margem_liquida': round(margem_liquida, 2),
-        }
+    def perform_content_negotiation(self, request, force=False):
+        # `format` selects the file type here, not a DRF renderer
+        return super().perform_content_negotiation(request, force=True)
 
-    def _buscar_valores_categorias(self, inicio, fim):
-        """Fetch DRE category values for the period.
+    def get(self, request):
+        fmt = request.query_params.get('format', 'pdf').lower()
+        if fmt == 'xlsx':
+            return StreamingExcelExporter.response(
+                exports.planilhas_dre(request.query_params),
+                exports.nome_arquivo_dre(request.query_params, 'xlsx')
+            )
+        response = HttpResponse(exports.pdf_dre(request.query_params), content_type='application/pdf')
+        response['Content-Disposition'] = (
+            f'attachment; filename="{exports.nome_arquivo_dre(request.query_params, "pdf")}"'
+        )
+        return response
 
-        Returns a dict mapping category code to Decimal value.
-        """
-        valores = {}
-        categorias = CategoriaDRE.objects.filter(ativo=True)
-        for categoria in categorias:
-            if categoria.tipo in ['despesa', 'custo']:
-                total = ContaPagar.objects.filter(
-                    data_pagamento__gte=inicio,
-                    data_pagamento__lte=fim,
-                    status='pago',
-                    categoria_dre=categoria
-                ).aggregate(total=Sum('valor_original'))['total'] or 0
-                valores[categoria.codigo] = float(total)
-            elif categoria.tipo == 'receita':
-                total = ContaReceber.objects.filter(
-                    data_recebimento__gte=inicio,
-                    data_recebimento__lte=fim,
-                    status='recebido',
-                    categoria_dre=categoria
-                ).aggregate(total=Sum('valor_original'))['total'] or 0
-                valores[categoria.codigo] = float(total)
-        return valores
 
+class DREComparativoView(BancoRelatoriosMixin, APIView):
+    """Compare DRE lines across several periods.
 
-class DREExportView(APIView):
-    """Export DRE report as PDF or Excel.
+    GET parameters:
+        inicio, fim (AAAA-MM) – month range, defaults to the trailing 12 months.
+        granularidade (mes|trimestre|ano) – how the range is split, defaults to mes.
+        periodos (optional) – explicit comma-separated ranges, e.g.
+            ``2023-01:2023-12,2024-01:2024-12``; overrides inicio/fim/granularidade.
 
-    Query parameters are the same as DREBaseView (ano, mes) plus `format` (pdf|xlsx).
+    All periods are computed from a single pass over the monthly DRE values;
+    each period carries the delta and % variation against the previous one.
     """
 
+    MAX_MESES = 120
+
     def get(self, request):
-        ano = int(request.query_params.get('ano', timezone.now().year))
-        mes = request.query_params.get('mes')
-        fmt = request.query_params.get('format', 'pdf').lower()
-        calculator = DREBaseView()
-        if mes:
-            data = calculator._calcular_dre_mensal(ano, int(mes))
+        try:
+            periodos, granularidade = self._parse_periodos(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self._calcular_comparativo(periodos, granularidade))
+
+    @staticmethod
+    def _parse_mes(valor):
+        try:
+            ano, mes = (int(parte) for parte in valor.split('-'))
+            date(ano, mes, 1)
+        except (TypeError, ValueError):
+            raise ValueError(f'Mês inválido: {valor!r} (use AAAA-MM)')
+        return ano, mes
+
+    def _parse_periodos(self, params):
+        """Return ([(rotulo, [(ano, mes), ...])], granularidade)."""
+        if params.get('periodos'):
+            periodos = []
+            for intervalo in params['periodos'].split(','):
+                inicio, _, fim = intervalo.strip().partition(':')
+                inicio = self._parse_mes(inicio)
+                fim = self._parse_mes(fim or f'{inicio[0]}-{inicio[1]}')
+                meses = meses_do_intervalo(date(*inicio, 1), date(*fim, 1))
+                if not meses:
+                    raise ValueError(f'Período inválido: {intervalo!r}')
+                periodos.append((intervalo.strip(), meses))
+            granularidade = 'personalizado'
         else:
-            data = calculator._calcular_dre_anual(ano)
-        if fmt == 'xlsx':
-            # Flatten nested dict for Excel
-            flat = {}
-            def flatten(prefix, obj):
-                if isinstance(obj, dict):
-                    for k, v in obj.items():
-                        flatten(f"{prefix}{k}_" if prefix else f"{k}_", v)
-                else:
-                    flat[prefix.rstrip('_')] = obj
-            flatten('', data)
-            df = pd.DataFrame(list(flat.items()), columns=['Campo', 'Valor'])
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='DRE')
-            output.seek(0)
-            response = HttpResponse(output.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename="dre_{ano}_{mes if mes else "annual"}.xlsx"'
-            return response
-        # PDF generation
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        elements = [Paragraph('Relatório DRE', styles['Title'])]
-        rows = []
-        def add_rows(prefix, obj):
-            if isinstance(obj, dict):
-                for k, v in obj.items():
-                    add_rows(f"{prefix}{k} ", v)
+            granularidade = params.get('granularidade', 'mes')
+            if granularidade not in GRANULARIDADES:
+                raise ValueError(f'Granularidade inválida: use {", ".join(GRANULARIDADES)}')
+            hoje = timezone.localdate()
+            fim = self._parse_mes(params['fim']) if params.get('fim') else (hoje.year, hoje.month)
+            if params.get('inicio'):
+                inicio = self._parse_mes(params['inicio'])
             else:
-                rows.append([prefix.rstrip(' '), str(obj)])
-        add_rows('', data)
-        table = Table(rows, colWidths=[200, 300])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ]))
-        elements.append(table)
-        doc.build(elements)
-        pdf = buffer.getvalue()
-        buffer.close()
-        response = HttpResponse(pdf, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="dre_{ano}_{mes if mes else "annual"}.pdf"'
-        return response
+                inicio = (fim[0] - 1, fim[1] + 1) if fim[1] < 12 else (fim[0], 1)
+            meses = meses_do_intervalo(date(*inicio, 1), date(*fim, 1))
+            if not meses:
+                raise ValueError('inicio deve ser anterior a fim')
+            periodos = agrupar_meses(meses, granularidade)
+
+        total_meses = len({mes for _, meses in periodos for mes in meses})
+        if total_meses > self.MAX_MESES:
+            raise ValueError(f'Intervalo máximo de {self.MAX_MESES} meses')
+        return periodos, granularidade
+
+    def _calcular_comparativo(self, periodos, granularidade):
+        primeiro = min(meses[0] for _, meses in periodos)
+        ultimo = max(meses[-1] for _, meses in periodos)
+        brutos_por_mes = snapshots.valores_por_mes(date(*primeiro, 1), limites_mes(*ultimo)[1])
+
+        resultado = []
+        anterior = None
+        for rotulo, meses in periodos:
+            valores = calcular_linhas(somar_brutos(brutos_por_mes, meses))
+            resultado.append({
+                'periodo': rotulo,
+                'data_inicio': date(*meses[0], 1).isoformat(),
+                'data_fim': limites_mes(*meses[-1])[1].isoformat(),
+                'valores': valores,
+                'variacao': variacoes(anterior, valores) if anterior is not None else None,
+            })
+            anterior = valores
+
+        return {
+            'granularidade': granularidade,
+            'periodos': resultado,
+        }
 
 
 # Alias for backward compatibility – many parts of the code import DREView
@@ -0,0 +1,68 @@
+"""
+Views for asynchronous report jobs
+
+- POST /jobs/ enqueues a report (or reuses an identical recent one).
+- GET /jobs/<id>/ polls status and progress.
+- GET /jobs/<id>/download/ serves the generated file.
+"""
+
+from django.db.models import Q
+from django.http import FileResponse
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .jobs import nome_download, solicitar_relatorio
+from .models import RelatorioJob
+from .serializers import RelatorioJobSerializer
+
+
+class RelatorioJobViewSet(mixins.CreateModelMixin,
+                          mixins.RetrieveModelMixin,
+                          mixins.ListModelMixin,
+                          viewsets.GenericViewSet):
+    """
+    ViewSet for RelatorioJob
+    """
+    queryset = RelatorioJob.objects.all()
+    serializer_class = RelatorioJobSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        # Só os jobs que o usuário pediu (ou reaproveitou): os arquivos têm dados financeiros
+        usuario = self.request.user
+        return super().get_queryset().filter(
+            pk__in=RelatorioJob.objects.filter(Q(usuario=usuario) | Q(solicitantes=usuario)).values('pk')
+        )
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        job, criado = solicitar_relatorio(
+            serializer.validated_data['tipo'],
+            serializer.validated_data.get('formato', 'xlsx'),
+            serializer.validated_data.get('parametros', {}),
+            usuario=request.user
+        )
+        data = self.get_serializer(job).data
+        data['reaproveitado'] = not criado
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the generated file"""
+        job = self.get_object()
+        
+        if job.status != 'concluido' or not job.arquivo:
+            return Response({
+                'error': 'Relatório ainda não está pronto'
+            }, status=status.HTTP_409_CONFLICT)
+        
+        if job.expirado:
+            return Response({
+                'error': 'Relatório expirado, solicite novamente'
+            }, status=status.HTTP_410_GONE)
+        
+        return FileResponse(job.arquivo.open('rb'), as_attachment=True, filename=nome_download(job))
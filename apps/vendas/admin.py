@@ -2,10 +2,35 @@
 Admin configuration for Vendas app
 """
 
+from django import forms
 from django.contrib import admin
+from django.db.models import F
 from .models import Venda, ItemVenda, RecebimentoVenda, PDV, MovimentoPDV
 
 
+class VendaAdminForm(forms.ModelForm):
+    """Confere o estoque antes de faturar (a baixa acontece no post_save)"""
+    
+    class Meta:
+        model = Venda
+        fields = '__all__'
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        faturando = (
+            self.instance.pk and cleaned_data.get('status') == 'faturado'
+            and self.instance.status != 'faturado'
+        )
+        if faturando:
+            faltando = self.instance.itens.filter(
+                produto__isnull=False, produto__estoque_atual__lt=F('quantidade')
+            ).values_list('produto__nome', 'produto__estoque_atual').first()
+            if faltando:
+                nome, disponivel = faltando
+                raise forms.ValidationError(f'Estoque insuficiente para {nome}. Disponível: {disponivel}')
+        return cleaned_data
+
+
 class ItemVendaInline(admin.TabularInline):
     model = ItemVenda
     extra = 1
@@ -20,6 +45,7 @@ class RecebimentoVendaInline(admin.TabularInline):
 
 @admin.register(Venda)
 class VendaAdmin(admin.ModelAdmin):
+    form = VendaAdminForm
     list_display = [
         'numero', 'cliente', 'data_venda', 'status',
         'valor_total', 'vendedor', 'total_itens'
@@ -78,6 +104,7 @@ class PDVAdmin(admin.ModelAdmin):
         'valor_sangrias', 'valor_suprimentos', 'total_movimentos',
         'saldo_calculado', 'created_at', 'updated_at'
     ]
+    raw_id_fields = ['conta_bancaria']
     inlines = [MovimentoPDVInline]
     date_hierarchy = 'data_abertura'
     
@@ -0,0 +1,281 @@
+"""
+Catálogo do PDV em memória
+
+A leitura de código no caixa (`buscar`) é resolvida em dicionários do
+processo, sem ir ao banco: por tenant, códigos de barras e códigos
+internos apontam para um registro do produto (ProdutoPDV) com as colunas
+que o ProdutoSerializer devolve, mais o nome da categoria e o custo
+unitário, para que a resposta do caixa continue a mesma de antes do
+catálogo.
+
+Coerência entre processos: cada alteração de produto (post_save/
+post_delete) ou de estoque (movimentações) incrementa, após o commit, a
+versão do catálogo do tenant no cache compartilhado (Redis) e grava sob
+essa versão os ids alterados. Cada leitura confere a versão (um GET no
+cache); se ela mudou, o processo recarrega só os produtos alterados, ou o
+catálogo inteiro se a lista de alguma versão já expirou.
+
+Um código que não está no índice ainda é procurado no banco com uma
+consulta (OR dos dois códigos, ambos indexados) e, se existir, entra no
+índice. O índice é aquecido na subida do worker (`aquecer_catalogos`, em
+config/wsgi.py) ou na primeira leitura do tenant.
+"""
+
+import logging
+import threading
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from apps.core.utils import get_schema_name, get_tenant_schemas, tenant_context
+from apps.erp.models import Categoria, Produto
+from apps.erp.serializers import ProdutoSerializer
+from apps.estoque.models import CustoProduto
+
+logger = logging.getLogger(__name__)
+
+# Campo do registro -> coluna lida (relacionadas pelo caminho do ORM)
+COLUNAS = {
+    'id': 'id',
+    'tipo': 'tipo',
+    'nome': 'nome',
+    'descricao': 'descricao',
+    'categoria_id': 'categoria_id',
+    'categoria_nome': 'categoria__nome',
+    'codigo_interno': 'codigo_interno',
+    'codigo_barras': 'codigo_barras',
+    'ncm': 'ncm',
+    'unidade_medida': 'unidade_medida',
+    'preco_custo': 'preco_custo',
+    'preco_venda': 'preco_venda',
+    'margem_lucro': 'margem_lucro',
+    'estoque_atual': 'estoque_atual',
+    'estoque_minimo': 'estoque_minimo',
+    'estoque_maximo': 'estoque_maximo',
+    'fornecedor_preferencial_id': 'fornecedor_preferencial_id',
+    'localizacao': 'localizacao',
+    'controla_lote': 'controla_lote',
+    'controla_validade': 'controla_validade',
+    'imagem': 'imagem',
+    'active': 'active',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'custo_unitario': 'custo__custo_unitario',
+}
+CAMPOS = tuple(COLUNAS)
+
+# Por quanto tempo a lista de ids de uma versão fica no cache; processos
+# mais atrasados que isso recarregam o catálogo inteiro
+ALTERACOES_TIMEOUT = 60 * 60
+
+
+class ProdutoPDV(namedtuple('ProdutoPDV', CAMPOS)):
+    """Registro do produto para o caixa"""
+    __slots__ = ()
+
+    def como_produto(self):
+        """Produto (não salvo) com categoria e custo já carregados, sem consulta"""
+        campos = self._asdict()
+        categoria_nome = campos.pop('categoria_nome')
+        custo_unitario = campos.pop('custo_unitario')
+        produto = Produto(**campos)
+        produto._state.adding = False
+        if produto.categoria_id:
+            produto.categoria = Categoria(pk=produto.categoria_id, nome=categoria_nome)
+        custo = None
+        if custo_unitario is not None:
+            custo = CustoProduto(produto=produto, custo_unitario=custo_unitario)
+        Produto.custo.related.set_cached_value(produto, custo)
+        return produto
+
+    def como_dict(self):
+        """A mesma representação do ProdutoSerializer"""
+        return ProdutoSerializer(self.como_produto()).data
+
+
+def _codigos(produto):
+    return produto.codigo_interno, produto.codigo_barras
+
+
+class _Indice:
+    """Catálogo de um tenant em um processo"""
+
+    def __init__(self, versao):
+        self.versao = versao
+        self.por_id = {}
+        self.por_barras = {}
+        self.por_interno = {}
+
+    def adicionar(self, produto):
+        anterior = self.por_id.get(produto.id)
+        self.por_id[produto.id] = produto
+        if anterior is not None and _codigos(anterior) == _codigos(produto):
+            # Só nome/preço/estoque mudaram: os códigos continuam apontando para o id
+            return
+        if anterior is not None:
+            self._desindexar(anterior)
+        self.por_interno[produto.codigo_interno] = produto.id
+        if produto.codigo_barras:
+            # Código de barras repetido: vale o produto de menor id
+            atual = self.por_barras.get(produto.codigo_barras)
+            if atual is None or produto.id < atual:
+                self.por_barras[produto.codigo_barras] = produto.id
+
+    def remover(self, produto_id):
+        anterior = self.por_id.pop(produto_id, None)
+        if anterior is not None:
+            self._desindexar(anterior)
+
+    def _desindexar(self, produto):
+        if self.por_interno.get(produto.codigo_interno) == produto.id:
+            del self.por_interno[produto.codigo_interno]
+        if produto.codigo_barras and self.por_barras.get(produto.codigo_barras) == produto.id:
+            del self.por_barras[produto.codigo_barras]
+            outros = [
+                outro.id for outro in self.por_id.values()
+                if outro.codigo_barras == produto.codigo_barras and outro.id != produto.id
+            ]
+            if outros:
+                self.por_barras[produto.codigo_barras] = min(outros)
+
+    def buscar(self, codigo):
+        produto_id = self.por_barras.get(codigo) or self.por_interno.get(codigo)
+        return self.por_id.get(produto_id) if produto_id else None
+
+
+_indices = {}
+_trava = threading.Lock()
+
+
+def _schema():
+    return get_schema_name() or 'public'
+
+
+def _chave_versao(schema):
+    return f'pdv:catalogo:versao:{schema}'
+
+
+def _chave_alteracoes(schema, versao):
+    return f'pdv:catalogo:{schema}:{versao}'
+
+
+def versao_atual(schema=None):
+    """Versão do catálogo do tenant (1 se ainda não existir)"""
+    chave = _chave_versao(schema or _schema())
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, 1, None)
+        versao = cache.get(chave, 1)
+    return versao
+
+
+def registrar_alteracao(produto_ids, schema=None):
+    """Publica uma nova versão do catálogo com os produtos alterados"""
+    schema = schema or _schema()
+    chave = _chave_versao(schema)
+    try:
+        versao = cache.incr(chave)
+    except ValueError:
+        # Sem versão no cache: quem tiver índice recarrega tudo
+        cache.set(chave, 2, None)
+        return
+    cache.set(_chave_alteracoes(schema, versao), sorted(set(produto_ids)), ALTERACOES_TIMEOUT)
+
+
+def _produtos():
+    return Produto.objects.filter(active=True, tipo='produto').order_by()
+
+
+def _carregar(schema, versao):
+    indice = _Indice(versao)
+    for linha in _produtos().order_by('pk').values_list(*COLUNAS.values()).iterator(chunk_size=2000):
+        indice.adicionar(ProdutoPDV(*linha))
+    _indices[schema] = indice
+    return indice
+
+
+def _atualizar(schema, indice, versao):
+    """Leva o índice até `versao` relendo só os produtos alterados"""
+    if versao < indice.versao:
+        return _carregar(schema, versao)
+    chaves = [_chave_alteracoes(schema, v) for v in range(indice.versao + 1, versao + 1)]
+    alteracoes = cache.get_many(chaves)
+    if len(alteracoes) < len(chaves):
+        return _carregar(schema, versao)
+
+    ids = set().union(*alteracoes.values())
+    ativos = {
+        linha[0]: ProdutoPDV(*linha)
+        for linha in _produtos().filter(pk__in=ids).values_list(*COLUNAS.values())
+    } if ids else {}
+    for produto_id in ids:
+        if produto_id in ativos:
+            indice.adicionar(ativos[produto_id])
+        else:
+            indice.remover(produto_id)
+    indice.versao = versao
+    return indice
+
+
+def _indice(schema):
+    versao = versao_atual(schema)
+    indice = _indices.get(schema)
+    if indice is not None and indice.versao == versao:
+        return indice
+    with _trava:
+        indice = _indices.get(schema)
+        if indice is None:
+            return _carregar(schema, versao)
+        if indice.versao != versao:
+            return _atualizar(schema, indice, versao)
+        return indice
+
+
+def buscar(codigo):
+    """
+    Produto ativo pelo código de barras ou código interno (ProdutoPDV ou None)
+
+    O código de barras tem prioridade sobre o código interno.
+    """
+    schema = _schema()
+    indice = _indice(schema)
+    produto = indice.buscar(codigo)
+    if produto is not None:
+        return produto
+
+    linhas = [
+        ProdutoPDV(*linha) for linha in _produtos().filter(
+            Q(codigo_barras=codigo) | Q(codigo_interno=codigo)
+        ).order_by('pk').values_list(*COLUNAS.values())
+    ]
+    produto = next(
+        (linha for linha in linhas if linha.codigo_barras == codigo),
+        linhas[0] if linhas else None
+    )
+    if produto is not None:
+        with _trava:
+            indice.adicionar(produto)
+    return produto
+
+
+def aquecer(schema=None):
+    """Carrega o catálogo do tenant neste processo"""
+    schema = schema or _schema()
+    with _trava:
+        return _carregar(schema, versao_atual(schema))
+
+
+def aquecer_catalogos():
+    """Carrega o catálogo de todos os tenants (subida do worker)"""
+    for schema_name in get_tenant_schemas():
+        try:
+            with tenant_context(schema_name):
+                aquecer()
+        except Exception:
+            logger.exception('Falha ao aquecer o catálogo do PDV (%s)', schema_name)
+
+
+def limpar():
+    """Descarta os índices deste processo"""
+    _indices.clear()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0004_recebimentovenda_delete_formapagamento'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='venda',
+            name='status',
+            field=models.CharField(choices=[('orcamento', 'Orçamento'), ('aprovado', 'Aprovado'), ('faturado', 'Faturado'), ('entregue', 'Entregue'), ('finalizada', 'Finalizada (PDV)'), ('cancelado', 'Cancelado')], default='orcamento', max_length=20, verbose_name='Status'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0005_venda_status_finalizada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venda',
+            name='uuid_pdv',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True, verbose_name='UUID do PDV'),
+        ),
+    ]
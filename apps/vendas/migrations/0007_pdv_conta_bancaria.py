@@ -0,0 +1,20 @@
+# Generated by Django 4.2.8 on 2026-10-18 11:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0005_formarecebimento_alter_pagamento_forma_pagamento_and_more'),
+        ('vendas', '0006_venda_uuid_pdv'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdv',
+            name='conta_bancaria',
+            field=models.ForeignKey(blank=True, help_text='Conta que recebe as vendas do caixa; vazia, usa a única conta do tipo Caixa', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='pdvs', to='financeiro.contabancaria', verbose_name='Conta do Caixa'),
+        ),
+    ]
@@ -7,6 +7,7 @@ from decimal import Decimal
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from apps.core.models import BaseModel
+from apps.core.sequencias import proximo_numero
 from apps.erp.models import Produto, Cliente
 
 User = get_user_model()
@@ -26,6 +27,7 @@ class Venda(BaseModel):
         ('aprovado', 'Aprovado'),
         ('faturado', 'Faturado'),
         ('entregue', 'Entregue'),
+        ('finalizada', 'Finalizada (PDV)'),
         ('cancelado', 'Cancelado'),
     ]
     
@@ -79,6 +81,9 @@ class Venda(BaseModel):
     
     observacoes = models.TextField('Observações', blank=True)
     
+    # Identificador gerado pelo terminal nas vendas feitas offline
+    uuid_pdv = models.UUIDField('UUID do PDV', null=True, blank=True, unique=True, editable=False)
+    
     class Meta:
         verbose_name = 'Venda'
         verbose_name_plural = 'Vendas'
@@ -96,10 +101,7 @@ class Venda(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.numero:
-            # Generate automatic number
-            ultimo = Venda.objects.order_by('-id').first()
-            proximo_id = (ultimo.id + 1) if ultimo else 1
-            self.numero = f'VD{proximo_id:06d}'
+            self.numero = proximo_numero(Venda, 'VD')
         
         # Calculate total
         self.valor_total = self.valor_produtos - self.valor_desconto + self.valor_acrescimo
@@ -204,6 +206,15 @@ class ItemVenda(models.Model):
         if self.produto and self.servico:
             raise ValidationError('Item não pode ter produto e serviço simultaneamente.')
             
+    # preco_total gravado no banco: a venda soma só a diferença (ver signals)
+    _preco_total_salvo = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._preco_total_salvo = instance.__dict__.get('preco_total')
+        return instance
+    
     def save(self, *args, **kwargs):
         """Calcula preço total"""
         self.preco_total = (self.quantidade * self.preco_unitario) - self.desconto + self.acrescimo
@@ -340,6 +351,15 @@ class PDV(BaseModel):
         related_name='caixas',
         verbose_name='Operador'
     )
+    conta_bancaria = models.ForeignKey(
+        'financeiro.ContaBancaria',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='pdvs',
+        verbose_name='Conta do Caixa',
+        help_text='Conta que recebe as vendas do caixa; vazia, usa a única conta do tipo Caixa'
+    )
     data_abertura = models.DateTimeField('Data de Abertura', auto_now_add=True)
     data_fechamento = models.DateTimeField('Data de Fechamento', null=True, blank=True)
     
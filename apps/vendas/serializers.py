@@ -2,7 +2,10 @@
 Serializers for Vendas models
 """
 
+from decimal import Decimal
+
 from rest_framework import serializers
+from apps.erp.models import Produto
 from .models import Venda, ItemVenda, RecebimentoVenda, PDV, MovimentoPDV
 
 
@@ -119,7 +122,7 @@ class PDVSerializer(serializers.ModelSerializer):
     class Meta:
         model = PDV
         fields = [
-            'id', 'numero_caixa', 'operador', 'operador_nome',
+            'id', 'numero_caixa', 'operador', 'operador_nome', 'conta_bancaria',
             'data_abertura', 'data_fechamento', 'valor_inicial',
             'valor_vendas', 'valor_sangrias', 'valor_suprimentos',
             'valor_final', 'status', 'status_display', 'movimentos',
@@ -150,3 +153,54 @@ class PDVListSerializer(serializers.ModelSerializer):
             'id', 'numero_caixa', 'operador_nome', 'data_abertura',
             'status', 'status_display', 'valor_final'
         ]
+
+
+class ItemVendaPDVSerializer(serializers.Serializer):
+    """Item da cesta do PDV"""
+    
+    produto_id = serializers.IntegerField()
+    quantidade = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=Decimal('0.001'))
+    preco = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+
+class FinalizarVendaPDVSerializer(serializers.Serializer):
+    """Serializer for PDV checkout"""
+    
+    MAX_ITENS = 1000
+    
+    itens = ItemVendaPDVSerializer(many=True, allow_empty=False, max_length=MAX_ITENS)
+    cliente_id = serializers.IntegerField(required=False, allow_null=True)
+    forma_pagamento = serializers.CharField(max_length=50, default='dinheiro')
+    desconto = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=Decimal('0'))
+    valor_recebido = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=Decimal('0'))
+
+
+class VendaOfflinePDVSerializer(serializers.Serializer):
+    """Venda gravada pelo terminal sem conexão"""
+    
+    uuid = serializers.UUIDField()
+    data_venda = serializers.DateTimeField(required=False, allow_null=True)
+    itens = ItemVendaPDVSerializer(many=True, allow_empty=False, max_length=FinalizarVendaPDVSerializer.MAX_ITENS)
+    cliente_id = serializers.IntegerField(required=False, allow_null=True)
+    forma_pagamento = serializers.CharField(max_length=50, default='dinheiro')
+    desconto = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=Decimal('0'))
+
+
+class SincronizarVendasPDVSerializer(serializers.Serializer):
+    """Lote de vendas offline enviado pelo terminal"""
+    
+    MAX_VENDAS = 200
+    
+    vendas = VendaOfflinePDVSerializer(many=True, allow_empty=False, max_length=MAX_VENDAS)
+
+
+class ProdutoPDVSyncSerializer(serializers.ModelSerializer):
+    """Produto no delta de sincronização do PDV"""
+    
+    class Meta:
+        model = Produto
+        fields = [
+            'id', 'tipo', 'nome', 'codigo_interno', 'codigo_barras', 'unidade_medida',
+            'preco_venda', 'estoque_atual', 'active', 'updated_at'
+        ]
+        read_only_fields = fields
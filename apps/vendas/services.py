@@ -0,0 +1,300 @@
+"""
+Finalização de vendas do PDV (online e sincronização offline)
+
+`finalizar_venda_pdv` grava a venda do caixa em uma transação, com um
+número fixo de consultas qualquer que seja o tamanho da cesta:
+
+- produtos lidos em uma consulta e totais calculados uma vez, em Decimal
+- itens gravados com bulk_create (sem o post_save de ItemVenda, que
+  recalculava e regravava a venda a cada item)
+- baixa de estoque em lote por `lancar_movimentacoes`; sem saldo, nada é
+  gravado
+- conta a receber já recebida e fluxo de caixa; os saldos da conta
+  bancária e do caixa são somados no banco (F()), sem ler-modificar-salvar
+- a conta bancária é a do PDV, a única conta do tipo Caixa ou a primeira
+  com 'Caixa' no nome; fora disso a venda é recusada com ContaCaixaIndefinida
+- o número da venda é reservado antes da transação (ver
+  apps.core.sequencias): o contador não fica travado durante a venda
+
+`sincronizar_vendas_pdv` usa o mesmo caminho para o lote de vendas que o
+terminal gravou offline: leituras compartilhadas uma vez por lote, uma
+venda por savepoint, os números reservados em um bloco e os saldos do
+caixa somados uma vez no fim.
+"""
+
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.core.sequencias import proximo_numero, proximos_numeros
+from apps.erp.models import Cliente, Produto
+from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.services import TAMANHO_LOTE, EstoqueInsuficiente, lancar_movimentacoes
+from apps.financeiro.models import CategoriaFinanceira, ContaBancaria, ContaReceber, FluxoCaixa
+from .models import PDV, ItemVenda, MovimentoPDV, Venda
+
+CENTAVOS = Decimal('0.01')
+CASAS_QUANTIDADE = Decimal('0.001')
+
+
+def consumidor_final():
+    """Cliente 'Consumidor Final' das vendas sem cliente identificado"""
+    cliente, _ = Cliente.objects.get_or_create(
+        cpf_cnpj='00000000000',
+        defaults={
+            'nome_razao_social': 'Consumidor Final',
+            'tipo': 'pf',
+            'telefone_principal': '0000000000'
+        }
+    )
+    return cliente
+
+
+def categoria_vendas():
+    """Categoria financeira de receita das vendas (criada na primeira venda)"""
+    categoria = CategoriaFinanceira.objects.filter(tipo='receita', nome__icontains='Venda').first()
+    if categoria is None:
+        categoria = CategoriaFinanceira.objects.create(nome='Vendas de Produtos', tipo='receita')
+    return categoria
+
+
+class ContaCaixaIndefinida(ValueError):
+    """PDV sem conta bancária e sem conta do tipo (ou com nome) Caixa para usar"""
+
+    def __init__(self, pdv, contas):
+        onde = 'nenhuma conta' if not contas else f'{contas} contas'
+        super().__init__(
+            f'Defina a conta bancária do caixa {pdv.numero_caixa}: há {onde} do tipo Caixa'
+        )
+
+
+def conta_caixa(pdv):
+    """
+    Conta bancária que recebe as vendas do PDV
+
+    A do PDV; sem ela, a única conta do tipo Caixa; por último, como antes
+    da conta no PDV, a primeira conta com 'Caixa' no nome do banco.
+    """
+    if pdv.conta_bancaria_id:
+        return ContaBancaria.objects.get(pk=pdv.conta_bancaria_id)
+    contas = list(ContaBancaria.objects.filter(tipo_conta__icontains='caixa')[:2])
+    if len(contas) == 1:
+        return contas[0]
+    por_nome = ContaBancaria.objects.filter(banco__icontains='caixa').order_by('pk').first()
+    if por_nome is None:
+        raise ContaCaixaIndefinida(pdv, len(contas))
+    return por_nome
+
+
+def _linhas(itens, produtos):
+    """(produto, quantidade, preço, total) de cada item, com os produtos já lidos"""
+    linhas = []
+    for item in itens:
+        produto = produtos.get(item['produto_id'])
+        if produto is None:
+            raise Produto.DoesNotExist(f"Produto {item['produto_id']} não encontrado")
+        quantidade = Decimal(str(item['quantidade'])).quantize(CASAS_QUANTIDADE)
+        preco = Decimal(str(item['preco'])).quantize(CENTAVOS)
+        linhas.append((produto, quantidade, preco, (quantidade * preco).quantize(CENTAVOS)))
+    return linhas
+
+
+def _registrar_venda(pdv, linhas, usuario, cliente, forma_pagamento, desconto, categoria, caixa,
+                     numero, data_venda=None, uuid_pdv=None):
+    """
+    Venda, itens, baixa de estoque, conta a receber e fluxo de caixa de uma cesta
+
+    `numero` vem reservado antes da transação. Os saldos da conta do caixa
+    e do PDV ficam para `_lancar_caixa`.
+    """
+    desconto = Decimal(str(desconto)).quantize(CENTAVOS)
+    valor_produtos = sum(total for _, _, _, total in linhas)
+    if desconto > valor_produtos:
+        raise ValueError('Desconto maior que o valor dos produtos')
+
+    agora = data_venda or timezone.now()
+    hoje = timezone.localdate(agora)
+    offline = ' (offline)' if uuid_pdv else ''
+    venda = Venda.objects.create(
+        numero=numero,
+        cliente=cliente,
+        vendedor=usuario,
+        status='finalizada',
+        valor_produtos=valor_produtos,
+        valor_desconto=desconto,
+        uuid_pdv=uuid_pdv,
+        observacoes=f'Venda PDV Caixa {pdv.numero_caixa}{offline} - {timezone.localtime(agora):%d/%m/%Y %H:%M}'
+    )
+    if data_venda:
+        # data_venda é auto_now_add: a hora do terminal entra depois do INSERT
+        Venda.objects.filter(pk=venda.pk).update(data_venda=data_venda)
+        venda.data_venda = data_venda
+
+    # bulk_create não passa pelo save() nem pelo post_save de ItemVenda
+    ItemVenda.objects.bulk_create([
+        ItemVenda(venda=venda, produto=produto, quantidade=quantidade, preco_unitario=preco, preco_total=total)
+        for produto, quantidade, preco, total in linhas
+    ], batch_size=TAMANHO_LOTE)
+
+    lancar_movimentacoes([
+        MovimentacaoEstoque(
+            produto=produto,
+            tipo='saida',
+            quantidade=quantidade,
+            usuario=usuario,
+            valor_unitario=preco,
+            documento='venda',
+            documento_numero=venda.numero,
+            motivo=f'Venda {venda.numero}'
+        )
+        for produto, quantidade, preco, _ in linhas
+        if produto.tipo == 'produto'
+    ])
+
+    conta = ContaReceber.objects.create(
+        cliente=venda.cliente,
+        categoria=categoria,
+        descricao=f'Venda PDV {venda.numero}',
+        valor_original=venda.valor_total,
+        valor_recebido=venda.valor_total,
+        data_emissao=hoje,
+        data_vencimento=hoje,
+        data_recebimento=hoje,
+        status='recebido',
+        forma_recebimento=forma_pagamento,
+        conta_bancaria=caixa,
+        numero_documento=venda.numero
+    )
+    FluxoCaixa.objects.create(
+        data=hoje,
+        tipo='entrada',
+        categoria=categoria,
+        descricao=f'Recebimento Venda PDV {venda.numero}',
+        valor=venda.valor_total,
+        conta_bancaria=caixa,
+        conta_receber=conta
+    )
+    return venda
+
+
+def _lancar_caixa(pdv, caixa, vendas):
+    """Soma as vendas aos saldos da conta do caixa e do PDV (F(), uma vez por lote)"""
+    if not vendas:
+        return
+    total = sum(venda.valor_total for venda in vendas)
+    ContaBancaria.objects.filter(pk=caixa.pk).update(saldo_atual=F('saldo_atual') + total)
+
+    # Sem o post_save de MovimentoPDV: o valor de vendas do caixa é somado no banco
+    MovimentoPDV.objects.bulk_create([
+        MovimentoPDV(pdv=pdv, tipo='venda', valor=venda.valor_total, descricao=f'Venda {venda.numero}')
+        for venda in vendas
+    ], batch_size=TAMANHO_LOTE)
+    PDV.objects.filter(pk=pdv.pk).update(valor_vendas=F('valor_vendas') + total)
+
+
+def finalizar_venda_pdv(pdv, itens, usuario, cliente=None, forma_pagamento='dinheiro', desconto=0):
+    """
+    Registra uma venda finalizada no caixa `pdv`
+
+    `itens` é uma lista de {'produto_id', 'quantidade', 'preco'}. Levanta
+    Produto.DoesNotExist para produtos inexistentes ou inativos,
+    ValueError se o desconto passar do valor dos produtos (ou
+    ContaCaixaIndefinida, se o caixa não tiver conta bancária) e
+    EstoqueInsuficiente se faltar saldo. Retorna a Venda.
+    """
+    # Reservado antes da transação: um rollback deixa buraco na numeração
+    numero = proximo_numero(Venda, 'VD')
+    with transaction.atomic():
+        produtos = Produto.objects.filter(active=True).in_bulk({item['produto_id'] for item in itens})
+        linhas = _linhas(itens, produtos)
+        caixa = conta_caixa(pdv)
+        venda = _registrar_venda(
+            pdv, linhas, usuario, cliente or consumidor_final(), forma_pagamento, desconto,
+            categoria_vendas(), caixa, numero
+        )
+        _lancar_caixa(pdv, caixa, [venda])
+
+    return venda
+
+
+def sincronizar_vendas_pdv(pdv, vendas, usuario):
+    """
+    Registra um lote de vendas feitas offline no caixa `pdv`
+
+    Cada venda é um dict com 'uuid' (gerado pelo terminal), 'itens' e,
+    opcionalmente, 'cliente_id', 'forma_pagamento', 'desconto' e
+    'data_venda'. Reenviar um lote é seguro: uuids já gravados voltam como
+    'duplicada' sem gravar nada. Cada venda roda em um savepoint, então uma
+    venda sem saldo ('conflito') ou inválida ('rejeitada') não desfaz as
+    outras. Retorna um resultado por venda, na ordem recebida; sem conta
+    bancária para o caixa, o lote todo é recusado com ContaCaixaIndefinida.
+    """
+    existentes = {
+        uuid_pdv: (pk, numero)
+        for uuid_pdv, pk, numero in Venda.objects.filter(
+            uuid_pdv__in=[dados['uuid'] for dados in vendas]
+        ).values_list('uuid_pdv', 'pk', 'numero')
+    }
+    # Um bloco de números para as vendas novas, reservado antes da transação;
+    # as que forem recusadas deixam buraco na numeração
+    numeros = iter(proximos_numeros(Venda, 'VD', len({dados['uuid'] for dados in vendas} - existentes.keys())))
+
+    with transaction.atomic():
+        produtos = Produto.objects.filter(active=True).in_bulk(
+            {item['produto_id'] for dados in vendas for item in dados['itens']}
+        )
+        clientes = Cliente.objects.in_bulk({dados['cliente_id'] for dados in vendas if dados.get('cliente_id')})
+        categoria = categoria_vendas()
+        caixa = conta_caixa(pdv)
+        consumidor = None
+
+        registradas = []
+        resultados = []
+        for dados in vendas:
+            uuid_pdv = dados['uuid']
+            resultado = {'uuid': str(uuid_pdv)}
+            resultados.append(resultado)
+            if uuid_pdv in existentes:
+                pk, numero = existentes[uuid_pdv]
+                resultado.update(status='duplicada', venda_id=pk, numero=numero)
+                continue
+
+            cliente_id = dados.get('cliente_id')
+            if cliente_id:
+                cliente = clientes.get(cliente_id)
+            else:
+                cliente = consumidor = consumidor or consumidor_final()
+            try:
+                if cliente is None:
+                    raise Cliente.DoesNotExist(f'Cliente {cliente_id} não encontrado')
+                # Savepoint: desfaz só esta venda
+                with transaction.atomic():
+                    venda = _registrar_venda(
+                        pdv, _linhas(dados['itens'], produtos), usuario, cliente,
+                        dados.get('forma_pagamento') or 'dinheiro', dados.get('desconto', 0),
+                        categoria, caixa, next(numeros), data_venda=dados.get('data_venda'), uuid_pdv=uuid_pdv
+                    )
+            except EstoqueInsuficiente as e:
+                resultado.update(status='conflito', error=str(e), produto=e.produto_id, disponivel=e.disponivel)
+                continue
+            except IntegrityError as e:
+                # O mesmo uuid gravado por outro envio concorrente; outra restrição recusa só esta venda
+                gravada = Venda.objects.filter(uuid_pdv=uuid_pdv).values_list('pk', 'numero').first()
+                if gravada is None:
+                    resultado.update(status='rejeitada', error=str(e))
+                else:
+                    resultado.update(status='duplicada', venda_id=gravada[0], numero=gravada[1])
+                continue
+            except (Produto.DoesNotExist, Cliente.DoesNotExist, ValueError) as e:
+                resultado.update(status='rejeitada', error=str(e))
+                continue
+
+            existentes[uuid_pdv] = (venda.pk, venda.numero)
+            registradas.append(venda)
+            resultado.update(status='registrada', venda_id=venda.pk, numero=venda.numero, valor_total=venda.valor_total)
+
+        _lancar_caixa(pdv, caixa, registradas)
+
+    return resultados
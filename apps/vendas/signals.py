@@ -2,53 +2,120 @@
 Signals for automatic sales updates
 """
 
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
 from django.dispatch import receiver
 from .models import ItemVenda, Venda, MovimentoPDV
+from .catalogo import registrar_alteracao
+from apps.core.utils import get_schema_name
+from apps.erp.models import Categoria, Produto
 from apps.estoque.models import MovimentacaoEstoque
+from apps.estoque.services import lancar_movimentacoes
+from apps.estoque.signals import movimentacoes_lancadas
+from apps.relatorios.snapshots import invalidar_dre
+
+CENTAVOS = Decimal('0.01')
 
 
 @receiver(post_save, sender=ItemVenda)
 @receiver(post_delete, sender=ItemVenda)
-def atualizar_valor_venda(sender, instance, **kwargs):
+def atualizar_valor_venda(sender, instance, created=None, origin=None, **kwargs):
     """
-    Atualiza o valor total da venda quando itens são adicionados/removidos
+    Soma à venda só a diferença do item adicionado/alterado/removido
+
+    Um UPDATE relativo (F()), sem reler os itens nem passar pelo save() da
+    venda, que dispararia de novo os sinais de Venda.
     """
-    venda = instance.venda
-    
-    # Recalcula valor dos produtos
-    venda.valor_produtos = sum(item.preco_total for item in venda.itens.all())
-    venda.save()
+    if isinstance(origin, Venda):
+        # Itens apagados em cascata com a própria venda
+        return
+
+    removido = created is None
+    anterior = Decimal('0') if created else instance._preco_total_salvo
+    instance._preco_total_salvo = None if removido else Decimal(instance.preco_total).quantize(CENTAVOS)
+    vendas = Venda.objects.filter(pk=instance.venda_id)
+
+    if anterior is None:
+        # Total gravado desconhecido (item não lido do banco): soma os itens no banco
+        soma = Coalesce(
+            Subquery(
+                ItemVenda.objects.filter(venda_id=OuterRef('pk')).order_by().values('venda_id').annotate(
+                    soma=Sum('preco_total')
+                ).values('soma')
+            ),
+            Value(Decimal('0')),
+            output_field=DecimalField()
+        )
+        vendas.update(
+            valor_produtos=soma,
+            valor_total=soma - F('valor_desconto') + F('valor_acrescimo'),
+            updated_at=timezone.now()
+        )
+        if ItemVenda.venda.is_cached(instance):
+            instance.venda.refresh_from_db(fields=['valor_produtos', 'valor_total', 'updated_at'])
+    else:
+        delta = -anterior if removido else instance._preco_total_salvo - anterior
+        if not delta:
+            return
+        vendas.update(
+            valor_produtos=F('valor_produtos') + delta,
+            valor_total=F('valor_total') + delta,
+            updated_at=timezone.now()
+        )
+        if ItemVenda.venda.is_cached(instance):
+            # Mantém em dia a venda já carregada
+            instance.venda.valor_produtos += delta
+            instance.venda.valor_total += delta
+
+    # O UPDATE não passa pelo post_save de Venda
+    invalidar_dre(instance.venda.data_venda)
 
 
 @receiver(post_save, sender=Venda)
-def criar_movimentacao_estoque_venda(sender, instance, created, **kwargs):
+def criar_movimentacao_estoque_venda(sender, instance, created, update_fields=None, **kwargs):
     """
     Cria movimentação de saída no estoque quando venda é faturada
     """
     # Só cria movimentação se a venda foi faturada
-    if instance.status == 'faturado' and not created:
-        # Verifica se já existe movimentação para esta venda
-        for item in instance.itens.all():
-            # Verifica se já criou movimentação para este item
-            existe = MovimentacaoEstoque.objects.filter(
-                produto=item.produto,
-                documento='venda',
-                documento_numero=instance.numero
-            ).exists()
-            
-            if not existe:
-                # Cria movimentação de saída
-                MovimentacaoEstoque.objects.create(
-                    produto=item.produto,
-                    tipo='saida',
-                    quantidade=item.quantidade,
-                    valor_unitario=item.preco_unitario,
-                    documento='venda',
-                    documento_numero=instance.numero,
-                    motivo=f'Venda {instance.numero}',
-                    usuario=instance.vendedor
-                )
+    if created or instance.status != 'faturado':
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+
+    # Produtos já baixados para esta venda, em uma consulta
+    lancados = set(MovimentacaoEstoque.objects.filter(
+        documento='venda',
+        documento_numero=instance.numero
+    ).values_list('produto_id', flat=True))
+
+    lancar_movimentacoes([
+        MovimentacaoEstoque(
+            produto=item.produto,
+            tipo='saida',
+            quantidade=item.quantidade,
+            usuario=instance.vendedor,
+            valor_unitario=item.preco_unitario,
+            documento='venda',
+            documento_numero=instance.numero,
+            motivo=f'Venda {instance.numero}'
+        )
+        for item in instance.itens.select_related('produto').filter(produto__isnull=False)
+        if item.produto_id not in lancados
+    ])
+
+
+@receiver(post_save, sender=Venda)
+@receiver(post_delete, sender=Venda)
+def invalidar_dre_venda(sender, instance, **kwargs):
+    """
+    Invalida o snapshot do DRE do mês da venda
+    """
+    invalidar_dre(instance.data_venda)
 
 
 @receiver(post_save, sender=MovimentoPDV)
@@ -69,3 +136,44 @@ def atualizar_valores_pdv(sender, instance, created, **kwargs):
         pdv.valor_suprimentos += instance.valor
     
     pdv.save(update_fields=['valor_vendas', 'valor_sangrias', 'valor_suprimentos'])
+
+
+def _publicar_alteracao(produto_ids):
+    """Nova versão do catálogo do PDV após o commit (antes dele, outro processo leria o dado antigo)"""
+    schema_name = get_schema_name()
+    transaction.on_commit(lambda: registrar_alteracao(produto_ids, schema_name))
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+def atualizar_catalogo_produto(sender, instance, **kwargs):
+    """
+    Produto alterado: catálogo do PDV desatualizado
+    """
+    _publicar_alteracao([instance.pk])
+
+
+@receiver(post_save, sender=Categoria)
+def atualizar_catalogo_categoria(sender, instance, created, **kwargs):
+    """
+    O catálogo guarda o nome da categoria de cada produto
+    """
+    if not created:
+        _publicar_alteracao(list(instance.produtos.values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=MovimentacaoEstoque)
+def atualizar_catalogo_movimentacao(sender, instance, created, **kwargs):
+    """
+    O estoque do produto mudou (o saldo é gravado com UPDATE, sem post_save de Produto)
+    """
+    if created:
+        _publicar_alteracao([instance.produto_id])
+
+
+@receiver(movimentacoes_lancadas)
+def atualizar_catalogo_movimentacoes(sender, movimentacoes, **kwargs):
+    """
+    Lançamentos em lote: uma versão para todos os produtos
+    """
+    _publicar_alteracao({movimentacao.produto_id for movimentacao in movimentacoes})
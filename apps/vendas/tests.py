@@ -2,10 +2,27 @@
 Tests for Vendas app
 """
 
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from apps.erp.models import Produto, Cliente
+from django.utils import timezone
+from rest_framework.test import APIClient
+from apps.core.sequencias import proximos_numeros
+from apps.erp.models import Categoria, Produto, Cliente
+from apps.erp.serializers import ProdutoSerializer
+from apps.estoque.models import CustoProduto, MovimentacaoEstoque
+from apps.estoque.services import EstoqueInsuficiente, registrar_movimentacao
+from apps.financeiro.models import ContaBancaria, ContaReceber, FluxoCaixa
 from .models import Venda, ItemVenda, FormaPagamento, PDV, MovimentoPDV
+from . import catalogo
+from .services import ContaCaixaIndefinida, finalizar_venda_pdv, sincronizar_vendas_pdv
 
 User = get_user_model()
 
@@ -124,3 +141,518 @@ class PDVTest(TestCase):
         self.assertEqual(pdv.valor_vendas, 50.00)
         self.assertEqual(pdv.valor_sangrias, 30.00)
         self.assertEqual(pdv.saldo_calculado, 120.00)  # 100 + 50 - 30
+
+
+class StreamingExportTest(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        
+        self.user = User.objects.create_user(username='test', password='test123')
+        self.cliente = Cliente.objects.create(
+            nome_razao_social='Cliente Teste',
+            cpf_cnpj='12345678901',
+            telefone_principal='11999999999'
+        )
+        self.produto = Produto.objects.create(
+            nome='Produto Teste',
+            codigo_interno='TEST001',
+            preco_venda=100.00,
+            estoque_atual=10
+        )
+        for quantidade in (1, 2, 3):
+            venda = Venda.objects.create(cliente=self.cliente, vendedor=self.user)
+            ItemVenda.objects.create(venda=venda, produto=self.produto, quantidade=quantidade, preco_unitario=100)
+        Venda.objects.filter(itens__quantidade=3).update(status='aprovado')
+        
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def conteudo(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+    
+    def test_export_csv(self):
+        """Test CSV export with list filters"""
+        linhas = self.conteudo(self.client.get('/api/vendas/vendas/export/', {'status': 'orcamento'})).splitlines()
+        
+        self.assertIn('numero', linhas[0].split(','))
+        self.assertEqual(len(linhas), 3)
+    
+    def test_export_ndjson(self):
+        """Test NDJSON export with ordering"""
+        import json
+        
+        conteudo = self.conteudo(self.client.get(
+            '/api/vendas/itens-venda/export/', {'formato': 'ndjson', 'ordering': '-quantidade'}
+        ))
+        itens = [json.loads(linha) for linha in conteudo.splitlines()]
+        
+        self.assertEqual([item['quantidade'] for item in itens], ['3.000', '2.000', '1.000'])
+        self.assertEqual(itens[0]['produto_id'], self.produto.pk)
+    
+    def test_export_formato_invalido(self):
+        """Test invalid export format"""
+        response = self.client.get('/api/vendas/vendas/export/', {'formato': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FinalizarVendaPDVTest(TestCase):
+    """Checkout do PDV em lote: totais, estoque, financeiro e consultas fixas"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='caixa', password='test123')
+        self.pdv = PDV.objects.create(numero_caixa=1, operador=self.user, valor_inicial=100, status='aberto')
+        ContaBancaria.objects.create(banco='Banco', agencia='1', conta='1', saldo_atual=0)
+        self.caixa = ContaBancaria.objects.create(banco='Loja', agencia='0', conta='0', tipo_conta='Caixa', saldo_atual=50)
+        self.produtos = [
+            Produto.objects.create(
+                nome=f'Produto {i}', codigo_interno=f'PDV{i:03d}', preco_venda=10, estoque_atual=100
+            )
+            for i in range(30)
+        ]
+
+    def cesta(self, tamanho, quantidade=1):
+        return [
+            {'produto_id': produto.pk, 'quantidade': quantidade, 'preco': Decimal('10.00')}
+            for produto in self.produtos[:tamanho]
+        ]
+
+    def test_venda_completa(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(f'/api/vendas/pdv/{self.pdv.pk}/finalizar_venda/', {
+            'itens': [
+                {'produto_id': self.produtos[0].pk, 'quantidade': 2, 'preco': '30.00'},
+                {'produto_id': self.produtos[1].pk, 'quantidade': '1.5', 'preco': '10.00'},
+            ],
+            'desconto': '5.00',
+            'valor_recebido': 100
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['valor_total'], Decimal('70.00'))
+        self.assertEqual(response.data['troco'], Decimal('30.00'))
+        self.assertEqual(len(response.data['venda']['itens']), 2)
+
+        venda = Venda.objects.get(pk=response.data['venda_id'])
+        self.assertEqual(venda.status, 'finalizada')
+        self.assertEqual(venda.valor_produtos, Decimal('75.00'))
+        self.assertEqual(venda.cliente.nome_razao_social, 'Consumidor Final')
+        self.assertEqual(sorted(venda.itens.values_list('preco_total', flat=True)), [Decimal('15.00'), Decimal('60.00')])
+
+        self.produtos[0].refresh_from_db()
+        self.assertEqual(self.produtos[0].estoque_atual, 98)
+        self.assertEqual(MovimentacaoEstoque.objects.filter(documento='venda', documento_numero=venda.numero).count(), 2)
+
+        conta = ContaReceber.objects.get(numero_documento=venda.numero)
+        self.assertEqual((conta.status, conta.valor_recebido, conta.conta_bancaria), ('recebido', Decimal('70.00'), self.caixa))
+        self.assertEqual(FluxoCaixa.objects.get(conta_receber=conta).valor, Decimal('70.00'))
+        self.caixa.refresh_from_db()
+        self.assertEqual(self.caixa.saldo_atual, Decimal('120.00'))
+        self.pdv.refresh_from_db()
+        self.assertEqual(self.pdv.valor_vendas, Decimal('70.00'))
+        self.assertEqual(self.pdv.movimentos.get().valor, Decimal('70.00'))
+
+    def test_consultas_fixas_por_cesta(self):
+        # Primeira venda cria consumidor final e categoria
+        finalizar_venda_pdv(self.pdv, self.cesta(1), self.user)
+
+        contagens = {}
+        for tamanho in (1, 5, 30):
+            with CaptureQueriesContext(connection) as consultas:
+                finalizar_venda_pdv(self.pdv, self.cesta(tamanho), self.user)
+            contagens[tamanho] = len(consultas)
+        self.assertEqual(contagens[1], contagens[5])
+        self.assertEqual(contagens[1], contagens[30])
+
+    def test_estoque_insuficiente_nao_grava_nada(self):
+        cesta = self.cesta(3)
+        cesta[2]['quantidade'] = 101
+
+        with self.assertRaises(EstoqueInsuficiente):
+            finalizar_venda_pdv(self.pdv, cesta, self.user)
+
+        self.assertFalse(Venda.objects.exists())
+        self.assertFalse(ContaReceber.objects.exists())
+        self.assertEqual(Produto.objects.filter(estoque_atual=100).count(), 30)
+        self.pdv.refresh_from_db()
+        self.assertEqual(self.pdv.valor_vendas, 0)
+
+    def test_api_erros(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = f'/api/vendas/pdv/{self.pdv.pk}/finalizar_venda/'
+
+        response = client.post(url, {'itens': []}, format='json')
+        self.assertEqual(response.data['error'], 'Venda sem itens')
+
+        response = client.post(url, {'itens': [{'produto_id': 999999, 'quantidade': 1, 'preco': 1}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = client.post(url, {'itens': self.cesta(1, quantidade=500)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['produto'], self.produtos[0].pk)
+
+    def test_conta_do_caixa(self):
+        # Duas contas do tipo Caixa e nenhuma no PDV: recusa em vez de escolher uma
+        outro = ContaBancaria.objects.create(banco='Loja', agencia='0', conta='1', tipo_conta='Caixa')
+        with self.assertRaises(ContaCaixaIndefinida):
+            finalizar_venda_pdv(self.pdv, self.cesta(1), self.user)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(f'/api/vendas/pdv/{self.pdv.pk}/finalizar_venda/', {
+            'itens': self.cesta(1), 'valor_recebido': 10
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('caixa 1', response.data['error'])
+        self.assertFalse(Venda.objects.exists())
+
+        # A conta do PDV vale mesmo que não seja do tipo Caixa
+        banco = ContaBancaria.objects.get(tipo_conta='Conta Corrente')
+        PDV.objects.filter(pk=self.pdv.pk).update(conta_bancaria=banco)
+        self.pdv.refresh_from_db()
+        venda = finalizar_venda_pdv(self.pdv, self.cesta(1), self.user)
+        self.assertEqual(ContaReceber.objects.get(numero_documento=venda.numero).conta_bancaria, banco)
+        self.assertEqual(ContaBancaria.objects.get(pk=outro.pk).saldo_atual, 0)
+
+    def test_conta_do_caixa_pelo_nome(self):
+        # Tenant anterior à conta no PDV: nenhuma conta do tipo Caixa, só o nome
+        ContaBancaria.objects.filter(pk=self.caixa.pk).update(tipo_conta='Conta Corrente')
+        pelo_nome = ContaBancaria.objects.create(banco='Caixa da Loja', agencia='0', conta='2')
+
+        venda = finalizar_venda_pdv(self.pdv, self.cesta(1), self.user)
+
+        self.assertIsNone(self.pdv.conta_bancaria_id)
+        self.assertEqual(ContaReceber.objects.get(numero_documento=venda.numero).conta_bancaria, pelo_nome)
+        self.assertEqual(ContaBancaria.objects.get(pk=pelo_nome.pk).saldo_atual, Decimal('10.00'))
+
+
+class CatalogoPDVTest(TestCase):
+    """Leitura de código no PDV pelo catálogo em memória"""
+
+    def setUp(self):
+        cache.clear()
+        catalogo.limpar()
+        self.user = User.objects.create_user(username='caixa', password='test123')
+        self.produto = Produto.objects.create(
+            nome='Cabo USB', codigo_interno='CABO01', codigo_barras='7891000000011',
+            preco_venda=Decimal('19.90'), estoque_atual=10
+        )
+        # Código interno igual ao código de barras de outro produto
+        self.outro = Produto.objects.create(
+            nome='Carregador', codigo_interno='7891000000028', codigo_barras='7891000000035', preco_venda=50
+        )
+        self.barras_outro = Produto.objects.create(
+            nome='Fone', codigo_interno='FONE01', codigo_barras='7891000000028', preco_venda=30
+        )
+        catalogo.aquecer()
+
+    def test_leitura_sem_consulta(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogo.buscar('7891000000011').id, self.produto.pk)
+            self.assertEqual(catalogo.buscar('CABO01').id, self.produto.pk)
+            # Código de barras tem prioridade
+            self.assertEqual(catalogo.buscar('7891000000028').id, self.barras_outro.pk)
+
+    def test_alteracoes_relidas_por_versao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto.preco_venda = Decimal('24.90')
+            self.produto.codigo_barras = '7891000000042'
+            self.produto.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimentacao(self.produto, 'saida', 3, self.user)
+
+        with self.assertNumQueries(1):
+            produto = catalogo.buscar('7891000000042')
+        self.assertEqual((produto.preco_venda, produto.estoque_atual), (Decimal('24.90'), Decimal('7')))
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(catalogo.buscar('7891000000011'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outro.active = False
+            self.outro.save()
+        self.assertIsNone(catalogo.buscar('7891000000035'))
+
+    def test_lista_expirada_recarrega_tudo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Produto.objects.create(nome='Capa', codigo_interno='CAPA01', preco_venda=15)
+        # Lista de ids da versão já expirada: recarrega o catálogo inteiro
+        cache.delete(catalogo._chave_alteracoes(catalogo._schema(), catalogo.versao_atual()))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(catalogo.buscar('CAPA01').nome, 'Capa')
+        self.assertEqual(catalogo.buscar('CABO01').id, self.produto.pk)
+
+    def test_produto_ainda_sem_versao(self):
+        # Sem o commit, a versão não mudou: cai na consulta ao banco
+        Produto.objects.create(nome='Película', codigo_interno='PEL01', preco_venda=10)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(catalogo.buscar('PEL01').nome, 'Película')
+        with self.assertNumQueries(0):
+            catalogo.buscar('PEL01')
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.get('/api/vendas/pdv/buscar_produto/', {'codigo': '7891000000011'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.produto.pk)
+        self.assertEqual(response.data['preco_venda'], '19.90')
+
+        response = client.get('/api/vendas/pdv/buscar_produto/', {'codigo': 'NAOEXISTE'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_mesma_resposta_do_produto_serializer(self):
+        categoria = Categoria.objects.create(nome='Acessórios')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produto.categoria = categoria
+            self.produto.save()
+        CustoProduto.objects.create(produto=self.produto, custo_unitario=Decimal('8.5'))
+        catalogo.aquecer()
+
+        esperado = ProdutoSerializer(Produto.objects.select_related('categoria', 'custo').get(pk=self.produto.pk)).data
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogo.buscar('CABO01').como_dict(), esperado)
+        self.assertEqual(esperado['valor_estoque'], Decimal('85'))
+        self.assertEqual(
+            catalogo.buscar('FONE01').como_dict(),
+            ProdutoSerializer(Produto.objects.get(pk=self.barras_outro.pk)).data
+        )
+
+        # Categoria renomeada: os produtos dela são relidos
+        with self.captureOnCommitCallbacks(execute=True):
+            categoria.nome = 'Cabos'
+            categoria.save()
+        self.assertEqual(catalogo.buscar('CABO01').como_dict()['categoria_nome'], 'Cabos')
+
+
+class SincronizacaoPDVTest(TestCase):
+    """Delta de produtos e envio em lote das vendas feitas offline"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='caixa', password='test123')
+        self.pdv = PDV.objects.create(numero_caixa=2, operador=self.user, status='aberto')
+        self.caixa = ContaBancaria.objects.create(banco='Loja', agencia='0', conta='0', tipo_conta='Caixa', saldo_atual=0)
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {i}', codigo_interno=f'OFF{i}', preco_venda=10, estoque_atual=5)
+            for i in range(4)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_delta_produtos(self):
+        response = self.client.get('/api/vendas/pdv/sincronizar_produtos/')
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNone(response.data['next'])
+        self.assertIn('marca_dagua', response.data)
+
+        ontem = timezone.now() - timedelta(days=1)
+        Produto.objects.update(updated_at=ontem)
+        marca = (ontem + timedelta(hours=1)).isoformat()
+
+        self.produtos[0].preco_venda = Decimal('12.50')
+        self.produtos[0].save()
+        registrar_movimentacao(self.produtos[1], 'saida', 2, self.user)
+        self.produtos[2].active = False
+        self.produtos[2].save()
+
+        response = self.client.get('/api/vendas/pdv/sincronizar_produtos/', {'desde': marca, 'limite': 2})
+        self.assertEqual(
+            [(p['id'], p['preco_venda'], p['estoque_atual'], p['active']) for p in response.data['results']],
+            [(self.produtos[0].pk, '12.50', '5.000', True), (self.produtos[1].pk, '10.00', '3.000', True)]
+        )
+        response = self.client.get(response.data['next'])
+        self.assertEqual([(p['id'], p['active']) for p in response.data['results']], [(self.produtos[2].pk, False)])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get('/api/vendas/pdv/sincronizar_produtos/', {'desde': 'ontem'})
+        self.assertEqual(response.status_code, 400)
+
+    def venda(self, *itens, **campos):
+        return {
+            'uuid': str(uuid.uuid4()),
+            'itens': [
+                {'produto_id': produto.pk, 'quantidade': quantidade, 'preco': '10.00'}
+                for produto, quantidade in itens
+            ],
+            **campos
+        }
+
+    def test_lote_com_conflito_e_reenvio(self):
+        ontem = timezone.now() - timedelta(days=1)
+        vendas = [
+            self.venda((self.produtos[0], 2), (self.produtos[1], 1), data_venda=ontem.isoformat()),
+            self.venda((self.produtos[0], 4)),
+            self.venda((self.produtos[0], 1), cliente_id=999999),
+            self.venda((self.produtos[0], 3), desconto='5.00'),
+        ]
+        url = f'/api/vendas/pdv/{self.pdv.pk}/sincronizar_vendas/'
+
+        response = self.client.post(url, {'vendas': vendas}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['registradas'], response.data['conflitos'], response.data['rejeitadas']), (2, 1, 1)
+        )
+        resultados = response.data['resultados']
+        self.assertEqual([r['status'] for r in resultados], ['registrada', 'conflito', 'rejeitada', 'registrada'])
+        self.assertEqual(resultados[1]['produto'], self.produtos[0].pk)
+
+        self.produtos[0].refresh_from_db()
+        self.assertEqual(self.produtos[0].estoque_atual, 0)
+        primeira = Venda.objects.get(uuid_pdv=vendas[0]['uuid'])
+        self.assertEqual((primeira.status, primeira.valor_total), ('finalizada', Decimal('30.00')))
+        self.assertEqual(timezone.localdate(primeira.data_venda), timezone.localdate(ontem))
+        self.assertEqual(ContaReceber.objects.get(numero_documento=primeira.numero).data_recebimento, timezone.localdate(ontem))
+        # Um bloco para as quatro vendas novas; a do conflito deixa buraco
+        self.assertEqual(
+            [r['numero'] for r in resultados if r['status'] == 'registrada'], ['VD000001', 'VD000003']
+        )
+        self.pdv.refresh_from_db()
+        self.assertEqual(self.pdv.valor_vendas, Decimal('55.00'))
+        self.assertEqual(self.pdv.movimentos.count(), 2)
+        self.caixa.refresh_from_db()
+        self.assertEqual(self.caixa.saldo_atual, Decimal('55.00'))
+
+        # Reenvio do mesmo lote (ex.: resposta perdida): nada é gravado de novo
+        response = self.client.post(url, {'vendas': vendas}, format='json')
+        self.assertEqual([r['status'] for r in response.data['resultados']], ['duplicada', 'conflito', 'rejeitada', 'duplicada'])
+        self.assertEqual(response.data['resultados'][0]['numero'], primeira.numero)
+        self.assertEqual(Venda.objects.count(), 2)
+        self.pdv.refresh_from_db()
+        self.assertEqual(self.pdv.valor_vendas, Decimal('55.00'))
+
+    def test_outra_restricao_rejeita_so_a_venda(self):
+        Venda.objects.bulk_create([Venda(numero='VD000900', vendedor=self.user)])
+        vendas = [self.venda((self.produtos[0], 1)), self.venda((self.produtos[1], 1))]
+
+        # Número já usado: IntegrityError que não é de uuid repetido
+        with mock.patch('apps.vendas.services.proximos_numeros', return_value=['VD000900', 'VD000901']):
+            resultados = sincronizar_vendas_pdv(self.pdv, vendas, self.user)
+
+        self.assertEqual([r['status'] for r in resultados], ['rejeitada', 'registrada'])
+        self.assertIn('error', resultados[0])
+        self.assertFalse(Venda.objects.filter(uuid_pdv=vendas[0]['uuid']).exists())
+        self.assertEqual(Venda.objects.get(uuid_pdv=vendas[1]['uuid']).numero, 'VD000901')
+
+    def test_uuid_repetido_no_lote(self):
+        identificador = uuid.uuid4()
+        venda = {'uuid': identificador, 'itens': [{'produto_id': self.produtos[3].pk, 'quantidade': 1, 'preco': 10}]}
+
+        with mock.patch('apps.vendas.services.proximos_numeros', wraps=proximos_numeros) as reservar:
+            resultados = sincronizar_vendas_pdv(self.pdv, [venda, dict(venda)], self.user)
+        reservar.assert_called_once_with(Venda, 'VD', 1)
+
+        self.assertEqual([r['status'] for r in resultados], ['registrada', 'duplicada'])
+        self.assertEqual(resultados[0]['venda_id'], resultados[1]['venda_id'])
+        self.assertEqual(Venda.objects.filter(uuid_pdv=identificador).count(), 1)
+
+    def test_caixa_fechado(self):
+        self.pdv.status = 'fechado'
+        self.pdv.save()
+        response = self.client.post(
+            f'/api/vendas/pdv/{self.pdv.pk}/sincronizar_vendas/',
+            {'vendas': [self.venda((self.produtos[0], 1))]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TotaisVendaTest(TestCase):
+    """Totais da venda mantidos pela diferença de cada item"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='vendedor', password='test123')
+        self.cliente = Cliente.objects.create(
+            nome_razao_social='Cliente Teste', cpf_cnpj='12345678901', telefone_principal='11999999999'
+        )
+        self.produto = Produto.objects.create(nome='Produto', codigo_interno='TOT001', preco_venda=10, estoque_atual=1000)
+        self.venda = Venda.objects.create(cliente=self.cliente, vendedor=self.user, valor_desconto=5)
+
+    def adicionar(self, quantidade, preco='10.00'):
+        return ItemVenda.objects.create(
+            venda=self.venda, produto=self.produto, quantidade=Decimal(str(quantidade)), preco_unitario=Decimal(preco)
+        )
+
+    def assertTotais(self, produtos):
+        self.venda.refresh_from_db()
+        self.assertEqual(self.venda.valor_produtos, Decimal(produtos))
+        self.assertEqual(self.venda.valor_total, Decimal(produtos) - 5)
+
+    def test_consultas_por_item_nao_crescem(self):
+        with CaptureQueriesContext(connection) as primeiro:
+            self.adicionar(1)
+        for _ in range(40):
+            self.adicionar(1)
+        with CaptureQueriesContext(connection) as ultimo:
+            self.adicionar(1)
+
+        self.assertEqual(len(primeiro), len(ultimo))
+        self.assertTotais('420.00')
+        self.assertEqual(self.venda.valor_total, Decimal('415.00'))
+
+    def test_alterar_e_remover(self):
+        self.adicionar(2)
+        item = self.adicionar('1.5', '10.33')
+        self.assertTotais('35.50')
+
+        item = ItemVenda.objects.get(pk=item.pk)
+        item.quantidade = 3
+        item.save()
+        self.assertTotais('50.99')
+
+        item.delete()
+        self.assertTotais('20.00')
+
+    def test_total_gravado_desconhecido(self):
+        item = self.adicionar(2)
+        item = ItemVenda.objects.only('id', 'venda', 'quantidade', 'preco_unitario', 'desconto', 'acrescimo').get(pk=item.pk)
+        item.quantidade = 4
+        item.save()
+        self.assertTotais('40.00')
+
+    def test_faturar_pela_edicao_sem_estoque(self):
+        """PATCH status='faturado' sem saldo: 400 e nada gravado"""
+        self.adicionar(2000)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        response = client.patch(f'/api/vendas/vendas/{self.venda.pk}/', {'status': 'faturado'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Estoque insuficiente', response.data['error'])
+        self.assertEqual(str(response.data['produto']), str(self.produto.pk))
+        self.venda.refresh_from_db()
+        self.assertEqual(self.venda.status, 'orcamento')
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_faturar_pelo_admin_sem_estoque(self):
+        from .admin import VendaAdminForm
+
+        self.adicionar(2000)
+        dados = {
+            'tipo': self.venda.tipo, 'cliente': self.cliente.pk, 'status': 'faturado',
+            'valor_desconto': 5, 'valor_acrescimo': 0, 'vendedor': self.user.pk, 'active': True
+        }
+        form = VendaAdminForm(dados, instance=self.venda)
+        self.assertFalse(form.is_valid())
+        self.assertIn('Estoque insuficiente', str(form.errors))
+
+    def test_item_nao_dispara_sinais_da_venda(self):
+        self.adicionar(2)
+        self.venda.refresh_from_db()
+        self.venda.status = 'faturado'
+        self.venda.save()
+        self.assertEqual(MovimentacaoEstoque.objects.filter(documento_numero=self.venda.numero).count(), 1)
+
+        # Item lançado depois do faturamento não passa pelo save() da venda
+        self.adicionar(1)
+        self.venda.save(update_fields=['observacoes'])
+        self.venda.save()
+        self.assertEqual(MovimentacaoEstoque.objects.filter(documento_numero=self.venda.numero).count(), 1)
+
+        self.venda.delete()
+        self.assertFalse(ItemVenda.objects.exists())
@@ -4,30 +4,39 @@ Views for Vendas models
 
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.mixins import StreamingExportMixin
+from apps.core.pagination import KeysetPagination
+from datetime import timedelta
+
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 
 from .models import Venda, ItemVenda, RecebimentoVenda, PDV, MovimentoPDV
 from .serializers import (
     VendaSerializer, VendaListSerializer, ItemVendaSerializer,
     RecebimentoVendaSerializer, PDVSerializer, PDVListSerializer,
-    MovimentoPDVSerializer
+    MovimentoPDVSerializer, FinalizarVendaPDVSerializer,
+    SincronizarVendasPDVSerializer, ProdutoPDVSyncSerializer
 )
 from apps.erp.models import Produto, Cliente
-from apps.erp.serializers import ProdutoSerializer
-from apps.financeiro.models import ContaReceber, ContaBancaria, FluxoCaixa, CategoriaFinanceira, CategoriaDRE
-from apps.estoque.models import MovimentacaoEstoque
+from apps.financeiro.models import CategoriaDRE
+from apps.estoque.services import EstoqueInsuficiente
+from . import catalogo
+from .services import ContaCaixaIndefinida, finalizar_venda_pdv, sincronizar_vendas_pdv
 
 
-class VendaViewSet(viewsets.ModelViewSet):
+class VendaViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     """
     ViewSet for Venda
     """
-    queryset = Venda.objects.select_related('cliente', 'vendedor').prefetch_related('itens', 'pagamentos').all()
+    queryset = Venda.objects.select_related('cliente', 'vendedor').prefetch_related('itens', 'recebimentos__forma_recebimento').all()
     permission_classes = [AllowAny]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['numero', 'cliente__nome_razao_social', 'observacoes']
@@ -39,6 +48,18 @@ class VendaViewSet(viewsets.ModelViewSet):
             return VendaListSerializer
         return VendaSerializer
     
+    def perform_update(self, serializer):
+        """
+        Faturar pela edição (status='faturado') também baixa o estoque (signal)
+        
+        Sem saldo, nada é gravado e a resposta é 400, como em `faturar`.
+        """
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except EstoqueInsuficiente as e:
+            raise ValidationError({'error': str(e), 'produto': e.produto_id})
+    
     @action(detail=True, methods=['post'])
     def faturar(self, request, pk=None):
         """Invoice sale"""
@@ -56,8 +77,13 @@ class VendaViewSet(viewsets.ModelViewSet):
                     'error': f'Estoque insuficiente para {item.produto.nome}. Disponível: {item.produto.estoque_atual}'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
-        venda.status = 'faturado'
-        venda.save()
+        # A baixa de estoque (signal) confere o saldo de novo no UPDATE
+        try:
+            with transaction.atomic():
+                venda.status = 'faturado'
+                venda.save()
+        except EstoqueInsuficiente as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
             'message': 'Venda faturada com sucesso',
@@ -94,6 +120,26 @@ class VendaViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_501_NOT_IMPLEMENTED)
 
 
+class ItemVendaViewSet(StreamingExportMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for ItemVenda (read-only; items are edited through the sale)
+    """
+    queryset = ItemVenda.objects.select_related('produto').all()
+    serializer_class = ItemVendaSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
+    search_fields = ['venda__numero', 'produto__nome', 'produto__codigo_interno']
+    ordering_fields = ['id', 'quantidade', 'preco_total']
+    filterset_fields = ['venda', 'produto', 'servico', 'venda__status']
+
+
+class ProdutoSyncPagination(KeysetPagination):
+    """Delta de produtos do PDV em ordem de alteração (índice erp_produto_sync_idx)"""
+    ordering = ('updated_at', 'id')
+    page_size = 500
+    max_page_size = 2000
+
+
 class PDVViewSet(viewsets.ModelViewSet):
     """
     ViewSet for PDV
@@ -254,6 +300,8 @@ class PDVViewSet(viewsets.ModelViewSet):
     def buscar_produto(self, request):
         """
         Busca produto por código de barras ou código interno
+        
+        Resolvido no catálogo em memória do processo (ver `catalogo.py`).
         """
         codigo = request.query_params.get('codigo')
         if not codigo:
@@ -262,33 +310,22 @@ class PDVViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Tenta buscar por código de barras
-        produto = Produto.objects.filter(
-            codigo_barras=codigo, 
-            active=True,
-            tipo='produto'
-        ).first()
-        
-        # Se não encontrar, tenta por código interno
-        if not produto:
-            produto = Produto.objects.filter(
-                codigo_interno=codigo, 
-                active=True,
-                tipo='produto'
-            ).first()
-            
+        produto = catalogo.buscar(codigo)
         if not produto:
             return Response(
                 {'error': 'Produto não encontrado'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
             
-        return Response(ProdutoSerializer(produto).data)
+        return Response(produto.como_dict())
 
     @action(detail=True, methods=['post'])
     def finalizar_venda(self, request, pk=None):
         """
         Finaliza uma venda do PDV com baixa de estoque e financeiro
+        
+        Tudo em uma transação, com número fixo de consultas por cesta
+        (ver `services.finalizar_venda_pdv`).
         """
         pdv = self.get_object()
         
@@ -296,151 +333,127 @@ class PDVViewSet(viewsets.ModelViewSet):
             return Response({
                 'error': 'Caixa não está aberto'
             }, status=status.HTTP_400_BAD_REQUEST)
-            
-        dados = request.data
-        itens = dados.get('itens', [])
-        cliente_id = dados.get('cliente_id')
-        forma_pagamento = dados.get('forma_pagamento', 'dinheiro')
-        desconto = dados.get('desconto', 0)
-        valor_recebido = dados.get('valor_recebido', 0)
-        
-        if not itens:
+        
+        if not request.data.get('itens'):
             return Response(
                 {'error': 'Venda sem itens'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
+        
+        serializer = FinalizarVendaPDVSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        
+        cliente = None
+        if dados.get('cliente_id'):
+            cliente = get_object_or_404(Cliente, pk=dados['cliente_id'])
+        
         try:
-            with transaction.atomic():
-                # 1. Identificar Cliente (ou Consumidor Final)
-                if cliente_id:
-                    cliente = get_object_or_404(Cliente, pk=cliente_id)
-                else:
-                    # Busca ou cria cliente "Consumidor Final"
-                    cliente, _ = Cliente.objects.get_or_create(
-                        cpf_cnpj='00000000000',
-                        defaults={
-                            'nome_razao_social': 'Consumidor Final',
-                            'tipo': 'pf',
-                            'telefone_principal': '0000000000'
-                        }
-                    )
-                
-                # 2. Calcular totais
-                valor_produtos = sum(float(item['preco']) * float(item['quantidade']) for item in itens)
-                valor_total = float(valor_produtos) - float(desconto)
-                
-                # 3. Criar Venda
-                venda = Venda.objects.create(
-                    cliente=cliente,
-                    vendedor=request.user,
-                    status='finalizada',  # PDV já nasce finalizada
-                    data_venda=timezone.now().date(),
-                    valor_produtos=valor_produtos,
-                    desconto=desconto,
-                    valor_total=valor_total,
-                    forma_pagamento=forma_pagamento,
-                    observacoes=f"Venda PDV Caixa {pdv.numero_caixa} - {timezone.now().strftime('%d/%m/%Y %H:%M')}"
-                )
-                
-                # 4. Processar Itens e Estoque
-                for item_data in itens:
-                    produto = get_object_or_404(Produto, pk=item_data['produto_id'])
-                    quantidade = float(item_data['quantidade'])
-                    preco = float(item_data['preco'])
-                    
-                    # Criar ItemVenda
-                    ItemVenda.objects.create(
-                        venda=venda,
-                        produto=produto,
-                        quantidade=quantidade,
-                        preco_unitario=preco,
-                        subtotal=quantidade * preco
-                    )
-                    
-                    # Baixar Estoque
-                    MovimentacaoEstoque.registrar_movimentacao(
-                        produto=produto,
-                        tipo='saida',
-                        quantidade=quantidade,
-                        motivo='venda',
-                        documento=venda.numero,
-                        usuario=request.user
-                    )
-                
-                # 5. Gerar Financeiro (Conta Receber + Fluxo Caixa)
-                
-                # Categoria padrão para vendas
-                categoria_venda = CategoriaFinanceira.objects.filter(
-                    tipo='receita', 
-                    nome__icontains='Venda'
-                ).first()
-                
-                if not categoria_venda:
-                    categoria_venda = CategoriaFinanceira.objects.create(
-                        nome='Vendas de Produtos',
-                        tipo='receita'
-                    )
-                
-                # Conta Bancária Padrão (Caixa)
-                caixa = ContaBancaria.objects.filter(nome__icontains='Caixa').first()
-                if not caixa:
-                    caixa = ContaBancaria.objects.first()
-                
-                # Criar Conta a Receber (já recebida)
-                conta = ContaReceber.objects.create(
-                    cliente=cliente,
-                    categoria=categoria_venda,
-                    descricao=f"Venda PDV {venda.numero}",
-                    valor_original=valor_total,
-                    valor_recebido=valor_total,
-                    data_emissao=timezone.now().date(),
-                    data_vencimento=timezone.now().date(),
-                    data_recebimento=timezone.now().date(),
-                    status='recebido',
-                    forma_recebimento=forma_pagamento,
-                    conta_bancaria=caixa,
-                    numero_documento=venda.numero
-                )
-                
-                # Registrar Fluxo de Caixa
-                if caixa:
-                    FluxoCaixa.objects.create(
-                        data=timezone.now().date(),
-                        tipo='entrada',
-                        categoria=categoria_venda,
-                        descricao=f"Recebimento Venda PDV {venda.numero}",
-                        valor=valor_total,
-                        conta_bancaria=caixa,
-                        conta_receber=conta
-                    )
-                    
-                    # Atualizar saldo
-                    caixa.saldo_atual += valor_total
-                    caixa.save()
-                
-                # 6. Registrar Movimento no PDV
-                MovimentoPDV.objects.create(
-                    pdv=pdv,
-                    tipo='venda',
-                    valor=valor_total,
-                    descricao=f'Venda {venda.numero}'
-                )
-                
-                return Response({
-                    'message': 'Venda realizada com sucesso',
-                    'venda_id': venda.id,
-                    'numero': venda.numero,
-                    'valor_total': valor_total,
-                    'troco': float(valor_recebido) - valor_total if valor_recebido else 0,
-                    'venda': VendaSerializer(venda).data
-                }, status=status.HTTP_201_CREATED)
-                
-        except Exception as e:
-            return Response(
-                {'error': str(e)}, 
-                status=status.HTTP_400_BAD_REQUEST
+            venda = finalizar_venda_pdv(
+                pdv,
+                dados['itens'],
+                request.user,
+                cliente=cliente,
+                forma_pagamento=dados['forma_pagamento'],
+                desconto=dados['desconto']
             )
+        except EstoqueInsuficiente as e:
+            return Response({
+                'error': str(e),
+                'produto': e.produto_id
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except (Produto.DoesNotExist, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        venda = Venda.objects.select_related('cliente', 'vendedor').prefetch_related(
+            Prefetch('itens', queryset=ItemVenda.objects.select_related('produto')),
+            'recebimentos__forma_recebimento'
+        ).get(pk=venda.pk)
+        valor_recebido = dados['valor_recebido']
+        
+        return Response({
+            'message': 'Venda realizada com sucesso',
+            'venda_id': venda.id,
+            'numero': venda.numero,
+            'valor_total': venda.valor_total,
+            'troco': valor_recebido - venda.valor_total if valor_recebido else 0,
+            'venda': VendaSerializer(venda).data
+        }, status=status.HTTP_201_CREATED)
+    
+    # Recuo aplicado ao `desde` do delta: cobre transações que gravaram
+    # updated_at antes da marca d'água mas só fizeram commit depois dela
+    SINCRONIZACAO_SOBREPOSICAO = timedelta(minutes=2)
+    
+    @action(detail=False, methods=['get'])
+    def sincronizar_produtos(self, request):
+        """
+        Delta de produtos e preços para o terminal trabalhar offline
+        
+        `?desde=` é a `marca_dagua` da sincronização anterior (sem ele, o
+        catálogo inteiro). Inclui inativos, para o terminal removê-los. As
+        páginas seguem em `next`; ao chegar à última, o terminal guarda a
+        `marca_dagua` dela para a próxima vez.
+        """
+        marca_dagua = timezone.now()
+        produtos = Produto.objects.only(*ProdutoPDVSyncSerializer.Meta.fields)
+        
+        desde = request.query_params.get('desde')
+        if desde:
+            try:
+                desde = parse_datetime(desde)
+            except ValueError:
+                desde = None
+            if desde is None:
+                return Response(
+                    {'error': 'Parâmetro desde inválido'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(desde):
+                desde = timezone.make_aware(desde)
+            produtos = produtos.filter(updated_at__gte=desde - self.SINCRONIZACAO_SOBREPOSICAO)
+        else:
+            produtos = produtos.filter(active=True)
+        
+        paginator = ProdutoSyncPagination()
+        pagina = paginator.paginate_queryset(produtos, request, view=self)
+        response = paginator.get_paginated_response(ProdutoPDVSyncSerializer(pagina, many=True).data)
+        response.data['marca_dagua'] = marca_dagua
+        return response
+    
+    @action(detail=True, methods=['post'])
+    def sincronizar_vendas(self, request, pk=None):
+        """
+        Recebe o lote de vendas gravadas offline pelo terminal
+        
+        Idempotente pelo uuid de cada venda; estoque insuficiente e dados
+        inválidos voltam por venda, sem recusar o lote
+        (ver `services.sincronizar_vendas_pdv`).
+        """
+        pdv = self.get_object()
+        
+        if pdv.status != 'aberto':
+            return Response({
+                'error': 'Caixa não está aberto'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = SincronizarVendasPDVSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            resultados = sincronizar_vendas_pdv(pdv, serializer.validated_data['vendas'], request.user)
+        except ContaCaixaIndefinida as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        totais = {'registrada': 0, 'duplicada': 0, 'conflito': 0, 'rejeitada': 0}
+        for resultado in resultados:
+            totais[resultado['status']] += 1
+        return Response({
+            'registradas': totais['registrada'],
+            'duplicadas': totais['duplicada'],
+            'conflitos': totais['conflito'],
+            'rejeitadas': totais['rejeitada'],
+            'resultados': resultados
+        })
     
     @action(detail=True, methods=['get'])
     def movimentos(self, request, pk=None):
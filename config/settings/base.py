@@ -7,6 +7,7 @@ from pathlib import Path
 from datetime import timedelta
 from decouple import config
 import dj_database_url
+from celery.schedules import crontab
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -56,6 +57,7 @@ TENANT_APPS = [
     'apps.integrations',
     'apps.chatbot',
     'apps.caixa',
+    'apps.relatorios',
 ]
 
 INSTALLED_APPS = list(SHARED_APPS) + [app for app in TENANT_APPS if app not in SHARED_APPS]
@@ -103,8 +105,29 @@ DATABASES = {
     )
 }
 
+# Banco opcional para relatórios (réplica de leitura do default)
+REPORTING_DATABASE_URL = config('REPORTING_DATABASE_URL', default='')
+if REPORTING_DATABASE_URL:
+    DATABASES['reporting'] = dj_database_url.parse(
+        REPORTING_DATABASE_URL,
+        engine=DATABASES['default']['ENGINE'],
+        conn_max_age=600,
+        conn_health_checks=True,
+    )
+    DATABASES['reporting']['TEST'] = {'MIRROR': 'default'}
+
+# Segunda conexão ao default, em autocommit, só para reservar números de
+# documentos fora da transação de quem grava (ver apps.core.sequencias).
+# Abre uma conexão a mais por worker/thread (conn_max_age): some ao
+# max_connections do PostgreSQL / pool do PgBouncer antes de ligar.
+# Testes que usam a reserva devem declarar databases = {'default', 'sequencias'}.
+SEQUENCIAS_CONEXAO_DEDICADA = config('SEQUENCIAS_CONEXAO_DEDICADA', default=False, cast=bool)
+if SEQUENCIAS_CONEXAO_DEDICADA:
+    DATABASES['sequencias'] = dict(DATABASES['default'])
+
 # Django Tenants Configuration
 DATABASE_ROUTERS = (
+    'apps.core.routers.ReportingRouter',
     'django_tenants.routers.TenantSyncRouter',
 )
 
@@ -186,6 +209,24 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'relatorios-limpar-expirados': {
+        'task': 'apps.relatorios.tasks.limpar_relatorios_expirados',
+        'schedule': 60 * 60,
+    },
+    'estoque-saldos-diarios': {
+        'task': 'apps.estoque.tasks.gerar_saldos_diarios',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'estoque-atualizar-custos': {
+        'task': 'apps.estoque.tasks.atualizar_custos_estoque',
+        'schedule': 5 * 60,
+    },
+    'compras-reposicao': {
+        'task': 'apps.compras.tasks.gerar_pedidos_reposicao_tenants',
+        'schedule': crontab(hour=1, minute=0),
+    },
+}
 
 # Cache Configuration
 CACHES = {
@@ -195,6 +236,26 @@ CACHES = {
     }
 }
 
+# Tempo máximo (segundos) de relatórios no cache; alterações invalidam antes
+RELATORIOS_CACHE_TIMEOUT = config('RELATORIOS_CACHE_TIMEOUT', default=900, cast=int)
+
+# Segundos após uma invalidação em que os relatórios são recalculados no
+# primário (atraso máximo esperado da réplica `reporting`)
+RELATORIOS_REPLICA_ATRASO = config('RELATORIOS_REPLICA_ATRASO', default=30, cast=int)
+
+# Valoração do estoque: 'media' (custo médio ponderado) ou 'peps'
+ESTOQUE_METODO_CUSTO = config('ESTOQUE_METODO_CUSTO', default='media')
+
+# Carregar o catálogo do PDV na subida de cada worker (config/wsgi.py)
+PDV_CATALOGO_AQUECER = config('PDV_CATALOGO_AQUECER', default=True, cast=bool)
+
+# Usuário dos pedidos de reposição gerados pela task (padrão: primeiro superusuário)
+COMPRAS_REPOSICAO_COMPRADOR = config('COMPRAS_REPOSICAO_COMPRADOR', default='')
+
+# Jobs de relatórios: validade dos arquivos gerados e tempo máximo de um job
+RELATORIOS_JOB_EXPIRACAO_HORAS = config('RELATORIOS_JOB_EXPIRACAO_HORAS', default=24, cast=int)
+RELATORIOS_JOB_TEMPO_MAXIMO_MINUTOS = config('RELATORIOS_JOB_TEMPO_MAXIMO_MINUTOS', default=60, cast=int)
+
 # API Documentation (drf-spectacular)
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Sistema OS API',
@@ -15,13 +15,25 @@ DATABASES = {
     }
 }
 
+# Banco de relatórios opcional (ex.: REPORTING_DATABASE_URL=sqlite:///db_reporting.sqlite3)
+if REPORTING_DATABASE_URL:
+    DATABASES['reporting'] = dj_database_url.parse(REPORTING_DATABASE_URL)
+    DATABASES['reporting']['TEST'] = {'MIRROR': 'default'}
+
 # Desabilitar multi-tenancy para desenvolvimento local
 # (Será habilitado na VPS com PostgreSQL)
 INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'django_tenants']
 MIDDLEWARE = [m for m in MIDDLEWARE if 'django_tenants' not in m]
 
-# Database Router - remover
-DATABASE_ROUTERS = []
+# Database Router - sem TenantSyncRouter
+DATABASE_ROUTERS = ['apps.core.routers.ReportingRouter']
+
+# Cache em memória (sem necessidade de Redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
 
 # Desabilitar Celery para desenvolvimento local
 CELERY_TASK_ALWAYS_EAGER = True
@@ -3,8 +3,14 @@ WSGI config for Sistema OS project.
 """
 
 import os
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.development')
 
 application = get_wsgi_application()
+
+# Cada worker sobe com o catálogo do PDV já carregado
+if getattr(settings, 'PDV_CATALOGO_AQUECER', False):
+    from apps.vendas.catalogo import aquecer_catalogos
+    aquecer_catalogos()